@@ -0,0 +1,116 @@
+import json
+import platform
+import statistics
+import time
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.database.fu_db import get_db
+from src.models.models import Base
+
+RESULTS_DIR = Path(__file__).parent / "results"
+DEFAULT_DB_URL = "sqlite+aiosqlite:///./benchmark.db"
+PASSWORD = "benchmark-password"
+
+
+def user_email(number: int) -> str:
+    """
+    The email of the ``number``-th seeded user, they all share :data:`PASSWORD`.
+    """
+    return f"user{number}@bench.io"
+
+
+def percentiles(samples: list[float]) -> dict:
+    """
+    Summarizes latency samples given in seconds.
+
+    :param samples: The measured latencies.
+    :type samples: list[float]
+
+    :return: Count, mean and p50/p90/p99/max in milliseconds.
+    :rtype: dict
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def save_results(name: str, results: dict) -> Path:
+    """
+    Writes a benchmark run to ``benchmarks/results/<name>-<timestamp>.json``.
+
+    :param name: The benchmark name.
+    :type name: str
+    :param results: The measurements, must be JSON serializable.
+    :type results: dict
+
+    :return: The path of the written file.
+    :rtype: Path
+    """
+    RESULTS_DIR.mkdir(exist_ok=True)
+    path = RESULTS_DIR / f"{name}-{datetime.now():%Y%m%dT%H%M%S}.json"
+    document = {
+        "benchmark": name,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    path.write_text(json.dumps(document, indent=2, default=str))
+    return path
+
+
+async def use_database(app, url: str = DEFAULT_DB_URL, reset: bool = True) -> async_sessionmaker:
+    """
+    Points ``get_db`` of the app at a benchmark database, optionally recreating its tables.
+
+    :param app: The FastAPI application.
+    :type app: FastAPI
+    :param url: The database URL.
+    :type url: str
+    :param reset: Drop and create all tables first.
+    :type reset: bool
+
+    :return: The session factory bound to the benchmark database.
+    :rtype: async_sessionmaker
+    """
+    engine = create_async_engine(url)
+    if reset:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_db():
+        async with session_maker() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    return session_maker
+
+
+class Timer:
+    """
+    Context manager measuring wall time in seconds.
+    """
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
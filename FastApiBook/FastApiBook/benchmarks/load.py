@@ -0,0 +1,131 @@
+"""
+Load driver replaying a mix of login, list, search, create and update requests against ``main.app``.
+
+    python -m benchmarks.seed --users 1000 --contacts 100
+    python -m benchmarks.load --users 50 --duration 30
+
+Each virtual user logs in as a seeded user and then sends requests back to back, picking the next
+operation by weight. Requests go through ``httpx.ASGITransport``, so the numbers include the whole
+application stack but no network or HTTP server.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+import httpx
+
+from benchmarks.common import DEFAULT_DB_URL, PASSWORD, percentiles, save_results, use_database, user_email
+from main import app
+from src.services.rate_limiter import Budget, rate_limiter
+
+MIX = {"list": 45, "search": 20, "create": 15, "update": 15, "login": 5}
+SEARCH_TERMS = ("an", "ko", "shev", "ol", "mar", "enko")
+
+
+class VirtualUser:
+
+    def __init__(self, client: httpx.AsyncClient, number: int, rng: random.Random):
+        self.client = client
+        self.email = user_email(number)
+        self.rng = rng
+        self.headers = {}
+        self.contact_ids = []
+
+    async def login(self) -> httpx.Response:
+        response = await self.client.post("/auth/jwt/login", data={"username": self.email, "password": PASSWORD})
+        if response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return response
+
+    async def list(self) -> httpx.Response:
+        params = {"limit": 50}
+        if self.rng.random() < 0.3:
+            params["sort"] = "surname"
+        response = await self.client.get("/api/address_book/", params=params, headers=self.headers)
+        if response.status_code == 200:
+            self.contact_ids = [contact["id"] for contact in response.json()]
+        return response
+
+    async def search(self) -> httpx.Response:
+        return await self.client.get("/api/address_book/search", params={"q": self.rng.choice(SEARCH_TERMS)},
+                                     headers=self.headers)
+
+    async def create(self) -> httpx.Response:
+        number = self.rng.randrange(10 ** 6)
+        body = {"name": "Load", "surname": f"Tester{number}", "email": f"load{number}@example.com",
+                "number": f"+380{number:09d}", "description": "Created by the load driver",
+                "birthday": (date(1980, 1, 1) + timedelta(days=self.rng.randrange(10000))).isoformat()}
+        return await self.client.post("/api/address_book/", json=body, headers=self.headers)
+
+    async def update(self) -> httpx.Response:
+        if not self.contact_ids:
+            return await self.list()
+        return await self.client.patch(f"/api/address_book/{self.rng.choice(self.contact_ids)}",
+                                       json={"description": f"Updated {self.rng.randrange(10 ** 6)}"},
+                                       headers=self.headers)
+
+
+async def run(db_url: str, users: int, duration: float, seeded_users: int) -> dict:
+    await use_database(app, db_url, reset=False)
+    rng = random.Random(11)
+    operations, weights = zip(*MIX.items())
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+
+        async def record(operation: str, request):
+            started = time.perf_counter()
+            response = await request()
+            latencies[operation].append(time.perf_counter() - started)
+            statuses[operation][response.status_code] += 1
+
+        async def virtual_user(number: int):
+            user = VirtualUser(client, number, random.Random(rng.random()))
+            await record("login", user.login)
+            await record("list", user.list)
+            while time.perf_counter() < deadline:
+                operation = user.rng.choices(operations, weights)[0]
+                await record(operation, getattr(user, operation))
+
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(virtual_user(rng.randrange(seeded_users)) for _ in range(users)))
+        elapsed = time.perf_counter() - started
+    total = sum(len(samples) for samples in latencies.values())
+    return {
+        "db_url": db_url.split("@")[-1],
+        "virtual_users": users,
+        "seconds": round(elapsed, 3),
+        "requests": total,
+        "requests_per_second": round(total / elapsed, 1),
+        "operations": {
+            operation: {**percentiles(latencies[operation]),
+                        "statuses": {str(code): count for code, count in sorted(statuses[operation].items())}}
+            for operation in MIX
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-url", default=DEFAULT_DB_URL)
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="seconds")
+    parser.add_argument("--seeded-users", type=int, default=1000, help="users created by benchmarks.seed")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the configured rate limits")
+    args = parser.parse_args()
+    if not args.rate_limit:
+        rate_limiter.budgets = {name: Budget(10 ** 9, 1) for name in rate_limiter.budgets}
+    results = asyncio.run(run(args.db_url, args.users, args.duration, args.seeded_users))
+    print(f"{results['requests']} requests in {results['seconds']} s, {results['requests_per_second']} req/s")
+    for operation, summary in results["operations"].items():
+        print(f"{operation:>8}: p50 {summary.get('p50_ms')} ms, p99 {summary.get('p99_ms')} ms, {summary['statuses']}")
+    print(f"saved to {save_results('load', results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Latency of an unrelated endpoint while a storm of logins hashes passwords.
+
+    python -m benchmarks.login_storm --executor inline thread process --logins 20
+
+Each run fires ``--logins`` concurrent logins at ``/auth/jwt/login`` and, while they are in flight,
+probes ``/api/healthchecker`` back to back. With the ``inline`` executor bcrypt runs on the event
+loop and the probe p99 grows to the duration of the whole storm.
+"""
+import argparse
+import asyncio
+import uuid
+
+import httpx
+
+import src.services.auth
+from benchmarks.common import Timer, percentiles, save_results, use_database
+from main import app
+from src.models.models import User
+from src.services.passwords import PasswordHasher
+
+EMAIL = "storm@bench.io"
+PASSWORD = "12345678"
+
+
+async def run(executor: str, logins: int, workers: int) -> dict:
+    hasher = PasswordHasher(executor, workers=workers, concurrency=workers * 2)
+    src.services.auth.password_hasher = hasher
+    session_maker = await use_database(app, "sqlite+aiosqlite:///./login_storm.db")
+    async with session_maker() as session:
+        session.add(User(id=uuid.uuid4(), email=EMAIL, username="storm", avatar="",
+                         hashed_password=await hasher.hash(PASSWORD), is_active=True, is_verified=True,
+                         is_superuser=False))
+        await session.commit()
+
+    probe_latencies, login_latencies = [], []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def login():
+            with Timer() as timer:
+                response = await client.post("/auth/jwt/login", data={"username": EMAIL, "password": PASSWORD})
+            response.raise_for_status()
+            login_latencies.append(timer.elapsed)
+
+        with Timer() as total:
+            storm = asyncio.gather(*(login() for _ in range(logins)))
+            while not storm.done():
+                with Timer() as timer:
+                    await client.get("/api/healthchecker")
+                probe_latencies.append(timer.elapsed)
+                await asyncio.sleep(0.005)
+            await storm
+    hasher.shutdown()
+    return {
+        "executor": executor,
+        "logins": logins,
+        "workers": workers,
+        "storm_seconds": round(total.elapsed, 3),
+        "probe": percentiles(probe_latencies),
+        "login": percentiles(login_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--executor", nargs="+", default=["inline", "thread", "process"],
+                        choices=["inline", "thread", "process"])
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    results = [asyncio.run(run(executor, args.logins, args.workers)) for executor in args.executor]
+    for result in results:
+        print(f"{result['executor']:>8}: probe p50 {result['probe']['p50_ms']} ms, "
+              f"p99 {result['probe']['p99_ms']} ms over {result['probe']['count']} probes, "
+              f"storm {result['storm_seconds']} s")
+    print(f"saved to {save_results('login_storm', {'runs': results})}")
+
+
+if __name__ == "__main__":
+    main()
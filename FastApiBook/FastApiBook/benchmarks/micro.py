@@ -0,0 +1,145 @@
+"""
+Microbenchmarks of the repository functions and the pydantic schemas against a seeded database.
+
+    python -m benchmarks.seed --users 1000 --contacts 100
+    python -m benchmarks.micro --iterations 200
+
+Every repository call runs for a random seeded user in a fresh session, like a request would.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from benchmarks.common import DEFAULT_DB_URL, percentiles, save_results
+from src.models.models import Contact, User
+from src.repository import address_book as repo_book
+from src.schemas.contact import ContactResponse
+from src.services.importer import validate_batch
+from src.services.serializers import CONTACT_COLUMNS, dump_rows
+
+# The pydantic path the list endpoints used before rows were serialized directly, kept as the baseline
+contacts_adapter = TypeAdapter(list[ContactResponse])
+
+
+async def measure(call, iterations: int, warmup: int = 5) -> dict:
+    for _ in range(warmup):
+        await call()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - started)
+    summary = percentiles(samples)
+    summary["ops_per_second"] = round(len(samples) / sum(samples), 1)
+    return summary
+
+
+async def _orm_page(db, user, page: int):
+    contacts = await repo_book.get_contacts(None, None, None, False, page, 0, db, user)
+    json.dumps(jsonable_encoder(contacts_adapter.validate_python(contacts, from_attributes=True)),
+               ensure_ascii=False, separators=(",", ":")).encode()
+
+
+async def _column_page(db, user, page: int):
+    dump_rows(await repo_book.get_contacts(None, None, None, False, page, 0, db, user, columns=CONTACT_COLUMNS))
+
+
+async def run(db_url: str, iterations: int, page: int, only: list[str] | None) -> dict:
+    engine = create_async_engine(db_url)
+    session_maker = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    rng = random.Random(7)
+    async with session_maker() as session:
+        users = (await session.scalars(select(User).limit(500))).all()
+        per_user = await session.scalar(select(func.count(Contact.id)).where(Contact.user_id == users[0].id))
+        contact_ids = (await session.scalars(select(Contact.id).where(Contact.user_id == users[0].id))).all()
+        page_rows = (await session.scalars(select(Contact).limit(page))).all()
+        column_rows = (await session.execute(select(*(getattr(Contact, column) for column in CONTACT_COLUMNS))
+                                             .limit(page))).all()
+    if not per_user:
+        raise SystemExit("The database is empty, run benchmarks.seed first")
+
+    def with_session(query):
+        async def call():
+            async with session_maker() as session:
+                await query(session, rng.choice(users))
+        return call
+
+    raw_rows = [{"name": row.name, "surname": row.surname, "email": row.email, "number": row.number,
+                 "birthday": row.birthday.isoformat(), "description": row.description} for row in page_rows]
+    models = contacts_adapter.validate_python(page_rows, from_attributes=True)
+
+    async def validate_orm_rows():
+        contacts_adapter.validate_python(page_rows, from_attributes=True)
+
+    async def dump_json():
+        contacts_adapter.dump_json(models)
+
+    async def validate_import_rows():
+        validate_batch(list(enumerate(raw_rows, 1)))
+
+    # What FastAPI does with response_model: validate, jsonable_encoder, then json.dumps in JSONResponse
+    async def serialize_response_model():
+        json.dumps(jsonable_encoder(contacts_adapter.validate_python(page_rows, from_attributes=True)),
+                   ensure_ascii=False, separators=(",", ":")).encode()
+
+    async def serialize_column_rows():
+        dump_rows(column_rows)
+
+    deep_offset = max(per_user - page, 0)
+    cases = {
+        "get_contacts_first_page": with_session(
+            lambda db, user: repo_book.get_contacts(None, None, None, False, page, 0, db, user)),
+        "get_contacts_deep_offset": with_session(
+            lambda db, user: repo_book.get_contacts(None, None, None, False, page, deep_offset, db, user)),
+        "get_contacts_cursor": with_session(
+            lambda db, user: repo_book.get_contacts(None, None, None, False, page, 0, db, user, sort="surname",
+                                                    after=("M", 0))),
+        "get_contacts_name_filter": with_session(
+            lambda db, user: repo_book.get_contacts("an", None, None, False, page, 0, db, user)),
+        "get_contacts_birthdays_7d": with_session(
+            lambda db, user: repo_book.get_contacts(None, None, None, True, page, 0, db, user)),
+        "get_upcoming_birthdays_30d": with_session(
+            lambda db, user: repo_book.get_upcoming_birthdays(30, page, db, user)),
+        "search_contacts": with_session(lambda db, user: repo_book.search_contacts("shev", 20, db, user)),
+        "get_contact": with_session(lambda db, user: repo_book.get_contact(rng.choice(contact_ids), db, user)),
+        f"pydantic_validate_{page}_orm_rows": validate_orm_rows,
+        f"pydantic_dump_json_{page}_rows": dump_json,
+        f"pydantic_validate_{page}_import_rows": validate_import_rows,
+        f"serialize_{page}_response_model": serialize_response_model,
+        f"serialize_{page}_column_rows": serialize_column_rows,
+        "get_contacts_orm_page_response_model": with_session(lambda db, user: _orm_page(db, user, page)),
+        "get_contacts_column_page_dump_rows": with_session(lambda db, user: _column_page(db, user, page)),
+    }
+    results = {}
+    for name, call in cases.items():
+        if only and not any(part in name for part in only):
+            continue
+        results[name] = await measure(call, iterations)
+        print(f"{name:>40}: p50 {results[name]['p50_ms']} ms, p99 {results[name]['p99_ms']} ms, "
+              f"{results[name]['ops_per_second']} ops/s")
+    await engine.dispose()
+    return {"db": engine.dialect.name, "contacts_per_user": per_user, "page": page, "iterations": iterations,
+            "cases": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-url", default=DEFAULT_DB_URL)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--page", type=int, default=500, help="page size of list queries and schema batches")
+    parser.add_argument("--only", nargs="*", help="run the cases whose name contains one of these")
+    args = parser.parse_args()
+    results = asyncio.run(run(args.db_url, args.iterations, args.page, args.only))
+    print(f"saved to {save_results('micro', results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Fills a database with users and contacts for the benchmarks.
+
+    python -m benchmarks.seed --users 10000 --contacts 100 --db-url postgresql+asyncpg://...
+
+PostgreSQL is written with binary COPY, other databases with chunked executemany INSERTs. Data is
+generated lazily chunk by chunk, so memory stays flat at any size. All users share one bcrypt hash
+of ``benchmarks.common.PASSWORD``; ``user<n>@bench.io`` logs in as the n-th user.
+"""
+import argparse
+import asyncio
+import random
+import uuid
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Iterable, Iterator
+
+from fastapi_users.password import PasswordHelper
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from benchmarks.common import DEFAULT_DB_URL, PASSWORD, Timer, user_email
+from src.models.models import Base, Contact, ContactSyncState, ContactTombstone, User, to_birthday_key
+
+NAMES = ("Anna", "Bohdan", "Daria", "Dmytro", "Iryna", "Ivan", "Kateryna", "Maksym", "Maria", "Mykola", "Natalia",
+         "Oleh", "Olena", "Oksana", "Pavlo", "Roman", "Serhii", "Sofia", "Taras", "Viktoria", "Yulia", "Yurii")
+SURNAMES = ("Bondarenko", "Boyko", "Kovalenko", "Kovalchuk", "Kravchenko", "Lysenko", "Melnyk", "Moroz",
+            "Oliinyk", "Petrenko", "Polishchuk", "Rudenko", "Savchenko", "Shevchenko", "Shevchuk", "Tkachenko",
+            "Tkachuk", "Marchenko", "Kravchuk", "Vasylenko")
+USER_COLUMNS = ("id", "email", "hashed_password", "is_active", "is_superuser", "is_verified", "username", "avatar",
+                "refresh_token", "created_at", "updated_at")
+CONTACT_COLUMNS = ("name", "surname", "email", "number", "birthday", "birthday_key", "description", "created_at",
+                   "updated_at", "user_id", "seq")
+SYNC_STATE_COLUMNS = ("user_id", "last_seq", "pruned_seq")
+FIRST_BIRTHDAY = date(1950, 1, 1)
+
+
+def user_rows(count: int, hashed_password: str, rng: random.Random, start: int = 0) -> Iterator[tuple]:
+    now = datetime.now()
+    for number in range(start, start + count):
+        yield (uuid.UUID(int=rng.getrandbits(128), version=4), user_email(number), hashed_password, True, False,
+               True, f"user{number}", "", None, now, now)
+
+
+def contact_rows(user_ids: Iterable[uuid.UUID], per_user: int, rng: random.Random) -> Iterator[tuple]:
+    now = datetime.now()
+    for user_id in user_ids:
+        for number in range(per_user):
+            name, surname = rng.choice(NAMES), rng.choice(SURNAMES)
+            birthday = FIRST_BIRTHDAY + timedelta(days=rng.randrange(60 * 365))
+            yield (name, surname, f"{name}.{surname}{number}@example.com".lower(),
+                   f"+380{rng.randrange(10 ** 9):09d}", birthday, to_birthday_key(birthday),
+                   f"Seeded contact {number}", now, now, user_id, number + 1)
+
+
+def chunks(rows: Iterable[tuple], size: int) -> Iterator[list[tuple]]:
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+async def write(engine: AsyncEngine, table, columns: tuple, rows: Iterable[tuple], chunk_size: int) -> int:
+    """
+    Writes rows in chunks, each chunk in its own transaction.
+
+    :return: The number of written rows.
+    :rtype: int
+    """
+    written = 0
+    for chunk in chunks(rows, chunk_size):
+        async with engine.begin() as conn:
+            if engine.dialect.name == "postgresql":
+                raw_connection = await conn.get_raw_connection()
+                await raw_connection.driver_connection.copy_records_to_table(table.name, records=chunk,
+                                                                             columns=columns)
+            else:
+                await conn.execute(insert(table), [dict(zip(columns, row)) for row in chunk])
+        written += len(chunk)
+    return written
+
+
+async def seed(db_url: str, users: int, contacts: int, reset: bool = True, chunk_size: int = 10_000,
+               random_seed: int = 42) -> dict:
+    """
+    Seeds ``users`` users with ``contacts`` contacts each.
+
+    :param db_url: The database URL.
+    :type db_url: str
+    :param users: Number of users.
+    :type users: int
+    :param contacts: Number of contacts per user.
+    :type contacts: int
+    :param reset: Recreate the tables on SQLite, empty them on other databases (they are managed by Alembic).
+                  Otherwise the new users are numbered after the existing ones.
+    :type reset: bool
+    :param chunk_size: Rows per transaction.
+    :type chunk_size: int
+    :param random_seed: Seed of the generator, equal seeds give equal data.
+    :type random_seed: int
+
+    :return: Row counts and timings.
+    :rtype: dict
+    """
+    engine = create_async_engine(db_url)
+    start = 0
+    async with engine.begin() as conn:
+        if not reset:
+            start = await conn.scalar(select(func.count()).select_from(User))
+        elif engine.dialect.name == "sqlite":
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+        else:
+            for table in (ContactTombstone, ContactSyncState, Contact, User):
+                await conn.execute(delete(table))
+    # Appended users get their own stream, the same seed would repeat the ids of the existing ones
+    rng = random.Random(f"{random_seed}:{start}" if start else random_seed)
+    hashed_password = PasswordHelper().hash(PASSWORD)
+    user_ids = []
+
+    def remember(rows):
+        for row in rows:
+            user_ids.append(row[0])
+            yield row
+
+    with Timer() as users_timer:
+        user_count = await write(engine, User.__table__, USER_COLUMNS,
+                                 remember(user_rows(users, hashed_password, rng, start)), chunk_size)
+    with Timer() as contacts_timer:
+        contact_count = await write(engine, Contact.__table__, CONTACT_COLUMNS, contact_rows(user_ids, contacts, rng),
+                                    chunk_size)
+        # The change sequences continue after the seeded contacts
+        await write(engine, ContactSyncState.__table__, SYNC_STATE_COLUMNS,
+                    ((user_id, contacts, 0) for user_id in user_ids if contacts), chunk_size)
+    if engine.dialect.name == "postgresql":
+        async with engine.connect() as conn:
+            await conn.exec_driver_sql("ANALYZE contacts")
+            await conn.exec_driver_sql('ANALYZE "user"')
+    await engine.dispose()
+    return {
+        "users": user_count,
+        "contacts": contact_count,
+        "users_seconds": round(users_timer.elapsed, 3),
+        "contacts_seconds": round(contacts_timer.elapsed, 3),
+        "contacts_per_second": round(contact_count / contacts_timer.elapsed) if contact_count else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-url", default=DEFAULT_DB_URL)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--contacts", type=int, default=100, help="contacts per user")
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="append instead of resetting the tables")
+    args = parser.parse_args()
+    result = asyncio.run(seed(args.db_url, args.users, args.contacts, not args.keep, args.chunk_size, args.seed))
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,60 @@
-from fastapi import FastAPI, Depends, HTTPException
-from fastapi_limiter import FastAPILimiter
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Depends, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
-from redis.asyncio import Redis
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.conf.config import config
+from src.database.db import sessionmanager
 from src.database.fu_db import get_db
-from src.routes import address_book, auth, users
+from src.database.redis import redis_manager
+from src.routes import address_book, auth, profiler, users
+from src.services.cache import contact_cache
+from src.services.instrumentation import SQLInstrumentationMiddleware, instrument_engine
+from src.services.jobs import job_queue
+from src.services.mailer import mailer
+from src.services.metrics import MetricsMiddleware, StateCollector, registry
+from src.services.passwords import password_hasher
+from src.services.profiler import ProfilerMiddleware, background_profiler
+from src.services.rate_limiter import rate_limiter
+from src.services.user_cache import user_cache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warms the database pool, opens the shared Redis pool, hands it to every Redis consumer, compiles the
+    email templates for jobs that run in process and releases everything on shutdown.
+
+    :param app: The application.
+    :type app: FastAPI
+    """
+    if config.DB_POOL_WARMUP:
+        await sessionmanager.warmup()
+    redis = await redis_manager.open()
+    redis_consumers = (rate_limiter, contact_cache, user_cache, job_queue, sessionmanager)
+    for consumer in redis_consumers:
+        consumer.bind(redis)
+    rate_limiter.start()
+    mailer.renderer.compile()
+    if config.PROFILER_BACKGROUND:
+        background_profiler.start()
+    yield
+    await background_profiler.stop()
+    await rate_limiter.stop()
+    await mailer.close()
+    for consumer in redis_consumers:
+        consumer.bind(None)
+    await redis_manager.close()
+    await sessionmanager.dispose()
+    password_hasher.shutdown()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ["*"]
 
@@ -21,25 +64,43 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing", "ETag"],
 )
 
+if config.SQL_INSTRUMENTATION:
+    for engine in sessionmanager.engines:
+        instrument_engine(engine, config.SQL_SLOW_QUERY_MS)
+    app.add_middleware(SQLInstrumentationMiddleware)
+
+app.add_middleware(ProfilerMiddleware, directory=config.PROFILER_DIR, interval=config.PROFILER_INTERVAL,
+                   max_profiles=config.PROFILER_MAX_PROFILES, max_age=config.PROFILER_MAX_AGE)
+app.add_middleware(MetricsMiddleware)
+registry.register(StateCollector(sessionmanager, {"contacts": contact_cache, "users": user_cache}, rate_limiter,
+                                 job_queue))
+
 BASE_DIR = Path(__file__).parent
 app.mount("/static", StaticFiles(directory=BASE_DIR / "src" / "static"), name="static")
 
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Exposes the application metrics in the Prometheus text format.
+
+    Registered before the routers, otherwise ``/{username}`` of the auth router would match it.
+    The job queue sizes are read from Redis first, collectors cannot wait for it.
+
+    :return: The current metrics.
+    :rtype: Response
+    """
+    await job_queue.refresh_sizes()
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(address_book.router, prefix="/api")
-
-
-@app.on_event("startup")
-async def startup():
-    r = await Redis(
-        host=config.REDIS_DOMAIN,
-        port=config.REDIS_PORT,
-        db=0,
-        password=config.REDIS_PASSWORD,
-    )
-    await FastAPILimiter.init(r)
+app.include_router(profiler.router, prefix="/api")
 
 
 @app.get("/api/healthchecker")
@@ -0,0 +1,29 @@
+"""contacts trigram search
+
+Revision ID: 5b8d2f19c6e4
+Revises: a3c1e7f42b90
+Create Date: 2026-10-16 11:02:47.915306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8d2f19c6e4'
+down_revision: Union[str, None] = 'a3c1e7f42b90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in ('name', 'surname', 'email'):
+        op.create_index(f'ix_contacts_{column}_trgm', 'contacts', [column], unique=False,
+                        postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    for column in ('email', 'surname', 'name'):
+        op.drop_index(f'ix_contacts_{column}_trgm', table_name='contacts')
@@ -0,0 +1,27 @@
+"""contacts keyset indexes
+
+Revision ID: a3c1e7f42b90
+Revises: 4dccf5d700eb
+Create Date: 2026-10-16 10:12:31.481220
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c1e7f42b90'
+down_revision: Union[str, None] = '4dccf5d700eb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_contacts_user_id_id', 'contacts', ['user_id', 'id'], unique=False)
+    op.create_index('ix_contacts_user_id_surname_id', 'contacts', ['user_id', 'surname', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_surname_id', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_id', table_name='contacts')
@@ -0,0 +1,33 @@
+"""contacts birthday key
+
+Revision ID: c74e0a5d1f38
+Revises: 5b8d2f19c6e4
+Create Date: 2026-10-16 12:20:05.337412
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c74e0a5d1f38'
+down_revision: Union[str, None] = '5b8d2f19c6e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('birthday_key', sa.SmallInteger(), nullable=True))
+    op.execute(
+        'UPDATE contacts SET birthday_key = '
+        'CAST(EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday) AS SMALLINT)'
+    )
+    op.alter_column('contacts', 'birthday_key', nullable=False)
+    op.create_index('ix_contacts_user_id_birthday_key', 'contacts', ['user_id', 'birthday_key'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_birthday_key', table_name='contacts')
+    op.drop_column('contacts', 'birthday_key')
@@ -0,0 +1,59 @@
+"""contacts delta sync
+
+Revision ID: e2a94b7c3d15
+Revises: c74e0a5d1f38
+Create Date: 2026-10-17 10:42:18.904127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import fastapi_users_db_sqlalchemy
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2a94b7c3d15'
+down_revision: Union[str, None] = 'c74e0a5d1f38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('UPDATE contacts SET updated_at = COALESCE(created_at, now()) WHERE updated_at IS NULL')
+    op.create_table('contact_sync_state',
+    sa.Column('user_id', fastapi_users_db_sqlalchemy.generics.GUID(), nullable=False),
+    sa.Column('last_seq', sa.BigInteger(), nullable=False),
+    sa.Column('pruned_seq', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # Existing contacts are numbered per user in the order they last changed
+    op.add_column('contacts', sa.Column('seq', sa.BigInteger(), server_default='0', nullable=False))
+    op.execute('UPDATE contacts SET seq = numbered.seq FROM ('
+               'SELECT id, row_number() OVER (PARTITION BY user_id ORDER BY updated_at, id) AS seq FROM contacts'
+               ') AS numbered WHERE contacts.id = numbered.id')
+    op.execute('INSERT INTO contact_sync_state (user_id, last_seq, pruned_seq) '
+               'SELECT user_id, max(seq), 0 FROM contacts WHERE user_id IS NOT NULL GROUP BY user_id')
+    op.alter_column('contacts', 'seq', server_default=None)
+    op.create_index('ix_contacts_user_id_seq', 'contacts', ['user_id', 'seq'], unique=False)
+    op.create_table('contact_tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('contact_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', fastapi_users_db_sqlalchemy.generics.GUID(), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(), nullable=False),
+    sa.Column('seq', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_contact_tombstones_user_id_seq', 'contact_tombstones', ['user_id', 'seq'], unique=False)
+    op.create_index('ix_contact_tombstones_deleted_at', 'contact_tombstones', ['deleted_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contact_tombstones_deleted_at', table_name='contact_tombstones')
+    op.drop_index('ix_contact_tombstones_user_id_seq', table_name='contact_tombstones')
+    op.drop_table('contact_tombstones')
+    op.drop_index('ix_contacts_user_id_seq', table_name='contacts')
+    op.drop_column('contacts', 'seq')
+    op.drop_table('contact_sync_state')
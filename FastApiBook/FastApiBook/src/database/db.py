@@ -1,15 +1,194 @@
+import asyncio
 import contextlib
+import itertools
+import time
+import uuid
 
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 
 from src.conf.config import config
 
 
+def engine_options(url: str) -> dict:
+    """
+    Builds the engine and pool arguments for ``url`` from the ``DB_*`` settings.
+
+    Pool settings are left out for SQLite, which uses its own pool classes. For asyncpg the statement
+    caches are passed as connect arguments. A ``DB_STATEMENT_CACHE_SIZE`` of 0 is meant for PgBouncer
+    in transaction mode, so prepared statements then also get unique names.
+
+    :param url: The database URL.
+    :type url: str
+
+    :return: Keyword arguments for ``create_async_engine``.
+    :rtype: dict
+    """
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        return {}
+    options = dict(
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_pre_ping=config.DB_POOL_PRE_PING,
+    )
+    if url.get_driver_name() == "asyncpg":
+        connect_args = {
+            "statement_cache_size": config.DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": config.DB_PREPARED_STATEMENT_CACHE_SIZE,
+        }
+        if config.DB_STATEMENT_CACHE_SIZE == 0:
+            connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid.uuid4()}__"
+        options["connect_args"] = connect_args
+    return options
+
+
 class DatabaseSessionManager:
-    def __init__(self, url: str):
-        self._engine: AsyncEngine | None = create_async_engine(url)
+    """
+    Holds the primary engine and optional read replica engines.
+
+    Reads of a user go to the primary for ``write_window`` seconds after their last write, so they see
+    their own changes despite replication lag. The window is kept in Redis, so it holds across processes,
+    and in process memory while no Redis is bound. If Redis fails, reads go to the primary. A replica
+    that fails to connect is skipped for ``replica_retry_after`` seconds.
+
+    :param url: The primary database URL.
+    :type url: str
+    :param replica_urls: The replica database URLs.
+    :type replica_urls: list[str], optional
+    :param write_window: Seconds to read from the primary after a write.
+    :type write_window: float
+    :param replica_retry_after: Seconds to skip a failed replica.
+    :type replica_retry_after: float
+    :param engine_options: Keyword arguments for ``create_async_engine``, used for all engines.
+    """
+
+    def __init__(self, url: str, replica_urls: list[str] = (), write_window: float = 5.0,
+                 replica_retry_after: float = 30.0, **engine_options):
+        self._engine: AsyncEngine | None = create_async_engine(url, **engine_options)
         self._session_maker: async_sessionmaker = async_sessionmaker(autoflush=False, autocommit=False,
-                                                                     bind=self._engine)
+                                                                     expire_on_commit=False, bind=self._engine)
+        self._replicas: list[AsyncEngine] = [create_async_engine(replica_url, **engine_options)
+                                             for replica_url in replica_urls]
+        self._replica_session_makers = [async_sessionmaker(autoflush=False, autocommit=False, expire_on_commit=False,
+                                                           bind=replica) for replica in self._replicas]
+        self._replica_down_until = [0.0] * len(self._replicas)
+        self._next_replica = itertools.count()
+        self.write_window = write_window
+        self.replica_retry_after = replica_retry_after
+        self.redis: Redis | None = None
+        self._recent_writes: dict = {}
+
+    def bind(self, redis: Redis | None):
+        """
+        Switches to another Redis client, None tracks the write window per process.
+
+        :param redis: The client, usually sharing the application pool.
+        :type redis: Redis or None
+        """
+        self.redis = redis
+
+    @staticmethod
+    def _write_key(user_id) -> str:
+        return f"contacts:wrote:{user_id}"
+
+    @property
+    def engines(self) -> list[AsyncEngine]:
+        """
+        The primary engine followed by the replica engines.
+        """
+        return [self._engine, *self._replicas]
+
+    async def mark_write(self, user_id):
+        """
+        Sends the reads of a user to the primary for the next ``write_window`` seconds. Call it before
+        the cache is invalidated, see :meth:`wrote_recently`.
+
+        :param user_id: The user who wrote.
+        :type user_id: UUID
+        """
+        if not self._replicas:
+            return
+        now = time.monotonic()
+        if len(self._recent_writes) > 10000:
+            self._recent_writes = {key: until for key, until in self._recent_writes.items() if until > now}
+        self._recent_writes[user_id] = now + self.write_window
+        if self.redis is not None:
+            try:
+                await self.redis.set(self._write_key(user_id), 1, px=max(int(self.write_window * 1000), 1))
+            except (RedisError, OSError) as err:
+                print(err)
+
+    async def wrote_recently(self, user_id) -> bool:
+        """
+        Tells whether a user wrote within the last ``write_window`` seconds, in any process.
+
+        :param user_id: The user.
+        :type user_id: UUID
+
+        :return: True if the user wrote recently or Redis could not tell.
+        :rtype: bool
+        """
+        if not self._replicas:
+            return False
+        if self._recent_writes.get(user_id, 0.0) > time.monotonic():
+            return True
+        if self.redis is None:
+            return False
+        try:
+            return bool(await self.redis.exists(self._write_key(user_id)))
+        except (RedisError, OSError) as err:
+            print(err)
+            return True
+
+    def _healthy_replicas(self) -> list[int]:
+        now = time.monotonic()
+        start = next(self._next_replica)
+        indexes = [(start + offset) % len(self._replicas) for offset in range(len(self._replicas))]
+        return [index for index in indexes if self._replica_down_until[index] <= now]
+
+    @contextlib.asynccontextmanager
+    async def replica_session(self, user_id=None):
+        """
+        Opens a session on the next healthy replica, round robin.
+
+        Yields None when the caller should read from the primary instead: there are no replicas, none
+        of them accepts a connection, or ``user_id`` wrote within the last ``write_window`` seconds.
+        Replica sessions are flagged with ``info["replica"]``.
+
+        :param user_id: The reading user.
+        :type user_id: UUID, optional
+        """
+        session = None
+        if self._replicas and not (user_id is not None and await self.wrote_recently(user_id)):
+            for index in self._healthy_replicas():
+                candidate = self._replica_session_makers[index]()
+                try:
+                    await candidate.connection()
+                except (DBAPIError, OSError) as err:
+                    print(err)
+                    self._replica_down_until[index] = time.monotonic() + self.replica_retry_after
+                    await candidate.close()
+                    continue
+                session = candidate
+                session.info["replica"] = True
+                break
+        if session is None:
+            yield None
+            return
+        try:
+            yield session
+        except Exception as err:
+            print(err)
+            await session.rollback()
+        finally:
+            await session.close()
 
     @contextlib.asynccontextmanager
     async def session(self):
@@ -24,5 +203,39 @@ class DatabaseSessionManager:
         finally:
             await session.close()
 
+    async def warmup(self, connections: int | None = None):
+        """
+        Opens pool connections up front so the first requests don't pay for connection setup.
+
+        Failures are printed, not raised: the application still starts and connects on demand.
+
+        :param connections: Number of connections to open, defaults to the pool size.
+        :type connections: int, optional
+        """
+        if connections is None:
+            size = getattr(self._engine.pool, "size", None)
+            connections = size() if callable(size) else 1
+
+        async def ping():
+            async with self._engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+
+        for result in await asyncio.gather(*(ping() for _ in range(connections)), return_exceptions=True):
+            if isinstance(result, Exception):
+                print(result)
+                break
+
+    async def dispose(self):
+        """
+        Closes all pooled connections of the primary and the replicas.
+        """
+        if self._engine is not None:
+            await self._engine.dispose()
+        for replica in self._replicas:
+            await replica.dispose()
+
 
-sessionmanager = DatabaseSessionManager(config.DB_URL)
+sessionmanager = DatabaseSessionManager(config.DB_URL, replica_urls=config.DB_REPLICA_URLS,
+                                        write_window=config.DB_REPLICA_WRITE_WINDOW,
+                                        replica_retry_after=config.DB_REPLICA_RETRY_AFTER,
+                                        **engine_options(config.DB_URL))
@@ -0,0 +1,52 @@
+from typing import AsyncGenerator, Awaitable, Callable
+
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.db import sessionmanager
+from src.database.fu_db import get_db
+from src.models.models import User
+from src.services.auth import current_active_user
+
+
+async def get_read_db(user: User = Depends(current_active_user),
+                      db: AsyncSession = Depends(get_db)) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Yields a session for read-only queries: a replica session, or the primary session of ``get_db``
+    when no replica is usable or the user has just written.
+
+    :param user: The current active user.
+    :type user: User
+    :param db: The primary session of the request.
+    :type db: AsyncSession
+
+    :return: The session to read from.
+    :rtype: AsyncGenerator[AsyncSession, None]
+    """
+    async with sessionmanager.replica_session(user.id) as session:
+        yield db if session is None else session
+
+
+def cacheable_read(db: AsyncSession, user_id) -> Callable[[], Awaitable[bool]] | None:
+    """
+    Guards the cache against replica reads that predate a write of the user.
+
+    A read may pick a replica just before the user writes and load after the write bumped the cache
+    generation, so a lagging replica would be cached as current. Writes are marked before the cache is
+    invalidated, hence checking the mark after loading catches this case.
+
+    :param db: The session from :func:`get_read_db`.
+    :type db: AsyncSession
+    :param user_id: The reading user.
+    :type user_id: UUID
+
+    :return: The ``cacheable`` check for :meth:`ContactCache.get_or_load_bytes`, None for the primary.
+    :rtype: Callable[[], Awaitable[bool]] or None
+    """
+    if not db.info.get("replica"):
+        return None
+
+    async def cacheable() -> bool:
+        return not await sessionmanager.wrote_recently(user_id)
+
+    return cacheable
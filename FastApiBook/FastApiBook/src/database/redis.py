@@ -0,0 +1,101 @@
+import time
+
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.exceptions import RedisError
+
+from src.conf.config import config
+from src.services.metrics import REDIS_LATENCY
+
+
+class InstrumentedRedis(Redis):
+    """
+    Redis client that records the latency of every command, scripts included, in ``redis_command_duration_seconds``.
+    """
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_LATENCY.labels(str(args[0]).upper()).observe(time.perf_counter() - started)
+
+
+class RedisManager:
+    """
+    Owns the one Redis connection pool of the application.
+
+    The pool is bounded: when all ``max_connections`` are busy, callers wait up to ``pool_timeout``
+    seconds and then get a ``ConnectionError``, which the caches and the rate limiter treat like
+    Redis being down. Idle connections are pinged every ``health_check_interval`` seconds before reuse.
+
+    :param host: The Redis host.
+    :type host: str
+    :param port: The Redis port.
+    :type port: int
+    :param password: The Redis password.
+    :type password: str or None
+    :param max_connections: Upper bound of open connections.
+    :type max_connections: int
+    :param pool_timeout: Seconds to wait for a free connection.
+    :type pool_timeout: float
+    :param socket_timeout: Seconds to wait for a reply.
+    :type socket_timeout: float
+    :param connect_timeout: Seconds to wait for a connection to open.
+    :type connect_timeout: float
+    :param health_check_interval: Seconds after which an idle connection is checked before use.
+    :type health_check_interval: int
+    """
+
+    def __init__(self, host: str, port: int, password: str | None = None, max_connections: int = 50,
+                 pool_timeout: float = 1.0, socket_timeout: float = 1.0, connect_timeout: float = 1.0,
+                 health_check_interval: int = 30):
+        self._pool_kwargs = dict(
+            host=host,
+            port=port,
+            db=0,
+            password=password,
+            max_connections=max_connections,
+            timeout=pool_timeout,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=connect_timeout,
+            health_check_interval=health_check_interval,
+        )
+        self._pool: BlockingConnectionPool | None = None
+        self.client: Redis | None = None
+
+    async def open(self) -> Redis:
+        """
+        Creates the pool and checks that Redis answers. An unreachable Redis is reported but does not fail startup.
+
+        :return: The client sharing the pool.
+        :rtype: Redis
+        """
+        if self.client is None:
+            self._pool = BlockingConnectionPool(**self._pool_kwargs)
+            self.client = InstrumentedRedis(connection_pool=self._pool)
+            try:
+                await self.client.ping()
+            except (RedisError, OSError) as err:
+                print(err)
+        return self.client
+
+    async def close(self):
+        """
+        Closes all connections of the pool.
+        """
+        if self._pool is not None:
+            await self._pool.disconnect()
+        self._pool = None
+        self.client = None
+
+
+redis_manager = RedisManager(
+    host=config.REDIS_DOMAIN,
+    port=config.REDIS_PORT,
+    password=config.REDIS_PASSWORD,
+    max_connections=config.REDIS_MAX_CONNECTIONS,
+    pool_timeout=config.REDIS_POOL_TIMEOUT,
+    socket_timeout=config.REDIS_SOCKET_TIMEOUT,
+    connect_timeout=config.REDIS_CONNECT_TIMEOUT,
+    health_check_interval=config.REDIS_HEALTH_CHECK_INTERVAL,
+)
@@ -1,6 +1,6 @@
 from datetime import date, datetime
 from fastapi_users_db_sqlalchemy import SQLAlchemyBaseUserTableUUID, generics
-from sqlalchemy import String, Date, DateTime, func, ForeignKey
+from sqlalchemy import String, Date, DateTime, SmallInteger, BigInteger, func, ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship, DeclarativeBase
 
 
@@ -8,20 +8,77 @@ class Base(DeclarativeBase):
     pass
 
 
+def to_birthday_key(value: date) -> int:
+    """
+    Converts a date to its ``MMDD`` integer, e.g. 25 December -> 1225.
+
+    :param value: The date to convert.
+    :type value: date
+
+    :return: The month and day packed into one sortable integer.
+    :rtype: int
+    """
+    return value.month * 100 + value.day
+
+
+def _default_birthday_key(context) -> int:
+    return to_birthday_key(context.get_current_parameters()['birthday'])
+
+
 class Contact(Base):
     __tablename__ = 'contacts'
+    __table_args__ = (
+        Index('ix_contacts_user_id_id', 'user_id', 'id'),
+        Index('ix_contacts_user_id_surname_id', 'user_id', 'surname', 'id'),
+        Index('ix_contacts_user_id_birthday_key', 'user_id', 'birthday_key'),
+        Index('ix_contacts_user_id_seq', 'user_id', 'seq'),
+        Index('ix_contacts_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        Index('ix_contacts_surname_trgm', 'surname', postgresql_using='gin',
+              postgresql_ops={'surname': 'gin_trgm_ops'}),
+        Index('ix_contacts_email_trgm', 'email', postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'}),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(50))
     surname: Mapped[str] = mapped_column(String(50))
     email: Mapped[str] = mapped_column(String(50))
     number: Mapped[str] = mapped_column(String(20))
     birthday: Mapped[date] = mapped_column(Date())
+    birthday_key: Mapped[int] = mapped_column(SmallInteger, default=_default_birthday_key)
     description: Mapped[str] = mapped_column(String(250))
     created_at: Mapped[datetime] = mapped_column('created_at', DateTime, default=func.now(), nullable=True)
     updated_at: Mapped[datetime] = mapped_column('updated_at', DateTime, default=func.now(), onupdate=func.now(),
                                                  nullable=True)
+    seq: Mapped[int] = mapped_column(BigInteger)
     user_id: Mapped[generics.GUID] = mapped_column(generics.GUID(), ForeignKey('user.id'), nullable=True)
-    user: Mapped["User"] = relationship("User", backref="contacts", lazy="joined")
+    user: Mapped["User"] = relationship("User", backref="contacts", lazy="raise")
+
+
+class ContactTombstone(Base):
+    """
+    Records a deleted contact, so delta syncs can report deletions. Old tombstones are pruned.
+    """
+    __tablename__ = 'contact_tombstones'
+    __table_args__ = (
+        Index('ix_contact_tombstones_user_id_seq', 'user_id', 'seq'),
+        Index('ix_contact_tombstones_deleted_at', 'deleted_at'),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    contact_id: Mapped[int] = mapped_column()
+    user_id: Mapped[generics.GUID] = mapped_column(generics.GUID(), ForeignKey('user.id'), nullable=True)
+    deleted_at: Mapped[datetime] = mapped_column('deleted_at', DateTime, default=func.now())
+    seq: Mapped[int] = mapped_column(BigInteger)
+
+
+class ContactSyncState(Base):
+    """
+    The change sequence of the contacts of a user. Every contact write takes the next position in its
+    transaction and keeps this row locked until it commits, so positions become visible in order.
+    ``pruned_seq`` is the position of the last pruned tombstone.
+    """
+    __tablename__ = 'contact_sync_state'
+    user_id: Mapped[generics.GUID] = mapped_column(generics.GUID(), ForeignKey('user.id'), primary_key=True)
+    last_seq: Mapped[int] = mapped_column(BigInteger, default=0)
+    pruned_seq: Mapped[int] = mapped_column(BigInteger, default=0)
 
 
 class User(SQLAlchemyBaseUserTableUUID, Base):
@@ -1,10 +1,104 @@
 import datetime
 
-from sqlalchemy import select, func
+from sqlalchemy import select, insert, update, delete, func, tuple_, or_, case, true, bindparam, DateTime
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 
-from src.models.models import Contact, User
-from src.schemas.contact import ContactSchema
+from src.models.models import Contact, ContactSyncState, ContactTombstone, User, to_birthday_key
+from src.schemas.contact import ContactSchema, ContactUpdateSchema
+from src.services.pagination import SORT_KEYS
+
+
+def _like_pattern(value: str) -> str:
+    """
+    Escapes LIKE wildcards in user input and wraps it for a substring match.
+
+    :param value: The raw search string.
+    :type value: str
+
+    :return: The ``%value%`` pattern, to be used with ``escape='\\'``.
+    :rtype: str
+    """
+    value = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{value}%'
+
+
+def _select(columns: tuple[str, ...] | None):
+    """
+    Selects whole contacts, or only the named columns when ``columns`` is given.
+    """
+    if columns:
+        return select(*(getattr(Contact, column) for column in columns))
+    return select(Contact)
+
+
+def _rows(result, columns: tuple[str, ...] | None) -> list:
+    return result.all() if columns else result.scalars().all()
+
+
+def _clock(db: AsyncSession):
+    """
+    The database time as stored by the ``func.now()`` column defaults, naive in the session time zone.
+    """
+    if db.get_bind().dialect.name == 'postgresql':
+        return func.localtimestamp()
+    return func.now()
+
+
+def _timestamp(value, db: AsyncSession):
+    """
+    Makes a timestamp column or value comparable. SQLite keeps timestamps as text, ``CURRENT_TIMESTAMP``
+    without and bound datetimes with fractional seconds, so both are normalized to whole seconds there.
+    """
+    if db.get_bind().dialect.name == 'sqlite':
+        return func.datetime(value, type_=DateTime)
+    return value
+
+
+async def _next_seq(db: AsyncSession, user: User, count: int = 1) -> int:
+    """
+    Takes the next ``count`` positions in the change sequence of a user and returns the last one.
+
+    The upsert locks the sequence row of the user until the transaction ends, so the writes of a user
+    commit in the order of their positions and a delta sync never sees a position before the ones
+    below it.
+    """
+    upsert = (postgresql if db.get_bind().dialect.name == 'postgresql' else sqlite).insert
+    stmt = (upsert(ContactSyncState)
+            .values(user_id=user.id, last_seq=count, pruned_seq=0)
+            .on_conflict_do_update(index_elements=[ContactSyncState.user_id],
+                                   set_={'last_seq': ContactSyncState.last_seq + count})
+            .returning(ContactSyncState.last_seq))
+    return await db.scalar(stmt)
+
+
+def _upcoming_birthdays(days: int, today: datetime.date | None = None):
+    """
+    Builds the filter and ordering for birthdays from today to ``days`` days from now.
+
+    Works on the indexed ``birthday_key`` column, so it is an index range scan. When the window
+    crosses the end of the year it is split into two ranges, ``[today, 1231]`` and ``[0101, end]``.
+
+    :param days: Days after today the window reaches, both ends included: ``[today, today + days]``
+                 covers ``days + 1`` calendar days.
+    :type days: int
+    :param today: The first day of the window. Defaults to the current date.
+    :type today: datetime.date or None
+
+    :return: The filter clause and the ``ORDER BY`` clauses (soonest birthday first).
+    :rtype: tuple
+    """
+    today = today or datetime.date.today()
+    start = to_birthday_key(today)
+    order_by = [case((Contact.birthday_key < start, 1), else_=0), Contact.birthday_key, Contact.id]
+    if days >= 365:
+        return true(), order_by
+    last_day = today + datetime.timedelta(days)
+    end = to_birthday_key(last_day)
+    if last_day.year == today.year:
+        return Contact.birthday_key.between(start, end), order_by
+    return or_(Contact.birthday_key >= start, Contact.birthday_key <= end), order_by
 
 
 async def create_contact(body: ContactSchema, db: AsyncSession, user: User):
@@ -21,15 +115,56 @@ async def create_contact(body: ContactSchema, db: AsyncSession, user: User):
     :return: The created contact object.
     :rtype: Contact
     """
-    contact = Contact(**body.model_dump(exclude_unset=True), user=user)
+    seq = await _next_seq(db, user)
+    contact = Contact(**body.model_dump(exclude_unset=True), user=user, seq=seq)
     db.add(contact)
     await db.commit()
     await db.refresh(contact)
     return contact
 
 
+async def bulk_create_contacts(contacts: list[ContactSchema], db: AsyncSession, user: User) -> int:
+    """
+    Inserts a batch of already validated contacts and commits them.
+
+    On PostgreSQL the rows are written with asyncpg's binary ``COPY``, other backends use one
+    multi-row ``INSERT ... VALUES``. ``COPY`` bypasses the column defaults, so they are computed here,
+    the timestamps from the database clock like the defaults do.
+
+    :param contacts: The contacts to insert.
+    :type contacts: list[ContactSchema]
+    :param db: The database session.
+    :type db: AsyncSession
+    :param user: The user the contacts belong to.
+    :type user: User
+
+    :return: The number of inserted contacts.
+    :rtype: int
+    """
+    if not contacts:
+        return 0
+    first = await _next_seq(db, user, len(contacts)) - len(contacts) + 1
+    columns = ('name', 'surname', 'email', 'number', 'birthday', 'birthday_key', 'description', 'user_id', 'seq')
+    records = [(contact.name, contact.surname, contact.email, contact.number, contact.birthday,
+                to_birthday_key(contact.birthday), contact.description, user.id, first + index)
+               for index, contact in enumerate(contacts)]
+    if db.get_bind().dialect.name == 'postgresql':
+        # ETags are built from these timestamps, they must never come from the application clock
+        now = await db.scalar(select(_clock(db)))
+        connection = await db.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            Contact.__tablename__, records=[record + (now, now) for record in records],
+            columns=columns + ('created_at', 'updated_at'))
+    else:
+        await db.execute(insert(Contact).values([dict(zip(columns, record)) for record in records]))
+    await db.commit()
+    return len(records)
+
+
 async def get_contacts(name: str | None, surname: str | None, email: str | None, birthdays: bool, limit: int,
-                       offset: int, db: AsyncSession, user: User):
+                       offset: int, db: AsyncSession, user: User, sort: str = "id", after: tuple | None = None,
+                       load_user: bool = False, columns: tuple[str, ...] | None = None):
     """
     Retrieves contacts based on the given search criteria.
 
@@ -49,27 +184,217 @@ async def get_contacts(name: str | None, surname: str | None, email: str | None,
     :type db: AsyncSession
     :param user: The user associated with the contacts.
     :type user: User
+    :param sort: The sort key, one of ``SORT_KEYS``. Ties are always broken by ``id``.
+    :type sort: str
+    :param after: Keyset values of the last contact of the previous page. When given, ``offset`` is ignored.
+    :type after: tuple or None
+    :param load_user: Also load ``Contact.user``. Off by default, the relationship raises on access.
+    :type load_user: bool
+    :param columns: Select only these columns and return rows instead of contacts.
+    :type columns: tuple[str, ...] or None
 
-    :return: A list of contacts that match the search criteria.
-    :rtype: List[Contact]
+    :return: A list of contacts, or rows when ``columns`` is given, that match the search criteria.
+    :rtype: List[Contact] or List[Row]
     """
-    stmt = select(Contact).filter_by(user=user).offset(offset).limit(limit)
+    order_by = [getattr(Contact, key) for key in SORT_KEYS[sort]]
+    stmt = _select(columns).filter(Contact.user_id == user.id).order_by(*order_by).limit(limit)
+    if after is not None:
+        stmt = stmt.filter(tuple_(*order_by) > tuple_(*after))
+    else:
+        stmt = stmt.offset(offset)
+    if load_user and not columns:
+        stmt = stmt.options(joinedload(Contact.user))
     if name:
-        stmt = stmt.filter(Contact.name.like(f'%{name}%'))
+        stmt = stmt.filter(Contact.name.ilike(_like_pattern(name), escape='\\'))
     if surname:
-        stmt = stmt.filter(Contact.surname.like(f'%{surname}%'))
+        stmt = stmt.filter(Contact.surname.ilike(_like_pattern(surname), escape='\\'))
     if email:
-        stmt = stmt.filter(Contact.email.like(f'%{email}%'))
+        stmt = stmt.filter(Contact.email.ilike(_like_pattern(email), escape='\\'))
     if birthdays:
-        current_date = datetime.date.today()
-        today = current_date.strftime('%m-%d')
-        seven_days = (current_date + datetime.timedelta(7)).strftime('%m-%d')
-        stmt = stmt.filter(func.to_char(Contact.birthday, 'MM-DD').between(today, seven_days))  # Thanks "AusAura"
+        upcoming, _ = _upcoming_birthdays(7)
+        stmt = stmt.filter(upcoming)
+    contacts = await db.execute(stmt)
+    return _rows(contacts, columns)
+
+
+async def stream_contacts(db: AsyncSession, user: User, batch_size: int = 1000):
+    """
+    Streams all contacts of a user, ordered by id, through a server-side cursor.
+
+    :param db: The database session. It must stay open while the result is consumed.
+    :type db: AsyncSession
+    :param user: The user associated with the contacts.
+    :type user: User
+    :param batch_size: Number of rows fetched from the cursor at a time.
+    :type batch_size: int
+
+    :return: An async iterator over the contacts.
+    :rtype: AsyncScalarResult[Contact]
+    """
+    stmt = (select(Contact)
+            .filter(Contact.user_id == user.id)
+            .order_by(Contact.id)
+            .execution_options(yield_per=batch_size))
+    return await db.stream_scalars(stmt)
+
+
+async def search_contacts(q: str, limit: int, db: AsyncSession, user: User, columns: tuple[str, ...] | None = None):
+    """
+    Case-insensitive substring search over name, surname and email.
+
+    On PostgreSQL the predicates are served by the ``pg_trgm`` GIN indexes and the results are
+    ranked by trigram similarity, so near misses (typos) are found as well. Other backends fall
+    back to a plain ``LIKE`` ordered by id.
+
+    :param q: The search string.
+    :type q: str
+    :param limit: The maximum number of contacts to retrieve.
+    :type limit: int
+    :param db: The database session.
+    :type db: AsyncSession
+    :param user: The user associated with the contacts.
+    :type user: User
+    :param columns: Select only these columns and return rows instead of contacts.
+    :type columns: tuple[str, ...] or None
+
+    :return: The matching contacts, or rows when ``columns`` is given, best match first.
+    :rtype: List[Contact] or List[Row]
+    """
+    pattern = _like_pattern(q)
+    searched = (Contact.name, Contact.surname, Contact.email)
+    match = [column.ilike(pattern, escape='\\') for column in searched]
+    stmt = _select(columns).filter(Contact.user_id == user.id).limit(limit)
+    if db.get_bind().dialect.name == 'postgresql':
+        match += [column.op('%')(q) for column in searched]
+        rank = func.greatest(*(func.similarity(column, q) for column in searched))
+        stmt = stmt.order_by(rank.desc(), Contact.id)
+    else:
+        stmt = stmt.order_by(Contact.id)
+    contacts = await db.execute(stmt.filter(or_(*match)))
+    return _rows(contacts, columns)
+
+
+async def get_upcoming_birthdays(days: int, limit: int, db: AsyncSession, user: User,
+                                 columns: tuple[str, ...] | None = None):
+    """
+    Retrieves contacts whose birthday falls within the next ``days`` days, soonest first.
+
+    :param days: Length of the window in days. Windows crossing New Year are handled.
+    :type days: int
+    :param limit: The maximum number of contacts to retrieve.
+    :type limit: int
+    :param db: The database session.
+    :type db: AsyncSession
+    :param user: The user associated with the contacts.
+    :type user: User
+    :param columns: Select only these columns and return rows instead of contacts.
+    :type columns: tuple[str, ...] or None
+
+    :return: The contacts, or rows when ``columns`` is given, with upcoming birthdays.
+    :rtype: List[Contact] or List[Row]
+    """
+    upcoming, order_by = _upcoming_birthdays(days)
+    stmt = _select(columns).filter(Contact.user_id == user.id).filter(upcoming).order_by(*order_by).limit(limit)
     contacts = await db.execute(stmt)
-    return contacts.scalars().all()
+    return _rows(contacts, columns)
 
 
-async def get_contact(contact_id: int, db: AsyncSession, user: User):
+async def get_changes(after: int | None, limit: int, db: AsyncSession, user: User, columns: tuple[str, ...]):
+    """
+    Retrieves the contacts changed and deleted after a sync position, oldest change first.
+
+    Changes are ordered by their position in the change sequence of the user, see :func:`_next_seq`,
+    served by the ``(user_id, seq)`` indexes. Positions become visible in commit order, so the last
+    position read first bounds both queries and no change can be skipped. A full sync leaves out the
+    tombstones, the client has none of those contacts.
+
+    :param after: The position the client has every change up to, or None for a full sync.
+    :type after: int or None
+    :param limit: The maximum number of changes to retrieve.
+    :type limit: int
+    :param db: The database session.
+    :type db: AsyncSession
+    :param user: The user associated with the contacts.
+    :type user: User
+    :param columns: The contact columns to select, ``updated_at`` is selected after them.
+    :type columns: tuple[str, ...]
+
+    :return: The ``(seq, id, time, row)`` of each change, ``row`` None for deletions, and the position the
+             changes are complete up to. None if ``after`` is older than the pruned tombstones or was
+             never reached, the client has to start over with a full sync.
+    :rtype: tuple[list[tuple], int] or None
+    """
+    state = (await db.execute(select(ContactSyncState.last_seq, ContactSyncState.pruned_seq)
+                              .filter(ContactSyncState.user_id == user.id))).one_or_none()
+    last_seq, pruned_seq = state or (0, 0)
+    if after is not None and not pruned_seq <= after <= last_seq:
+        return None
+
+    upserts = (_select(columns).add_columns(Contact.updated_at, Contact.seq)
+               .filter(Contact.user_id == user.id, Contact.seq <= last_seq)
+               .order_by(Contact.seq)
+               .limit(limit))
+    if after is not None:
+        upserts = upserts.filter(Contact.seq > after)
+    changes = [(row.seq, row.id, row.updated_at, row) for row in (await db.execute(upserts)).all()]
+    if after is not None:
+        deletions = (select(ContactTombstone.seq, ContactTombstone.contact_id, ContactTombstone.deleted_at)
+                     .filter(ContactTombstone.user_id == user.id, ContactTombstone.seq > after,
+                             ContactTombstone.seq <= last_seq)
+                     .order_by(ContactTombstone.seq)
+                     .limit(limit))
+        changes += [(*row, None) for row in (await db.execute(deletions)).all()]
+        changes.sort(key=lambda change: change[0])
+    changes = changes[:limit]
+    return changes, changes[-1][0] if len(changes) == limit else last_seq
+
+
+async def prune_tombstones(age: float, db: AsyncSession, batch: int = 1000) -> int:
+    """
+    Deletes the tombstones older than ``age`` seconds, ``batch`` of them per transaction.
+
+    The position of the last pruned tombstone is kept per user, a delta sync from before it could miss
+    deletions and is answered with a request for a full sync instead, see :func:`get_changes`.
+
+    :param age: Seconds a tombstone is kept.
+    :type age: float
+    :param db: The database session.
+    :type db: AsyncSession
+    :param batch: Tombstones deleted per transaction.
+    :type batch: int
+
+    :return: The number of deleted tombstones.
+    :rtype: int
+    """
+    before = await db.scalar(select(_clock(db))) - datetime.timedelta(seconds=age)
+    state = ContactSyncState.__table__
+    raise_watermark = (update(state)
+                       .where(state.c.user_id == bindparam('owner'), state.c.pruned_seq < bindparam('seq'))
+                       .values(pruned_seq=bindparam('seq')))
+    pruned = 0
+    while True:
+        expired = (select(ContactTombstone.id)
+                   .filter(_timestamp(ContactTombstone.deleted_at, db) < _timestamp(before, db))
+                   .order_by(ContactTombstone.id)
+                   .limit(batch))
+        rows = (await db.execute(delete(ContactTombstone)
+                                 .where(ContactTombstone.id.in_(expired.scalar_subquery()))
+                                 .returning(ContactTombstone.user_id, ContactTombstone.seq))).all()
+        watermarks = {}
+        for user_id, seq in rows:
+            if user_id is not None:
+                watermarks[user_id] = max(seq, watermarks.get(user_id, 0))
+        if watermarks:
+            await db.execute(raise_watermark, [{'owner': user_id, 'seq': seq}
+                                               for user_id, seq in sorted(watermarks.items())])
+        await db.commit()
+        pruned += len(rows)
+        if len(rows) < batch:
+            return pruned
+
+
+async def get_contact(contact_id: int, db: AsyncSession, user: User, load_user: bool = False,
+                      columns: tuple[str, ...] | None = None):
     """
     Retrieves a contact from the database based on the provided contact ID and user.
 
@@ -79,49 +404,78 @@ async def get_contact(contact_id: int, db: AsyncSession, user: User):
     :type db: AsyncSession
     :param user: The user object.
     :type user: User
+    :param load_user: Also load ``Contact.user``. Off by default, the relationship raises on access.
+    :type load_user: bool
+    :param columns: Select only these columns and return a row instead of a contact.
+    :type columns: tuple[str, ...] or None
 
-    :return: The retrieved contact, or None if not found.
-    :rtype: Contact or None
+    :return: The retrieved contact, or row when ``columns`` is given, or None if not found.
+    :rtype: Contact or Row or None
     """
-    stmt = select(Contact).filter_by(id=contact_id, user=user)
+    stmt = _select(columns).filter(Contact.id == contact_id, Contact.user_id == user.id)
+    if load_user and not columns:
+        stmt = stmt.options(joinedload(Contact.user))
     contact = await db.execute(stmt)
-    return contact.scalar_one_or_none()
+    return contact.one_or_none() if columns else contact.scalar_one_or_none()
 
 
-async def update_contact(contact_id: int, body: ContactSchema, db: AsyncSession, user: User):
+def _version_filter(versions: list[datetime.datetime], db: AsyncSession):
     """
-    Update a contact with the given contact ID.
+    Matches contacts whose ``updated_at`` is one of ``versions``, the condition of an ``If-Match`` write.
+    """
+    return _timestamp(Contact.updated_at, db).in_([_timestamp(version, db) for version in versions])
+
+
+async def update_contact(contact_id: int, body: ContactSchema | ContactUpdateSchema, db: AsyncSession, user: User,
+                         versions: list[datetime.datetime] | None = None):
+    """
+    Update a contact with the given contact ID in a single ``UPDATE ... RETURNING`` statement, after taking
+    the next change position for delta syncs.
+
+    Only the fields set in ``body`` are written, so the same function serves PUT and PATCH.
+    With ``versions`` the update is conditional: a contact changed in the meantime is left alone.
 
     :param contact_id: The ID of the contact to be updated.
     :type contact_id: int
     :param body: The updated contact information.
-    :type body: ContactSchema
+    :type body: ContactSchema or ContactUpdateSchema
     :param db: The database session.
     :type db: AsyncSession
     :param user: The user performing the update.
     :type user: User
+    :param versions: The ``updated_at`` values the contact may have, any if None.
+    :type versions: list[datetime.datetime] or None
 
-    :return: The updated contact object.
-    :rtype: Contact
+    :return: The updated contact object, or None if not found or its version did not match.
+    :rtype: Contact or None
     """
-    stmt = select(Contact).filter_by(id=contact_id, user=user)
+    values = body.model_dump(exclude_unset=True)
+    if not values:
+        contact = await get_contact(contact_id, db, user)
+        if contact is not None and versions is not None and contact.updated_at not in versions:
+            return None
+        return contact
+    if 'birthday' in values:
+        values['birthday_key'] = to_birthday_key(values['birthday'])
+    values['seq'] = await _next_seq(db, user)
+    stmt = (update(Contact)
+            .where(Contact.id == contact_id, Contact.user_id == user.id)
+            .values(**values)
+            .returning(Contact))
+    if versions is not None:
+        stmt = stmt.where(_version_filter(versions, db))
     result = await db.execute(stmt)
     contact = result.scalar_one_or_none()
-    if contact:
-        contact.name = body.name
-        contact.surname = body.surname
-        contact.email = body.email
-        contact.number = body.number
-        contact.birthday = body.birthday
-        contact.description = body.description
-        await db.commit()
-        await db.refresh(contact)
+    await db.commit()
     return contact
 
 
-async def delete_contact(contact_id: int, db: AsyncSession, user: User):
+async def delete_contact(contact_id: int, db: AsyncSession, user: User,
+                         versions: list[datetime.datetime] | None = None):
     """
-    Delete a contact from the database.
+    Delete a contact from the database with a ``DELETE ... RETURNING`` statement and record a tombstone
+    at the next change position for delta syncs in the same transaction. With ``versions`` only an
+    unchanged contact is deleted. A contact that is not deleted still uses up its position.
 
     :param contact_id: The ID of the contact to be deleted.
     :type contact_id: int
@@ -129,14 +483,20 @@ async def delete_contact(contact_id: int, db: AsyncSession, user: User):
     :type db: AsyncSession
     :param user: The user object associated with the contact.
     :type user: User
+    :param versions: The ``updated_at`` values the contact may have, any if None.
+    :type versions: list[datetime.datetime] or None
 
-    :return: The deleted contact object if it exists, otherwise None.
+    :return: The deleted contact object if it exists and its version matched, otherwise None.
     :rtype: Contact or None
     """
-    stmt = select(Contact).filter_by(id=contact_id, user=user)
+    # The position is taken first, like in update_contact, so both lock the sequence row before the contact
+    seq = await _next_seq(db, user)
+    stmt = delete(Contact).where(Contact.id == contact_id, Contact.user_id == user.id).returning(Contact)
+    if versions is not None:
+        stmt = stmt.where(_version_filter(versions, db))
     result = await db.execute(stmt)
     contact = result.scalar_one_or_none()
-    if contact:
-        await db.delete(contact)
-        await db.commit()
+    if contact is not None:
+        await db.execute(insert(ContactTombstone).values(contact_id=contact.id, user_id=user.id, seq=seq))
+    await db.commit()
     return contact
@@ -17,6 +17,7 @@ async def update_avatar_url(user: User, url: str | None, db: AsyncSession):
     :return: The updated user object.
     :rtype: User
     """
+    db.add(user)  # the user may come detached from the user cache
     user.avatar = url
     await db.commit()
     await db.refresh(user)
@@ -1,18 +1,51 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Path, Query
-from fastapi_limiter.depends import RateLimiter
+from datetime import date
+from typing import Literal
+
+from fastapi import APIRouter, HTTPException, Depends, status, Path, Query, Request, Header, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.conf.config import config
+from src.database.db import sessionmanager
 from src.database.fu_db import get_db
+from src.database.read_db import cacheable_read, get_read_db
 from src.models.models import User
 from src.repository import address_book as repo_book
-from src.schemas.contact import ContactSchema, ContactResponse
+from src.schemas.contact import ContactSchema, ContactResponse, ContactUpdateSchema, ContactImportReport, \
+    ContactImportError, ContactChanges
 from src.services.auth import current_active_user
+from src.services.cache import contact_cache
+from src.services.etags import contact_etag, list_etag, none_match, not_modified, parse_versions
+from src.services.export import export_contacts, MEDIA_TYPES
+from src.services.importer import iter_rows, validate_batch
+from src.services.pagination import SORT_KEYS, encode_cursor, decode_cursor, encode_sync_token, \
+    decode_sync_token
+from src.services.rate_limiter import rate_limit_read, rate_limit_write
+from src.services.serializers import CONTACT_COLUMNS, dump_row, dump_rows, json_response, parse_fields, \
+    with_columns, row_adapter
 
 router = APIRouter(prefix='/address_book', tags=['address_book'])
 
 
+def _versions(if_match: str | None):
+    """
+    The contact versions an ``If-Match`` write is limited to, None for an unconditional write.
+    """
+    return parse_versions(if_match) if if_match else None
+
+
+def _not_written(if_match: str | None):
+    """
+    Explains a write that matched no contact. With ``If-Match`` that is a failed precondition, also
+    for a missing contact (RFC 9110), so no extra query is needed to tell the cases apart.
+    """
+    if if_match:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="PRECONDITION FAILED")
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
+
+
 @router.post('/', response_model=ContactResponse, status_code=status.HTTP_201_CREATED,
-             dependencies=[Depends(RateLimiter(times=1, seconds=20))])
+             dependencies=[Depends(rate_limit_write)])
 async def create_contact(body: ContactSchema, db: AsyncSession = Depends(get_db),
                          user: User = Depends(current_active_user)):
     """
@@ -29,17 +62,101 @@ async def create_contact(body: ContactSchema, db: AsyncSession = Depends(get_db)
     :rtype: ContactResponse
     """
     contact = await repo_book.create_contact(body, db, user)
+    await sessionmanager.mark_write(user.id)
+    await contact_cache.invalidate(user.id)
     return contact
 
 
-@router.get('/', response_model=list[ContactResponse], dependencies=[Depends(RateLimiter(times=1, seconds=20))])
+@router.post('/import', response_model=ContactImportReport, dependencies=[Depends(rate_limit_write)])
+async def import_contacts(request: Request,
+                          format: Literal["csv", "ndjson"] = Query(None),  # defaults to the Content-Type
+                          db: AsyncSession = Depends(get_db),
+                          user: User = Depends(current_active_user)):
+    """
+    Imports contacts from a streamed CSV (with a header line) or NDJSON body.
+
+    Rows are validated and written in batches of ``IMPORT_BATCH_SIZE``, each batch is committed on its own.
+    Invalid rows are skipped and reported, at most ``IMPORT_MAX_ERRORS`` of them are listed.
+
+    :param request: The incoming request, its body is read as a stream.
+    :type request: Request
+    :param format: ``csv`` or ``ndjson``. If omitted, ``text/csv`` content is read as CSV and anything else as NDJSON.
+    :type format: str
+    :param db: The database session.
+    :type db: AsyncSession
+    :param user: The current active user.
+    :type user: User
+
+    :return: The number of imported and failed rows and the per-row errors.
+    :rtype: ContactImportReport
+    """
+    if format is None:
+        format = "csv" if request.headers.get("content-type", "").startswith("text/csv") else "ndjson"
+    report = ContactImportReport()
+    batch = []
+
+    async def flush():
+        contacts, errors = validate_batch(batch)
+        imported = await repo_book.bulk_create_contacts(contacts, db, user)
+        if imported:
+            await sessionmanager.mark_write(user.id)
+            await contact_cache.invalidate(user.id)
+        report.imported += imported
+        report.failed += len(errors)
+        report.errors.extend(ContactImportError(**error)
+                             for error in errors[:config.IMPORT_MAX_ERRORS - len(report.errors)])
+        batch.clear()
+
+    async for row in iter_rows(request.stream(), format):
+        batch.append(row)
+        if len(batch) >= config.IMPORT_BATCH_SIZE:
+            await flush()
+    await flush()
+    return report
+
+
+@router.get('/export', response_class=StreamingResponse, dependencies=[Depends(rate_limit_read)])
+async def export_contacts_file(format: Literal["csv", "ndjson"] = Query("csv"),
+                               gzip: bool = Query(False),
+                               db: AsyncSession = Depends(get_read_db),
+                               user: User = Depends(current_active_user)):
+    """
+    Streams the whole address book of the current user as CSV or NDJSON.
+
+    Rows are read through a server-side cursor and written as they arrive, so memory stays flat
+    regardless of the number of contacts.
+
+    :param format: ``csv`` (with a header line) or ``ndjson``.
+    :type format: str
+    :param gzip: Compress the body, it is then sent with ``Content-Encoding: gzip``.
+    :type gzip: bool
+    :param db: The database session, a read replica when one is usable.
+    :type db: AsyncSession
+    :param user: The current active user.
+    :type user: User
+
+    :return: The streamed export.
+    :rtype: StreamingResponse
+    """
+    contacts = await repo_book.stream_contacts(db, user)
+    headers = {"Content-Disposition": f'attachment; filename="contacts.{format}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(export_contacts(contacts, format, gzip), media_type=MEDIA_TYPES[format], headers=headers)
+
+
+@router.get('/', response_model=list[ContactResponse], dependencies=[Depends(rate_limit_read)])
 async def get_contacts(name: str = Query(None, min_length=1, max_length=50),  # filter by name
                        surname: str = Query(None, min_length=1, max_length=50),  # filter by surname
                        email: str = Query(None, min_length=1, max_length=50),  # filter by email
-                       birthdays: bool = Query(False),  # show next 7 days birthdays
+                       birthdays: bool = Query(False),  # show next 7 days birthdays, see also /birthdays
                        limit: int = Query(10, ge=10, le=500),
                        offset: int = Query(0, ge=0),
-                       db: AsyncSession = Depends(get_db),
+                       sort: Literal["id", "surname"] = Query("id"),
+                       after: str = Query(None, min_length=1, max_length=512),  # cursor from X-Next-Cursor
+                       fields: str = Query(None, min_length=1, max_length=200),  # e.g. id,name,surname,number
+                       if_none_match: str = Header(None),
+                       db: AsyncSession = Depends(get_read_db),
                        user: User = Depends(current_active_user)):
     """
    Retrieves contacts based on the provided filters.
@@ -56,52 +173,224 @@ async def get_contacts(name: str = Query(None, min_length=1, max_length=50),  #
    :type limit: int
    :param offset: Number of contacts to skip before retrieving the results. Must be greater than or equal to 0.
    :type offset: int
-   :param db: Database session to use for retrieving contacts.
+   :param sort: Order of the results, ``id`` or ``surname``. Ties are broken by ``id``.
+   :type sort: str
+   :param after: Opaque cursor taken from the ``X-Next-Cursor`` header of the previous page.
+                 Takes precedence over ``offset``.
+   :type after: str
+   :param fields: Comma separated fields of ``ContactResponse`` to return, all if omitted. Only these
+                  columns are selected.
+   :type fields: str
+   :param if_none_match: ETags of lists the client has. The list ETag changes with every write of the user.
+   :type if_none_match: str
+   :param db: Database session to use for retrieving contacts, a read replica when one is usable.
    :type db: AsyncSession
    :param user: User object representing the current active user.
    :type user: User
 
-   :return: List of contacts that match the provided filters.
+   :return: List of contacts with the requested fields that match the provided filters, serialized straight
+            from the selected columns.
+            The ``X-Next-Cursor`` header is set when the page is full, ``ETag`` while Redis is available.
+            ``304 Not Modified`` without running the query if ``If-None-Match`` matches.
    :rtype: list[ContactResponse]
+
+   :raises HTTPException: If the cursor is malformed or a field is unknown (HTTP 400 BAD REQUEST).
    """
-    contacts = await repo_book.get_contacts(name, surname, email, birthdays, limit, offset, db, user)
-    return contacts
+    columns = parse_fields(fields)
+    cursor = None
+    if after:
+        try:
+            cursor = decode_cursor(after, sort)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="INVALID CURSOR")
+    params = (name, surname, email, birthdays and str(date.today()), limit, offset, sort, after, columns)
+    generation = await contact_cache.generation(user.id)
+    etag = None if generation is None else list_etag(generation, params)
+    if none_match(if_none_match, etag):
+        return not_modified(etag)
+
+    async def load() -> bytes:
+        # The sort keys are selected for the cursor even when they are not requested
+        rows = await repo_book.get_contacts(name, surname, email, birthdays, limit, offset, db, user, sort=sort,
+                                            after=cursor, columns=with_columns(columns, SORT_KEYS[sort]))
+        next_cursor = encode_cursor(sort, rows[-1]) if len(rows) == limit else ""
+        # The cursor is cached with the page, the body is never parsed again
+        return next_cursor.encode() + b"\n" + dump_rows(rows, columns)
+
+    cached = await contact_cache.get_or_load_bytes(user.id, "list_json", params, load, generation,
+                                                   cacheable_read(db, user.id))
+    next_cursor, _, body = cached.partition(b"\n")
+    headers = {"ETag": etag} if etag else {}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor.decode()
+    return json_response(body, headers)
+
+
+@router.get('/search', response_model=list[ContactResponse], dependencies=[Depends(rate_limit_read)])
+async def search_contacts(q: str = Query(min_length=1, max_length=50),
+                          limit: int = Query(10, ge=1, le=100),
+                          db: AsyncSession = Depends(get_read_db),
+                          user: User = Depends(current_active_user)):
+    """
+    Searches contacts by name, surname or email, best match first.
+
+    :param q: The search string. Matching is case-insensitive.
+    :type q: str
+    :param limit: Maximum number of contacts to retrieve. Must be between 1 and 100.
+    :type limit: int
+    :param db: The database session, a read replica when one is usable.
+    :type db: AsyncSession
+    :param user: The current active user.
+    :type user: User
+
+    :return: The matching contacts, serialized straight from the selected columns.
+    :rtype: list[ContactResponse]
+    """
+    rows = await repo_book.search_contacts(q, limit, db, user, columns=CONTACT_COLUMNS)
+    return json_response(dump_rows(rows))
+
+
+@router.get('/birthdays', response_model=list[ContactResponse],
+            dependencies=[Depends(rate_limit_read)])
+async def get_upcoming_birthdays(days: int = Query(7, ge=1, le=366),
+                                 limit: int = Query(10, ge=1, le=500),
+                                 db: AsyncSession = Depends(get_read_db),
+                                 user: User = Depends(current_active_user)):
+    """
+    Retrieves contacts with a birthday in the next ``days`` days, soonest first.
+
+    :param days: Length of the window in days. Must be between 1 and 366.
+    :type days: int
+    :param limit: Maximum number of contacts to retrieve. Must be between 1 and 500.
+    :type limit: int
+    :param db: The database session, a read replica when one is usable.
+    :type db: AsyncSession
+    :param user: The current active user.
+    :type user: User
+
+    :return: The contacts with upcoming birthdays, serialized straight from the selected columns.
+    :rtype: list[ContactResponse]
+    """
+    rows = await repo_book.get_upcoming_birthdays(days, limit, db, user, columns=CONTACT_COLUMNS)
+    return json_response(dump_rows(rows))
 
 
-@router.get('/{contact_id}', response_model=ContactResponse, dependencies=[Depends(RateLimiter(times=1, seconds=20))])
-async def get_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
+@router.get('/changes', response_model=ContactChanges, dependencies=[Depends(rate_limit_read)])
+async def get_changes(since: str = Query(None, min_length=1, max_length=512),  # next_token of the previous sync
+                      limit: int = Query(100, ge=1, le=1000),
+                      db: AsyncSession = Depends(get_db),
+                      user: User = Depends(current_active_user)):
+    """
+    Retrieves the contacts created, updated or deleted since the previous sync, oldest change first.
+
+    A client starts with a full sync, without ``since``, and keeps passing the returned ``next_token``.
+    While ``has_more`` is set it can fetch the next page right away, otherwise it is up to date.
+    Tombstones are kept for ``CONTACTS_TOMBSTONE_TTL`` seconds; a token older than the pruned ones
+    is answered with 410 and the client starts over with a full sync. The primary is read: a replica
+    may not have reached the position of a token yet.
+
+    :param since: The ``next_token`` of the previous response, all changes if omitted.
+    :type since: str
+    :param limit: Maximum number of changes to retrieve. Must be between 1 and 1000.
+    :type limit: int
+    :param db: The database session.
+    :type db: AsyncSession
+    :param user: The current active user.
+    :type user: User
+
+    :return: The changes, the token to continue from and whether more changes are waiting.
+    :rtype: ContactChanges
+
+    :raises HTTPException: If the token is malformed (HTTP 400 BAD REQUEST).
+    :raises HTTPException: If the token is too old, a full sync is needed (HTTP 410 GONE).
+    """
+    after = None
+    if since:
+        try:
+            after = decode_sync_token(since)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="INVALID SYNC TOKEN")
+    result = await repo_book.get_changes(after, limit, db, user, columns=CONTACT_COLUMNS)
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="SYNC TOKEN EXPIRED")
+    changes, position = result
+    body = {
+        "changes": [{"id": contact_id, "deleted": row is None, "changed_at": changed_at,
+                     "contact": None if row is None else dict(zip(CONTACT_COLUMNS, row))}
+                    for _, contact_id, changed_at, row in changes],
+        "next_token": encode_sync_token(position),
+        "has_more": len(changes) == limit,
+    }
+    return json_response(row_adapter.dump_json(body))
+
+
+@router.get('/{contact_id}', response_model=ContactResponse, dependencies=[Depends(rate_limit_read)])
+async def get_contact(contact_id: int = Path(ge=1),
+                      fields: str = Query(None, min_length=1, max_length=200),  # e.g. id,name,surname,number
+                      if_none_match: str = Header(None),
+                      db: AsyncSession = Depends(get_read_db),
                       user: User = Depends(current_active_user)):
     """
     Retrieves a contact using the specified contact ID.
 
     :param contact_id: The ID of the contact to retrieve.
     :type contact_id: int
-    :param db: The asynchronous database session.
+    :param fields: Comma separated fields of ``ContactResponse`` to return, all if omitted. Only these
+                   columns are selected.
+    :type fields: str
+    :param if_none_match: ETags of the contact the client has.
+    :type if_none_match: str
+    :param db: The asynchronous database session, a read replica when one is usable.
     :type db: AsyncSession
     :param user: The current active user.
     :type user: User
 
-    :return: The retrieved contact.
+    :return: The retrieved contact with the requested fields and its ``ETag``. ``304 Not Modified`` if
+             ``If-None-Match`` matches, only ``updated_at`` is read then.
     :rtype: ContactResponse
 
+    :raises HTTPException: If a field is unknown (HTTP 400 BAD REQUEST).
     :raises HTTPException: If the contact is not found (HTTP 404 NOT FOUND).
     """
-    contact = await repo_book.get_contact(contact_id, db, user)
-    if contact is None:
+    columns = parse_fields(fields)
+    if if_none_match:
+        version = await repo_book.get_contact(contact_id, db, user, columns=("updated_at",))
+        if version is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
+        etag = contact_etag(version.updated_at, columns)
+        if none_match(if_none_match, etag):
+            return not_modified(etag)
+
+    async def load() -> bytes | None:
+        row = await repo_book.get_contact(contact_id, db, user, columns=with_columns(columns, ("updated_at",)))
+        if row is None:
+            return None
+        return contact_etag(row.updated_at, columns).encode() + b"\n" + dump_row(row, columns)
+
+    cached = await contact_cache.get_or_load_bytes(user.id, "get_etag_json", (contact_id, columns), load,
+                                                   cacheable=cacheable_read(db, user.id))
+    if cached is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
-    return contact
+    etag, _, body = cached.partition(b"\n")
+    return json_response(body, {"ETag": etag.decode()})
 
 
-@router.put('/{contact_id}', response_model=ContactResponse, dependencies=[Depends(RateLimiter(times=1, seconds=20))])
-async def update_contact(body: ContactSchema, contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
+@router.put('/{contact_id}', response_model=ContactResponse, dependencies=[Depends(rate_limit_write)])
+async def update_contact(body: ContactSchema, response: Response, contact_id: int = Path(ge=1),
+                         if_match: str = Header(None),
+                         db: AsyncSession = Depends(get_db),
                          user: User = Depends(current_active_user)):
     """
     Update a contact in the database.
 
     :param body: The updated contact information.
     :type body: ContactSchema
+    :param response: The response, receives the new ``ETag``.
+    :type response: Response
     :param contact_id: The ID of the contact to be updated.
     :type contact_id: int
+    :param if_match: ETags the contact must still have, else nothing is written. Prevents lost updates.
+    :type if_match: str
     :param db: The asynchronous database session.
     :type db: AsyncSession
     :param user: The authenticated user.
@@ -111,22 +400,67 @@ async def update_contact(body: ContactSchema, contact_id: int = Path(ge=1), db:
     :rtype: ContactResponse
 
     :raises HTTPException: If the contact is not found in the database.
+    :raises HTTPException: If ``If-Match`` is given and does not match (HTTP 412 PRECONDITION FAILED).
     """
-    contact = await repo_book.update_contact(contact_id, body, db, user)
+    contact = await repo_book.update_contact(contact_id, body, db, user, versions=_versions(if_match))
     if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
+        _not_written(if_match)
+    await sessionmanager.mark_write(user.id)
+    await contact_cache.invalidate(user.id)
+    response.headers["ETag"] = contact_etag(contact.updated_at)
+    return contact
+
+
+@router.patch('/{contact_id}', response_model=ContactResponse,
+              dependencies=[Depends(rate_limit_write)])
+async def patch_contact(body: ContactUpdateSchema, response: Response, contact_id: int = Path(ge=1),
+                        if_match: str = Header(None),
+                        db: AsyncSession = Depends(get_db),
+                        user: User = Depends(current_active_user)):
+    """
+    Partially update a contact. Only the fields present in the body are written.
+
+    :param body: The fields to change.
+    :type body: ContactUpdateSchema
+    :param response: The response, receives the new ``ETag``.
+    :type response: Response
+    :param contact_id: The ID of the contact to be updated.
+    :type contact_id: int
+    :param if_match: ETags the contact must still have, else nothing is written. Prevents lost updates.
+    :type if_match: str
+    :param db: The asynchronous database session.
+    :type db: AsyncSession
+    :param user: The authenticated user.
+    :type user: User
+
+    :returns: The updated contact information.
+    :rtype: ContactResponse
+
+    :raises HTTPException: If the contact is not found in the database.
+    :raises HTTPException: If ``If-Match`` is given and does not match (HTTP 412 PRECONDITION FAILED).
+    """
+    contact = await repo_book.update_contact(contact_id, body, db, user, versions=_versions(if_match))
+    if contact is None:
+        _not_written(if_match)
+    await sessionmanager.mark_write(user.id)
+    await contact_cache.invalidate(user.id)
+    response.headers["ETag"] = contact_etag(contact.updated_at)
     return contact
 
 
 @router.delete('/{contact_id}', response_model=ContactResponse,
-               dependencies=[Depends(RateLimiter(times=1, seconds=20))])
-async def delete_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
+               dependencies=[Depends(rate_limit_write)])
+async def delete_contact(contact_id: int = Path(ge=1),
+                         if_match: str = Header(None),
+                         db: AsyncSession = Depends(get_db),
                          user: User = Depends(current_active_user)):
     """
     Delete a contact by its ID.
 
     :param contact_id: The ID of the contact to be deleted.
     :type contact_id: int
+    :param if_match: ETags the contact must still have, else it is kept.
+    :type if_match: str
     :param db: The database session.
     :type db: AsyncSession
     :param user: The current authenticated user.
@@ -134,6 +468,13 @@ async def delete_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depend
 
     :return: The deleted contact.
     :rtype: ContactResponse
+
+    :raises HTTPException: If the contact is not found (HTTP 404 NOT FOUND) or ``If-Match`` is given and does
+                           not match (HTTP 412 PRECONDITION FAILED).
     """
-    contact = await repo_book.delete_contact(contact_id, db, user)
+    contact = await repo_book.delete_contact(contact_id, db, user, versions=_versions(if_match))
+    if contact is None:
+        _not_written(if_match)
+    await sessionmanager.mark_write(user.id)
+    await contact_cache.invalidate(user.id)
     return contact
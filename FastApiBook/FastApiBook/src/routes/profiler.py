@@ -0,0 +1,49 @@
+import pathlib
+
+from fastapi import APIRouter, Depends, HTTPException, Path, status
+from fastapi.responses import PlainTextResponse
+
+from src.conf.config import config
+from src.models.models import User
+from src.schemas.profiler import ProfilerToken
+from src.services.auth import current_superuser
+from src.services.profiler import issue_token
+
+router = APIRouter(prefix='/profiler', tags=['profiler'])
+
+
+@router.post('/token', response_model=ProfilerToken)
+async def create_profiler_token(user: User = Depends(current_superuser)):
+    """
+    Issues a token that profiles every request carrying it in the ``X-Profile-Token`` header or the
+    ``profile_token`` query parameter. Superusers only.
+
+    :param user: The current superuser.
+    :type user: User
+
+    :return: The token and its lifetime in seconds.
+    :rtype: ProfilerToken
+    """
+    return ProfilerToken(token=issue_token(user.id, config.PROFILER_TOKEN_LIFETIME),
+                         expires_in=config.PROFILER_TOKEN_LIFETIME)
+
+
+@router.get('/{profile_id}', response_class=PlainTextResponse)
+async def get_profile(profile_id: str = Path(pattern="^[0-9a-f]{32}$"), user: User = Depends(current_superuser)):
+    """
+    Returns a stored profile in the collapsed stack format, ready for ``flamegraph.pl`` or speedscope.
+
+    :param profile_id: The ``X-Profile-Id`` of the profiled response.
+    :type profile_id: str
+    :param user: The current superuser.
+    :type user: User
+
+    :return: One ``frame;frame;frame count`` line per distinct stack.
+    :rtype: PlainTextResponse
+
+    :raises HTTPException: If the profile does not exist (HTTP 404 NOT FOUND).
+    """
+    path = pathlib.Path(config.PROFILER_DIR) / f"{profile_id}.collapsed"
+    if not path.is_file():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
+    return PlainTextResponse(path.read_text())
@@ -1,25 +1,17 @@
-from cloudinary import CloudinaryImage, uploader, config
 from fastapi import APIRouter, UploadFile, File, Depends
-from fastapi_limiter.depends import RateLimiter
 from fastapi_users import BaseUserManager, models
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.conf.config import config as cfg
 from src.database.fu_db import get_db
 from src.models.models import User
 from src.repository.users import update_avatar_url
 from src.schemas.user import UserRead, UserUpdate
 from src.services.auth import fastapi_users, current_active_user, get_user_manager
+from src.services.avatars import avatar_service
+from src.services.rate_limiter import rate_limit_write
 
 router = APIRouter()
 
-config(
-    cloud_name=cfg.CLD_NAME,
-    api_key=cfg.CLD_API_KEY,
-    api_secret=cfg.CLD_API_SECRET,
-    secure=True,
-)
-
 router.include_router(
     fastapi_users.get_users_router(UserRead, UserUpdate, requires_verification=True),
     prefix="/users",
@@ -27,7 +19,7 @@ router.include_router(
 )
 
 
-@router.patch("/avatar", response_model=UserRead, dependencies=[Depends(RateLimiter(times=1, seconds=20))],
+@router.patch("/avatar", response_model=UserRead, dependencies=[Depends(rate_limit_write)],
               tags=["users"])
 async def update_avatar(
         file: UploadFile = File(),
@@ -36,7 +28,7 @@ async def update_avatar(
         user_manager: BaseUserManager[models.UP, models.ID] = Depends(get_user_manager),
 ):
     """
-    Update the avatar of a user.
+    Update the avatar of a user. The image is resized to the configured variants before it is stored.
 
     :param file: The file containing the new avatar image.
     :type file: UploadFile
@@ -50,17 +42,15 @@ async def update_avatar(
     :return: The updated user object.
     :rtype: UserRead
 
+    :raises HTTPException: 413 if the file is too large, 415 if it is not a supported image.
+
     :dependencies:
-        - RateLimiter: A rate limiter dependency that limits the number of requests.
+        - rate_limit_write: Applies the per-user write budget of the rate limiter.
         - current_active_user: A dependency function that retrieves the current active user.
         - get_db: A dependency function that retrieves the database session.
         - get_user_manager: A dependency function that retrieves the user manager.
     """
-    public_id = f"AddressBook/{user.email}/{file.filename}"
-    res = uploader.upload(file.file, public_id=public_id, owerite=True)
-    res_url = CloudinaryImage(public_id).build_url(
-        width=250, height=250, crop="fill", version=res.get("version")
-    )
+    res_url = await avatar_service.update(user, file)
     updated_user = await update_avatar_url(user, res_url, db)
     await user_manager.on_after_update(user, updated_user)
     return updated_user
@@ -1,6 +1,6 @@
 from typing import Optional
 
-from datetime import date
+from datetime import date, datetime
 from pydantic import BaseModel, EmailStr, Field, PastDate, ConfigDict
 
 
@@ -13,6 +13,15 @@ class ContactSchema(BaseModel):
     description: Optional[str] = Field(min_length=3, max_length=250)
 
 
+class ContactUpdateSchema(BaseModel):
+    name: str = Field(None, min_length=3, max_length=50)
+    surname: str = Field(None, min_length=3, max_length=50)
+    email: EmailStr = Field(None, min_length=6, max_length=50)
+    number: str = Field(None, min_length=9, max_length=20)
+    birthday: PastDate = Field(None)
+    description: str = Field(None, min_length=3, max_length=250)
+
+
 class ContactResponse(BaseModel):
     id: int = 1
     name: str
@@ -23,3 +32,27 @@ class ContactResponse(BaseModel):
     description: str
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class ContactImportError(BaseModel):
+    row: int
+    errors: list[str]
+
+
+class ContactImportReport(BaseModel):
+    imported: int = 0
+    failed: int = 0
+    errors: list[ContactImportError] = []
+
+
+class ContactChange(BaseModel):
+    id: int
+    deleted: bool
+    changed_at: datetime
+    contact: Optional[ContactResponse] = None
+
+
+class ContactChanges(BaseModel):
+    changes: list[ContactChange]
+    next_token: str
+    has_more: bool
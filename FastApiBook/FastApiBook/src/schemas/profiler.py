@@ -0,0 +1,6 @@
+from pydantic import BaseModel
+
+
+class ProfilerToken(BaseModel):
+    token: str
+    expires_in: int
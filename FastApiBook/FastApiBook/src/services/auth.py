@@ -1,19 +1,23 @@
+import jwt
 import uuid
 
 from typing import Optional, Dict, Any
 from fastapi import Depends, Request, BackgroundTasks
-from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin, schemas, models
+from fastapi.security import OAuth2PasswordRequestForm
+from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin, schemas, models, exceptions
 from fastapi_users.authentication import AuthenticationBackend, BearerTransport, JWTStrategy
 from fastapi_users.db import SQLAlchemyUserDatabase
 from fastapi_users.exceptions import UserAlreadyExists
+from fastapi_users.jwt import decode_jwt
 from libgravatar import Gravatar
-from pickle import dumps, loads
-from redis.asyncio import Redis
 from starlette.responses import Response
 
 from src.conf.config import config
 from src.database.fu_db import User, get_user_db
-from src.services.email import send_email_verification, send_email_forgot_password
+from src.services import email  # noqa: F401, registers the email jobs
+from src.services.jobs import job_queue
+from src.services.passwords import password_hasher
+from src.services.user_cache import UserCache, user_cache
 
 
 class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
@@ -27,12 +31,7 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
     """
     reset_password_token_secret = config.SECRET_KEY_JWT
     verification_token_secret = config.SECRET_KEY_JWT
-    cache = Redis(
-        host=config.REDIS_DOMAIN,
-        port=config.REDIS_PORT,
-        db=0,
-        password=config.REDIS_PASSWORD,
-    )
+    cache = user_cache
 
     def __init__(self, user_db: SQLAlchemyUserDatabase, background_tasks: BackgroundTasks):
         super().__init__(user_db)
@@ -72,7 +71,7 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
 
         user_dict = (user_create.create_update_dict() if safe else user_create.create_update_dict_superuser())
         password = user_dict.pop("password")
-        user_dict["hashed_password"] = self.password_helper.hash(password)
+        user_dict["hashed_password"] = await password_hasher.hash(password)
 
         avatar = None
         try:
@@ -86,6 +85,50 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
         await self.on_after_register(created_user, request)
         return created_user
 
+    async def authenticate(self, credentials: OAuth2PasswordRequestForm) -> Optional[models.UP]:
+        """
+        Authenticate a user by email and password, verifying the hash off the event loop.
+
+        :param credentials: The submitted login form.
+        :type credentials: OAuth2PasswordRequestForm
+
+        :return: The authenticated user, or None if the credentials are wrong.
+        :rtype: Optional[models.UP]
+        """
+        try:
+            user = await self.get_by_email(credentials.username)
+        except exceptions.UserNotExists:
+            # Run the hasher anyway so unknown emails take as long as wrong passwords
+            await password_hasher.hash(credentials.password)
+            return None
+
+        verified, updated_password_hash = await password_hasher.verify_and_update(credentials.password,
+                                                                                  user.hashed_password)
+        if not verified:
+            return None
+        if updated_password_hash is not None:
+            await self.user_db.update(user, {"hashed_password": updated_password_hash})
+        return user
+
+    async def _update(self, user: models.UP, update_dict: Dict[str, Any]) -> models.UP:
+        """
+        Apply an update to a user, hashing a new password off the event loop.
+
+        :param user: The user to update.
+        :type user: models.UP
+        :param update_dict: The fields to change.
+        :type update_dict: Dict[str, Any]
+
+        :return: The updated user.
+        :rtype: models.UP
+        """
+        update_dict = dict(update_dict)
+        password = update_dict.pop("password", None)
+        if password is not None:
+            await self.validate_password(password, user)
+            update_dict["hashed_password"] = await password_hasher.hash(password)
+        return await super()._update(user, update_dict)
+
     async def on_after_login(
         self,
         user: models.UP,
@@ -93,7 +136,8 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
         response: Optional[Response] = None,
     ):
         """
-        Asynchronously handles the logic after a user has successfully logged in.
+        Asynchronously handles the logic after a user has successfully logged in,
+        by priming the user cache read by the JWT strategy.
 
         :param user: An instance of the UP model representing the logged-in user.
         :type user: models.UP
@@ -101,25 +145,13 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
         :type request: Optional[Request]
         :param response: An optional instance of the Response class representing the HTTP response.
         :type response: Optional[Response]
-
-        :return: The cached user data retrieved from the cache.
-        :rtype: Any
         """
-        user_hash = str(user.email)
-        cached_user = await self.cache.get(user_hash)
-
-        if cached_user is None:
-            cached_user = await self.get_by_email(user.email)
-            await self.cache.set(user_hash, dumps(cached_user))
-            await self.cache.expire(user_hash, 300)
-        else:
-            cached_user = loads(cached_user)
-        return cached_user
+        await self.cache.set(user)
 
     async def on_after_request_verify(self, user: User, token: str, request: Optional[Request] = None):
         """
         Asynchronously verifies a request after it has been processed,
-        by sending an email verification link to the user.
+        by queueing a job that emails a verification link to the user.
 
         :param user: The user object.
         :type user: User
@@ -129,7 +161,8 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
         :type request: Optional[Request], optional
         """
         host = str(request.base_url)
-        self.background_tasks.add_task(send_email_verification, user.email, user.username, token, host)
+        await job_queue.enqueue("send_email_verification", email=user.email, username=user.username, token=token,
+                                host=host)
 
     async def on_after_verify(self, user: models.UP, request: Optional[Request] = None) -> None:
         """
@@ -140,6 +173,7 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
         :param request: An optional request object.
         :type request: Optional[Request]
         """
+        await self.cache.invalidate(user.id)
         print('verified user', user.email)
 
     async def on_after_update(
@@ -158,11 +192,34 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
         :param request: An optional request object.
         :type request: Optional[Request]
         """
-        await self.on_after_login(user)
+        await self.cache.invalidate(user.id)
+
+    async def on_after_reset_password(self, user: models.UP, request: Optional[Request] = None) -> None:
+        """
+        A function that is called after a user has reset their password.
+
+        :param user: The user object.
+        :type user: models.UP
+        :param request: An optional request object.
+        :type request: Optional[Request]
+        """
+        await self.cache.invalidate(user.id)
+
+    async def on_after_delete(self, user: models.UP, request: Optional[Request] = None) -> None:
+        """
+        A function that is called after a user has been deleted.
+
+        :param user: The deleted user object.
+        :type user: models.UP
+        :param request: An optional request object.
+        :type request: Optional[Request]
+        """
+        await self.cache.invalidate(user.id)
 
     async def on_after_forgot_password(self, user: User, token: str, request: Optional[Request] = None):
         """
-        Handle the event that occurs after a user has requested to reset their password.
+        Handle the event that occurs after a user has requested to reset their password,
+        by queueing a job that emails the reset link.
 
         :param user: The user who requested the password reset.
         :type user: User
@@ -172,7 +229,8 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
         :type request: Optional[Request], optional
         """
         host = str(request.base_url)
-        self.background_tasks.add_task(send_email_forgot_password, user.email, user.username, token, host)
+        await job_queue.enqueue("send_email_forgot_password", email=user.email, username=user.username, token=token,
+                                host=host)
 
 
 async def get_user_manager(background_tasks: BackgroundTasks = None,
@@ -191,6 +249,48 @@ async def get_user_manager(background_tasks: BackgroundTasks = None,
     yield UserManager(user_db, background_tasks)
 
 
+class CachedJWTStrategy(JWTStrategy):
+    """
+    JWT strategy that resolves the token subject through :class:`UserCache` before the database.
+
+    :param cache: The user cache.
+    :type cache: UserCache
+    """
+
+    def __init__(self, cache: UserCache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    async def read_token(self, token: Optional[str], user_manager: BaseUserManager[models.UP, models.ID]
+                         ) -> Optional[models.UP]:
+        """
+        Decodes the token and returns its user, from the cache when possible.
+
+        :param token: The bearer token.
+        :type token: Optional[str]
+        :param user_manager: The user manager, used on a cache miss.
+        :type user_manager: BaseUserManager[models.UP, models.ID]
+
+        :return: The user, or None if the token or the user is invalid.
+        :rtype: Optional[models.UP]
+        """
+        if token is None:
+            return None
+        try:
+            data = decode_jwt(token, self.decode_key, self.token_audience, algorithms=[self.algorithm])
+            parsed_id = user_manager.parse_id(data["sub"])
+        except (jwt.PyJWTError, KeyError, exceptions.InvalidID):
+            return None
+        user = await self.cache.get(parsed_id)
+        if user is None:
+            try:
+                user = await user_manager.get(parsed_id)
+            except exceptions.UserNotExists:
+                return None
+            await self.cache.set(user)
+        return user
+
+
 bearer_transport = BearerTransport(tokenUrl="auth/jwt/login")
 
 
@@ -198,10 +298,10 @@ def get_jwt_strategy() -> JWTStrategy:
     """
    Get the JWT strategy.
 
-   :return: An instance of JWTStrategy.
-   :rtype: JWTStrategy
+   :return: An instance of JWTStrategy backed by the user cache.
+   :rtype: CachedJWTStrategy
    """
-    return JWTStrategy(secret=config.SECRET_KEY_JWT, lifetime_seconds=3600)
+    return CachedJWTStrategy(user_cache, secret=config.SECRET_KEY_JWT, lifetime_seconds=3600)
 
 
 auth_backend = AuthenticationBackend(
@@ -213,3 +313,4 @@ auth_backend = AuthenticationBackend(
 fastapi_users = FastAPIUsers[User, uuid.UUID](get_user_manager, [auth_backend])
 
 current_active_user = fastapi_users.current_user(active=True)
+current_superuser = fastapi_users.current_user(active=True, superuser=True)
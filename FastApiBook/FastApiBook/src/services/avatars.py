@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import io
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import cloudinary
+from cloudinary import uploader
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from src.conf.config import config
+from src.models.models import User
+
+FORMATS = {"JPEG", "PNG", "WEBP", "GIF"}
+READ_CHUNK = 64 * 1024
+
+
+class AvatarStorage(ABC):
+    """
+    Where avatar variants are stored. Backends implement :meth:`save`.
+    """
+
+    @abstractmethod
+    async def save(self, key: str, data: bytes, content_type: str) -> str:
+        """
+        Stores one variant, replacing an earlier one with the same key.
+
+        :param key: The path of the variant, e.g. ``<user id>/250.webp``.
+        :type key: str
+        :param data: The encoded image.
+        :type data: bytes
+        :param content_type: The media type of ``data``.
+        :type content_type: str
+
+        :return: The public URL of the variant.
+        :rtype: str
+        """
+
+
+class LocalStorage(AvatarStorage):
+    """
+    Writes variants under ``directory`` and serves them from ``base_url``, e.g. the ``/static`` mount.
+
+    :param directory: The target directory.
+    :type directory: str
+    :param base_url: The URL ``directory`` is served at.
+    :type base_url: str
+    """
+
+    def __init__(self, directory: str, base_url: str):
+        self.directory = Path(directory)
+        self.base_url = base_url.rstrip("/")
+
+    def _write(self, key: str, data: bytes):
+        path = self.directory / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+    async def save(self, key: str, data: bytes, content_type: str) -> str:
+        await asyncio.to_thread(self._write, key, data)
+        # The key is reused on every upload, the digest makes browsers and CDNs fetch the new image
+        return f"{self.base_url}/{key}?v={hashlib.sha1(data).hexdigest()[:12]}"
+
+
+class CloudinaryStorage(AvatarStorage):
+    """
+    Uploads variants to Cloudinary under ``<folder>/<key>`` from a worker thread, the SDK is blocking.
+
+    :param cloud_name: The Cloudinary cloud name.
+    :type cloud_name: str
+    :param api_key: The API key.
+    :type api_key: int
+    :param api_secret: The API secret.
+    :type api_secret: str
+    :param folder: The folder of the public IDs.
+    :type folder: str
+    """
+
+    def __init__(self, cloud_name: str, api_key: int, api_secret: str, folder: str = "AddressBook"):
+        cloudinary.config(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret, secure=True)
+        self.folder = folder
+
+    async def save(self, key: str, data: bytes, content_type: str) -> str:
+        public_id = f"{self.folder}/{key.rsplit('.', 1)[0]}"
+        result = await asyncio.to_thread(uploader.upload, data, public_id=public_id, overwrite=True,
+                                         resource_type="image")
+        return result["secure_url"]
+
+
+def render_variants(data: bytes, sizes: list[int], max_pixels: int, quality: int) -> dict[int, bytes]:
+    """
+    Decodes an image and encodes a square WebP crop per size. CPU bound, runs in a worker thread.
+
+    :param data: The uploaded file.
+    :type data: bytes
+    :param sizes: Edge lengths of the variants in pixels.
+    :type sizes: list[int]
+    :param max_pixels: Largest accepted width times height, checked before decoding the pixel data.
+    :type max_pixels: int
+    :param quality: WebP quality from 1 to 100.
+    :type quality: int
+
+    :return: The encoded variants by size.
+    :rtype: dict[int, bytes]
+
+    :raises HTTPException: 415 if the file is not a supported image, 413 if it has too many pixels.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Unsupported image")
+    if image.format not in FORMATS:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Unsupported image")
+    if image.width * image.height > max_pixels:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Image is too large")
+    # Lets the JPEG decoder scale down by up to 8x while decoding, far cheaper than resizing afterwards
+    image.draft("RGB", (max(sizes), max(sizes)))
+    try:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Unsupported image")
+    variants = {}
+    for size in sorted(sizes, reverse=True):
+        image = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, "WEBP", quality=quality, method=4)
+        variants[size] = output.getvalue()
+    return variants
+
+
+class AvatarService:
+    """
+    Validates, resizes and stores avatars without blocking the event loop.
+
+    The upload is read with a byte cap, decoded and resized to every size of ``sizes`` in a worker
+    thread, so only the small variants are stored, never the original. Image work is limited to
+    ``concurrency`` uploads at once so large images cannot take every thread of the default executor.
+
+    :param storage: The storage backend.
+    :type storage: AvatarStorage
+    :param sizes: Edge lengths of the variants, the first one is the avatar URL of the user.
+    :type sizes: list[int]
+    :param max_bytes: Largest accepted file.
+    :type max_bytes: int
+    :param max_pixels: Largest accepted width times height.
+    :type max_pixels: int
+    :param quality: WebP quality from 1 to 100.
+    :type quality: int
+    :param concurrency: Maximum number of images processed at once.
+    :type concurrency: int
+    """
+
+    def __init__(self, storage: AvatarStorage, sizes: list[int], max_bytes: int, max_pixels: int,
+                 quality: int = 85, concurrency: int = 4):
+        self.storage = storage
+        self.sizes = sizes
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.quality = quality
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def read(self, file: UploadFile) -> bytes:
+        """
+        Reads an upload, failing as soon as it exceeds ``max_bytes``.
+
+        :param file: The uploaded file.
+        :type file: UploadFile
+
+        :return: The file content.
+        :rtype: bytes
+
+        :raises HTTPException: 413 if the file is too large.
+        """
+        too_large = HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File is too large")
+        if file.size is not None and file.size > self.max_bytes:
+            raise too_large
+        data = bytearray()
+        while chunk := await file.read(READ_CHUNK):
+            data += chunk
+            if len(data) > self.max_bytes:
+                raise too_large
+        return bytes(data)
+
+    async def update(self, user: User, file: UploadFile) -> str:
+        """
+        Stores the variants of a new avatar.
+
+        :param user: The owner of the avatar.
+        :type user: User
+        :param file: The uploaded image.
+        :type file: UploadFile
+
+        :return: The URL of the first size of ``sizes``.
+        :rtype: str
+
+        :raises HTTPException: 413 if the file or image is too large, 415 if it is not a supported image.
+        """
+        data = await self.read(file)
+        async with self._semaphore:
+            variants = await asyncio.to_thread(render_variants, data, self.sizes, self.max_pixels, self.quality)
+        urls = await asyncio.gather(*(self.storage.save(f"{user.id}/{size}.webp", variant, "image/webp")
+                                      for size, variant in variants.items()))
+        return dict(zip(variants, urls))[self.sizes[0]]
+
+
+def build_storage() -> AvatarStorage:
+    """
+    Creates the storage backend selected by ``AVATAR_STORAGE``.
+
+    :return: The storage backend.
+    :rtype: AvatarStorage
+    """
+    if config.AVATAR_STORAGE == "local":
+        return LocalStorage(config.AVATAR_LOCAL_DIR, config.AVATAR_LOCAL_URL)
+    return CloudinaryStorage(config.CLD_NAME, config.CLD_API_KEY, config.CLD_API_SECRET)
+
+
+avatar_service = AvatarService(
+    build_storage(),
+    sizes=config.AVATAR_SIZES,
+    max_bytes=config.AVATAR_MAX_BYTES,
+    max_pixels=config.AVATAR_MAX_PIXELS,
+    quality=config.AVATAR_QUALITY,
+    concurrency=config.AVATAR_CONCURRENCY,
+)
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import time
+from typing import Awaitable, Callable
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.conf.config import config
+
+
+class ContactCache:
+    """
+    Read-through Redis cache for contact reads.
+
+    Every key embeds a per-user generation number. Writes bump the generation with a single ``INCR``,
+    which orphans all cached reads of that user at once; the orphans simply expire. No key scans needed.
+
+    The generation doubles as the change counter behind list ETags. It is seeded from the clock, so
+    after Redis lost it the counter never returns to an earlier value and old ETags cannot match.
+
+    Redis failures never fail a request: the loader is called instead and Redis is skipped for
+    ``retry_after`` seconds. A bump that failed is kept and retried before Redis is used again; until
+    it succeeds nothing is read from or written to the cache, so stale reads cannot be served.
+
+    :param redis: The Redis client, or None to disable caching.
+    :type redis: Redis or None
+    :param ttl: Lifetime of cached entries in seconds, 0 disables caching.
+    :type ttl: int
+    :param retry_after: Seconds to bypass Redis after an error.
+    :type retry_after: float
+    """
+
+    def __init__(self, redis: Redis | None, ttl: int, retry_after: float = 5.0):
+        self.redis = redis
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._down_until = 0.0
+        self._pending = set()
+
+    def bind(self, redis: Redis | None):
+        """
+        Switches to another Redis client, None disables the Redis level.
+
+        :param redis: The client, usually sharing the application pool.
+        :type redis: Redis or None
+        """
+        self.redis = redis
+        self._down_until = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.redis is not None and self.ttl > 0 and time.monotonic() >= self._down_until
+
+    def _failed(self, err: Exception):
+        self.errors += 1
+        self._down_until = time.monotonic() + self.retry_after
+        print(err)
+
+    @staticmethod
+    def _generation_key(user_id) -> str:
+        return f"contacts:gen:{user_id}"
+
+    async def _ready(self, force: bool = False) -> bool:
+        """
+        Tells whether the cache can be used, first retrying the generation bumps that failed. ``force``
+        tries Redis even while it is skipped after an error.
+        """
+        if not (force or self.enabled):
+            return False
+        for user_id in list(self._pending):
+            key = self._generation_key(user_id)
+            try:
+                if await self.redis.incr(key) == 1:
+                    # The counter was lost, continue from the clock instead of an already used value
+                    await self.redis.incrby(key, time.time_ns())
+            except (RedisError, OSError) as err:
+                self._failed(err)
+                return False
+            self._pending.discard(user_id)
+        return True
+
+    async def _key(self, user_id, name: str, params: tuple, generation: int | None = None) -> str:
+        digest = hashlib.blake2b(json.dumps(params, default=str).encode(), digest_size=12).hexdigest()
+        if generation is None:
+            generation = int(await self.redis.get(self._generation_key(user_id)) or 0)
+        return f"contacts:{user_id}:{generation}:{name}:{digest}"
+
+    async def generation(self, user_id) -> int | None:
+        """
+        Returns the change counter of a user, seeding it when it does not exist yet.
+
+        :param user_id: The owner of the data.
+        :type user_id: UUID
+
+        :return: The counter, None if Redis is disabled or failing.
+        :rtype: int or None
+        """
+        if not await self._ready():
+            return None
+        key = self._generation_key(user_id)
+        try:
+            generation = await self.redis.get(key)
+            if generation is None:
+                await self.redis.set(key, time.time_ns(), nx=True)
+                generation = await self.redis.get(key)
+        except (RedisError, OSError) as err:
+            self._failed(err)
+            return None
+        return int(generation)
+
+    async def get_or_load_bytes(self, user_id, name: str, params: tuple,
+                                loader: Callable[[], Awaitable[bytes | None]],
+                                generation: int | None = None,
+                                cacheable: Callable[[], Awaitable[bool]] | None = None) -> bytes | None:
+        """
+        Returns the cached bytes for ``name``/``params`` or loads, caches and returns them. Values are
+        stored already serialized, e.g. a JSON response body, so hits are returned without any parsing.
+
+        :param user_id: The owner of the data, selects the generation counter.
+        :type user_id: UUID
+        :param name: The kind of read, e.g. ``list``.
+        :type name: str
+        :param params: Everything the result depends on besides the user.
+        :type params: tuple
+        :param loader: Coroutine function producing the bytes from the database, or None.
+        :type loader: Callable[[], Awaitable[bytes | None]]
+        :param generation: The counter from :meth:`generation` if the caller has it, saves a round trip.
+        :type generation: int or None
+        :param cacheable: Asked after loading, False keeps the value out of the cache, e.g. a replica
+                          read that may predate a write, see :func:`src.database.read_db.cacheable_read`.
+        :type cacheable: Callable[[], Awaitable[bool]] or None
+
+        :return: The bytes. None results are returned but not cached.
+        :rtype: bytes or None
+        """
+        if not await self._ready():
+            return await loader()
+        try:
+            key = await self._key(user_id, name, params, generation)
+            cached = await self.redis.get(key)
+        except (RedisError, OSError) as err:
+            self._failed(err)
+            return await loader()
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        value = await loader()
+        if value is None or cacheable is not None and not await cacheable():
+            return value
+        try:
+            await self.redis.set(key, value, ex=self.ttl)
+        except (RedisError, OSError) as err:
+            self._failed(err)
+        return value
+
+    async def invalidate(self, user_id):
+        """
+        Drops all cached reads of a user by bumping their generation counter. If Redis fails, the bump
+        is retried before the cache is used again.
+
+        :param user_id: The user whose contacts changed.
+        :type user_id: UUID
+        """
+        if self.redis is None or self.ttl <= 0:
+            return
+        self._pending.add(user_id)
+        await self._ready(force=True)
+
+
+# The Redis client is bound in the application lifespan, see ``main.lifespan``.
+contact_cache = ContactCache(None, ttl=config.CONTACTS_CACHE_TTL)
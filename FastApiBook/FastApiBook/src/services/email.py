@@ -1,26 +1,10 @@
-from pathlib import Path
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
 from pydantic import EmailStr
 
-from src.conf.config import config
-
-
-conf = ConnectionConfig(
-    MAIL_USERNAME=config.MAIL_USERNAME,
-    MAIL_PASSWORD=config.MAIL_PASSWORD,
-    MAIL_FROM=config.MAIL_FROM,
-    MAIL_PORT=config.MAIL_PORT,
-    MAIL_SERVER=config.MAIL_SERVER,
-    MAIL_FROM_NAME="Sergiy",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
+from src.services.jobs import job_queue
+from src.services.mailer import Mail, mailer
 
 
+@job_queue.task("send_email_verification")
 async def send_email_verification(email: EmailStr, username: str, token: str, host: str):
     """
     Sends an email verification to the specified email address.
@@ -34,25 +18,20 @@ async def send_email_verification(email: EmailStr, username: str, token: str, ho
     :param host: The host URL.
     :type host: str
 
-    :raises ConnectionErrors: If there is an error connecting to the email server.
+    :raises Exception: If the email was not delivered, so the job is retried and finally dead-lettered.
     """
-    try:
-        message = MessageSchema(
-            subject="Confirm your email",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="verify_email.html")
-    except ConnectionErrors as err:
-        print(err)
+    await mailer.deliver(Mail(
+        recipient=email,
+        subject="Confirm your email",
+        template="verify_email.html",
+        context={"host": host, "username": username, "token": token},
+    ))
 
 
+@job_queue.task("send_email_forgot_password")
 async def send_email_forgot_password(email: EmailStr, username: str, token: str, host: str):
     """
-    Send a forgot password email to the specified email address.
+    Sends a forgot password email to the specified email address.
 
     :param email: The email address of the user.
     :type email: EmailStr
@@ -62,16 +41,12 @@ async def send_email_forgot_password(email: EmailStr, username: str, token: str,
     :type token: str
     :param host: The host URL for the application.
     :type host: str
-    """
-    try:
-        message = MessageSchema(
-            subject="Forgot password",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token},
-            subtype=MessageType.html
-        )
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="forgot_password.html")
-    except ConnectionErrors as err:
-        print(err)
+    :raises Exception: If the email was not delivered, so the job is retried and finally dead-lettered.
+    """
+    await mailer.deliver(Mail(
+        recipient=email,
+        subject="Forgot password",
+        template="forgot_password.html",
+        context={"host": host, "username": username, "token": token},
+    ))
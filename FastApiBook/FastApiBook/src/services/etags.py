@@ -0,0 +1,108 @@
+import datetime
+import hashlib
+import json
+
+from fastapi import Response, status
+
+from src.services.serializers import CONTACT_COLUMNS
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def contact_etag(updated_at: datetime.datetime | None, columns: tuple[str, ...] = CONTACT_COLUMNS) -> str:
+    """
+    Builds the strong ETag of a contact from its ``updated_at`` version.
+
+    The version is kept readable, so an ``If-Match`` can be turned back into a conditional write,
+    see :func:`parse_versions`. Sparse representations append a digest of their fields.
+
+    :param updated_at: The version of the contact.
+    :type updated_at: datetime or None
+    :param columns: The fields of the representation.
+    :type columns: tuple[str, ...]
+
+    :return: The quoted ETag.
+    :rtype: str
+    """
+    version = 0 if updated_at is None else (updated_at - EPOCH) // datetime.timedelta(microseconds=1)
+    if columns == CONTACT_COLUMNS:
+        return f'"{version:x}"'
+    return f'"{version:x}-{_digest(columns)}"'
+
+
+def list_etag(generation: int, params: tuple) -> str:
+    """
+    Builds the weak ETag of a contact list from the change counter of its owner and the query.
+
+    :param generation: The per-user change counter, see :meth:`ContactCache.generation`.
+    :type generation: int
+    :param params: Everything the list depends on besides the user.
+    :type params: tuple
+
+    :return: The quoted weak ETag.
+    :rtype: str
+    """
+    return f'W/"{generation:x}-{_digest(params)}"'
+
+
+def _digest(value) -> str:
+    return hashlib.blake2b(json.dumps(value, default=str).encode(), digest_size=8).hexdigest()
+
+
+def _split(header: str) -> list[str]:
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def none_match(header: str | None, etag: str | None) -> bool:
+    """
+    Tells whether an ``If-None-Match`` header matches, using the weak comparison of RFC 9110.
+
+    :param header: The header value, a list of ETags or ``*``.
+    :type header: str or None
+    :param etag: The current ETag, None if the resource has none.
+    :type etag: str or None
+
+    :return: True if a ``304 Not Modified`` can be sent.
+    :rtype: bool
+    """
+    if not header or etag is None:
+        return False
+    tags = _split(header)
+    return "*" in tags or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+
+def parse_versions(header: str) -> list[datetime.datetime] | None:
+    """
+    Turns an ``If-Match`` header into the contact versions it accepts. Strong comparison: weak and
+    foreign ETags never match.
+
+    :param header: The header value, a list of ETags or ``*``.
+    :type header: str
+
+    :return: The accepted ``updated_at`` versions, possibly none, or None for ``*`` (any version).
+    :rtype: list[datetime] or None
+    """
+    versions = []
+    for tag in _split(header):
+        if tag == "*":
+            return None
+        if not (len(tag) > 2 and tag[0] == tag[-1] == '"'):
+            continue
+        try:
+            versions.append(EPOCH + datetime.timedelta(microseconds=int(tag[1:-1].split("-")[0], 16)))
+        except (ValueError, OverflowError):
+            continue
+    return versions
+
+
+def not_modified(etag: str) -> Response:
+    """
+    Answers a matching ``If-None-Match`` without a body.
+
+    :param etag: The current ETag.
+    :type etag: str
+
+    :return: The ``304 Not Modified`` response.
+    :rtype: Response
+    """
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
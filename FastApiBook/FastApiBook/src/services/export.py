@@ -0,0 +1,63 @@
+import csv
+import io
+import zlib
+from typing import AsyncIterator
+
+from pydantic_core import to_json
+
+from src.schemas.contact import ContactResponse
+
+EXPORT_FIELDS = tuple(ContactResponse.model_fields)
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def _csv_chunk(rows: list[tuple]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def _ndjson_chunk(rows: list[tuple]) -> bytes:
+    return b"".join(to_json(dict(zip(EXPORT_FIELDS, row))) + b"\n" for row in rows)
+
+
+async def export_contacts(contacts: AsyncIterator, fmt: str, compress: bool = False,
+                          chunk_rows: int = 500) -> AsyncIterator[bytes]:
+    """
+    Encodes a stream of contacts as CSV or NDJSON, ``chunk_rows`` rows per yielded chunk.
+
+    Only one chunk is held in memory at a time, so memory use does not depend on the number of contacts.
+
+    :param contacts: The contacts to export, e.g. the result of ``AsyncSession.stream_scalars``.
+    :type contacts: AsyncIterator
+    :param fmt: ``csv`` (with a header line) or ``ndjson``.
+    :type fmt: str
+    :param compress: Gzip the output.
+    :type compress: bool
+    :param chunk_rows: Number of rows encoded per chunk.
+    :type chunk_rows: int
+
+    :return: The encoded body chunks.
+    :rtype: AsyncIterator[bytes]
+    """
+    encode = _csv_chunk if fmt == "csv" else _ndjson_chunk
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+
+    def emit(data: bytes) -> bytes:
+        return compressor.compress(data) if compressor else data
+
+    if fmt == "csv":
+        yield emit(_csv_chunk([EXPORT_FIELDS]))
+    rows = []
+    async for contact in contacts:
+        rows.append(tuple(getattr(contact, field) for field in EXPORT_FIELDS))
+        if len(rows) >= chunk_rows:
+            chunk = emit(encode(rows))
+            rows.clear()
+            if chunk:
+                yield chunk
+    tail = emit(encode(rows)) if rows else b""
+    if compressor:
+        tail += compressor.flush()
+    if tail:
+        yield tail
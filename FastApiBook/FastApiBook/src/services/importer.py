@@ -0,0 +1,106 @@
+import csv
+import datetime
+import json
+from typing import AsyncIterator
+
+from pydantic import TypeAdapter, ValidationError
+
+from src.schemas.contact import ContactSchema
+
+IMPORT_FIELDS = ("name", "surname", "email", "number", "birthday", "description")
+
+contacts_adapter = TypeAdapter(list[ContactSchema])
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Splits a stream of byte chunks into lines without buffering the whole body. Lines are decoded by
+    the caller, so a line that is not UTF-8 only fails its own record.
+
+    :param chunks: The request body stream.
+    :type chunks: AsyncIterator[bytes]
+
+    :return: The non-empty lines of the body, without line terminators.
+    :rtype: AsyncIterator[bytes]
+    """
+    tail = b""
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            line = line.rstrip(b"\r")
+            if line:
+                yield line
+    if tail.strip():
+        yield tail.rstrip(b"\r")
+
+
+async def iter_rows(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[tuple[int, dict | str]]:
+    """
+    Parses a CSV (with a header line) or NDJSON stream into raw rows.
+
+    Quoted CSV fields spanning several lines are not supported, every line is one record. A record that
+    is not UTF-8 is reported like any other malformed record; in the CSV header invalid bytes are
+    replaced, so unreadable columns are just not imported.
+
+    :param chunks: The request body stream.
+    :type chunks: AsyncIterator[bytes]
+    :param fmt: ``csv`` or ``ndjson``.
+    :type fmt: str
+
+    :return: Pairs of the 1-based row number and either the parsed row or a parse error message.
+    :rtype: AsyncIterator[tuple[int, dict | str]]
+    """
+    header = None
+    row_number = 0
+    async for line in iter_lines(chunks):
+        if fmt == "csv" and header is None:
+            header = [column.strip() for column in next(csv.reader([line.decode("utf-8-sig", "replace")]))]
+            continue
+        row_number += 1
+        try:
+            line = line.decode("utf-8-sig")
+            if fmt == "csv":
+                row = dict(zip(header, next(csv.reader([line]))))
+            else:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError("expected a JSON object")
+        except (ValueError, csv.Error) as err:
+            yield row_number, f"malformed {fmt} record: {err}"
+            continue
+        yield row_number, {key: row[key] for key in IMPORT_FIELDS if key in row}
+
+
+def validate_batch(batch: list[tuple[int, dict | str]]) -> tuple[list[ContactSchema], list[dict]]:
+    """
+    Validates a batch of raw rows in one pass of the ``ContactSchema`` adapter.
+
+    A second pass over the remaining rows is only needed when the batch contains invalid rows.
+
+    :param batch: Row numbers with parsed rows or parse errors, as produced by :func:`iter_rows`.
+    :type batch: list[tuple[int, dict | str]]
+
+    :return: The valid contacts and the per-row error reports.
+    :rtype: tuple[list[ContactSchema], list[dict]]
+    """
+    errors = {number: [row] for number, row in batch if isinstance(row, str)}
+    pending = [(number, row) for number, row in batch if number not in errors]
+    contacts = []
+    while pending:
+        try:
+            contacts = contacts_adapter.validate_python([row for _, row in pending])
+            break
+        except ValidationError as err:
+            for error in err.errors():
+                number = pending[error["loc"][0]][0]
+                field = ".".join(str(part) for part in error["loc"][1:])
+                errors.setdefault(number, []).append(f"{field}: {error['msg']}")
+            pending = [(number, row) for number, row in pending if number not in errors]
+    valid = []
+    for (number, _), contact in zip(pending, contacts):
+        if isinstance(contact.birthday, datetime.date):
+            valid.append(contact)
+        else:
+            errors[number] = ["birthday: Field required"]
+    return valid, [{"row": number, "errors": messages} for number, messages in sorted(errors.items())]
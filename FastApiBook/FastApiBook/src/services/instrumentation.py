@@ -0,0 +1,160 @@
+import json
+import logging
+import re
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger("src.sql")
+
+_NORMALIZE_RULES = (
+    (re.compile(r"'(?:[^']|'')*'"), "?"),  # string literals
+    (re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b"), "?"),  # numeric literals
+    (re.compile(r"\$\d+|%\(\w+\)s|(?<!:):\w+"), "?"),  # bind parameters of the different paramstyles
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)"), "(?, ...)"),  # IN lists and VALUES rows
+    (re.compile(r"(?:\(\?, \.\.\.\)\s*,\s*)+\(\?, \.\.\.\)"), "(?, ...), ..."),  # multi-row VALUES
+    (re.compile(r"\s+"), " "),
+)
+
+
+def normalize_sql(statement: str) -> str:
+    """
+    Reduces a statement to its shape so that slow queries group by query, not by parameter values.
+
+    :param statement: The SQL statement.
+    :type statement: str
+
+    :return: The statement with literals and parameters replaced by ``?`` and lists collapsed.
+    :rtype: str
+    """
+    for pattern, replacement in _NORMALIZE_RULES:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+@dataclass
+class QueryStats:
+    """
+    Database cost of one request.
+    """
+    count: int = 0
+    total: float = 0.0
+    slowest: float = 0.0
+    slowest_statement: str | None = None
+
+
+_request_stats: ContextVar[QueryStats | None] = ContextVar("request_stats", default=None)
+_slow_query_ms = float("inf")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _record(statement: str, started: float, error: BaseException | None = None):
+    elapsed = time.perf_counter() - started
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.total += elapsed
+        if elapsed > stats.slowest:
+            stats.slowest, stats.slowest_statement = elapsed, statement
+    if elapsed * 1000 >= _slow_query_ms:
+        record = {"event": "slow_query", "duration_ms": round(elapsed * 1000, 2), "statement": normalize_sql(statement)}
+        if error is not None:
+            record["error"] = type(error).__name__
+        logger.warning(json.dumps(record))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record(statement, conn.info["query_started"].pop())
+
+
+def _handle_error(context):
+    # A failed statement skips after_cursor_execute, its start time would stay on the pooled connection
+    started = context.connection is not None and context.connection.info.get("query_started")
+    if started and context.statement is not None:
+        _record(context.statement, started.pop(), context.original_exception)
+
+
+def instrument_engine(engine: AsyncEngine, slow_query_ms: float):
+    """
+    Starts timing every statement of ``engine``. Statements slower than ``slow_query_ms`` are logged.
+
+    :param engine: The engine to instrument.
+    :type engine: AsyncEngine
+    :param slow_query_ms: The slow query threshold in milliseconds.
+    :type slow_query_ms: float
+    """
+    global _slow_query_ms
+    _slow_query_ms = slow_query_ms
+    if not event.contains(engine.sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine.sync_engine, "handle_error", _handle_error)
+
+
+def server_timing(stats: QueryStats) -> str:
+    """
+    Formats request statistics as a ``Server-Timing`` header value.
+
+    :param stats: The statistics of the request.
+    :type stats: QueryStats
+
+    :return: The header value.
+    :rtype: str
+    """
+    return (f'db;dur={stats.total * 1000:.2f};desc="{stats.count} queries", '
+            f'db-slowest;dur={stats.slowest * 1000:.2f}')
+
+
+class SQLInstrumentationMiddleware:
+    """
+    Collects the database cost of every HTTP request.
+
+    The totals so far are sent in a ``Server-Timing`` header with the response headers, and the final
+    totals, including queries made while a streaming body is sent, are logged once the response ends.
+
+    :param app: The wrapped ASGI application.
+    :type app: ASGIApp
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = QueryStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(stats).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stats.reset(token)
+            logger.info(json.dumps({
+                "event": "request",
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "queries": stats.count,
+                "db_ms": round(stats.total * 1000, 2),
+                "slowest_ms": round(stats.slowest * 1000, 2),
+                "slowest_statement": stats.slowest_statement and normalize_sql(stats.slowest_statement),
+            }))
@@ -0,0 +1,492 @@
+import asyncio
+import heapq
+import json
+import socket
+import time
+import traceback
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.conf.config import config
+
+# Moves the delayed jobs that are due to the ready list. KEYS are the delayed set and the ready list,
+# ARGV holds the current time and the maximum number of jobs to move.
+PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('LPUSH', KEYS[2], job)
+end
+return #due
+"""
+
+# Extends or deletes a worker lease only while it is still held by the caller. KEYS is the lease,
+# ARGV the token of the holder and, for the renewal, the new lifetime in milliseconds.
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+@dataclass
+class Job:
+    """
+    A unit of work, serialized as JSON so any worker process can run it.
+    """
+    name: str
+    kwargs: dict
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.time)
+    error: str | None = None
+
+    def dumps(self) -> str:
+        return json.dumps(asdict(self), separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, data: str | bytes) -> "Job":
+        return cls(**json.loads(data))
+
+
+@dataclass
+class Task:
+    """
+    A registered job handler with its retry and concurrency settings.
+    """
+    handler: Callable[..., Awaitable]
+    max_attempts: int
+    semaphore: asyncio.Semaphore | None
+
+
+class RedisBackend:
+    """
+    Reliable queue in Redis: a ready list, a sorted set of jobs delayed until a timestamp, one
+    processing list per worker and a dead letter list.
+
+    :meth:`pop` moves a job atomically from the ready list to the processing list of the worker, so
+    a job of a worker that crashed is not lost: :meth:`recover` puts it back when the next worker starts.
+
+    A running worker holds its name with a lease key, see :meth:`claim`, so two workers never share a
+    processing list and a starting worker knows which lists were left behind.
+
+    :param redis: The Redis client.
+    :type redis: Redis
+    :param prefix: Prefix of the keys.
+    :type prefix: str
+    :param worker: Name of the worker, must be unique among the running workers.
+    :type worker: str
+    """
+
+    def __init__(self, redis: Redis, prefix: str = "jobs", worker: str = "worker"):
+        self.redis = redis
+        self.ready = f"{prefix}:ready"
+        self.delayed = f"{prefix}:delayed"
+        self.processing = f"{prefix}:processing:{worker}"
+        self.dead_letters = f"{prefix}:dead"
+        self.prefix = prefix
+        self.lease = f"{prefix}:worker:{worker}"
+        self._token = uuid.uuid4().hex
+        self._promote = redis.register_script(PROMOTE_SCRIPT)
+        self._renew = redis.register_script(RENEW_SCRIPT)
+        self._release = redis.register_script(RELEASE_SCRIPT)
+
+    async def claim(self, ttl: float) -> bool:
+        return bool(await self.redis.set(self.lease, self._token, nx=True, px=int(ttl * 1000)))
+
+    async def renew(self, ttl: float) -> bool:
+        return bool(await self._renew(keys=[self.lease], args=[self._token, int(ttl * 1000)]))
+
+    async def release(self):
+        await self._release(keys=[self.lease], args=[self._token])
+
+    async def push(self, data: str):
+        await self.redis.lpush(self.ready, data)
+
+    async def schedule(self, data: str, at: float):
+        await self.redis.zadd(self.delayed, {data: at})
+
+    async def pop(self, timeout: float) -> str | None:
+        await self._promote(keys=[self.delayed, self.ready], args=[time.time(), 100])
+        data = await self.redis.blmove(self.ready, self.processing, timeout, "RIGHT", "LEFT")
+        return data.decode() if isinstance(data, bytes) else data
+
+    async def ack(self, data: str):
+        await self.redis.lrem(self.processing, 1, data)
+
+    async def dead(self, data: str):
+        await self.redis.lpush(self.dead_letters, data)
+
+    async def recover(self) -> int:
+        """
+        Requeues the jobs left in the processing list of this worker and of every worker whose lease
+        expired, i.e. that crashed and did not come back under the same name.
+        """
+        recovered = 0
+        orphans = [self.processing]
+        prefix = f"{self.prefix}:processing:"
+        async for key in self.redis.scan_iter(match=f"{prefix}*"):
+            key = key.decode() if isinstance(key, bytes) else key
+            if key != self.processing and not await self.redis.exists(f"{self.prefix}:worker:{key[len(prefix):]}"):
+                orphans.append(key)
+        for processing in orphans:
+            while await self.redis.lmove(processing, self.ready, "RIGHT", "LEFT") is not None:
+                recovered += 1
+        return recovered
+
+    async def sizes(self) -> dict[str, int]:
+        return {
+            "ready": await self.redis.llen(self.ready),
+            "delayed": await self.redis.zcard(self.delayed),
+            "processing": await self.redis.llen(self.processing),
+            "dead": await self.redis.llen(self.dead_letters),
+        }
+
+
+class MemoryBackend:
+    """
+    In-process stand-in for :class:`RedisBackend` with the same interface, for tests.
+    """
+
+    def __init__(self):
+        self.ready: deque[str] = deque()
+        self.delayed: list[tuple[float, str]] = []
+        self.processing: list[str] = []
+        self.dead_letters: list[str] = []
+        self._pushed = asyncio.Event()
+
+    async def push(self, data: str):
+        self.ready.appendleft(data)
+        self._pushed.set()
+
+    async def schedule(self, data: str, at: float):
+        heapq.heappush(self.delayed, (at, data))
+
+    def _promote(self):
+        now = time.time()
+        while self.delayed and self.delayed[0][0] <= now:
+            self.ready.appendleft(heapq.heappop(self.delayed)[1])
+
+    async def pop(self, timeout: float) -> str | None:
+        deadline = time.monotonic() + timeout
+        while True:
+            self._promote()
+            if self.ready:
+                data = self.ready.pop()
+                self.processing.append(data)
+                return data
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            if self.delayed:
+                remaining = min(remaining, max(self.delayed[0][0] - time.time(), 0))
+            self._pushed.clear()
+            try:
+                await asyncio.wait_for(self._pushed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def ack(self, data: str):
+        self.processing.remove(data)
+
+    async def claim(self, ttl: float) -> bool:
+        return True
+
+    async def renew(self, ttl: float) -> bool:
+        return True
+
+    async def release(self):
+        pass
+
+    async def dead(self, data: str):
+        self.dead_letters.append(data)
+
+    async def recover(self) -> int:
+        recovered = len(self.processing)
+        while self.processing:
+            self.ready.append(self.processing.pop())
+        return recovered
+
+    async def sizes(self) -> dict[str, int]:
+        return {"ready": len(self.ready), "delayed": len(self.delayed), "processing": len(self.processing),
+                "dead": len(self.dead_letters)}
+
+
+class JobQueue:
+    """
+    Registry of job handlers and producer side of the queue.
+
+    Handlers are registered with :meth:`task` under a name, producers call :meth:`enqueue` with that
+    name and JSON serializable keyword arguments, and a :class:`Worker`, usually in a separate
+    process started with ``python worker.py``, runs them.
+
+    Without a backend, or when the backend fails, :meth:`enqueue` runs the job in a task of the
+    calling process instead, like the background tasks it replaces, so the work is not dropped.
+
+    :param backend: The queue backend, or None until one is bound.
+    :type backend: RedisBackend or MemoryBackend or None
+    :param max_attempts: Default number of attempts before a job is dead-lettered.
+    :type max_attempts: int
+    :param backoff: Delay before the first retry in seconds, doubled on every further retry.
+    :type backoff: float
+    :param prefix: Prefix of the Redis keys.
+    :type prefix: str
+    :param worker: Name of this process when it runs a worker.
+    :type worker: str
+    """
+
+    def __init__(self, backend=None, max_attempts: int = 5, backoff: float = 2.0, prefix: str = "jobs",
+                 worker: str = "worker"):
+        self.backend = backend
+        self.prefix = prefix
+        self.worker = worker
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.tasks: dict[str, Task] = {}
+        self.sizes: dict[str, int] = {}
+        self._inline: set[asyncio.Task] = set()
+
+    def bind(self, redis: Redis | None):
+        """
+        Switches to a Redis backend on another client, None runs jobs in process.
+
+        :param redis: The client.
+        :type redis: Redis or None
+        """
+        self.backend = RedisBackend(redis, self.prefix, self.worker) if redis is not None else None
+
+    async def refresh_sizes(self):
+        """
+        Reads the number of ready, delayed, processing and dead jobs into :attr:`sizes`, empty without a
+        backend or when it fails.
+        """
+        try:
+            self.sizes = await self.backend.sizes() if self.backend is not None else {}
+        except (RedisError, OSError) as err:
+            print(err)
+            self.sizes = {}
+
+    async def claim_worker(self, redis: Redis, lease: float, name: str | None = None, slots: int = 64) -> str:
+        """
+        Binds to ``redis`` under a worker name nobody else holds. An explicit ``name`` is taken or
+        refused, otherwise the first free ``<hostname>-<n>`` is used.
+
+        :param redis: The client.
+        :type redis: Redis
+        :param lease: Lifetime of the name in seconds, the worker renews it while running.
+        :type lease: float
+        :param name: The name to take, or None to pick one.
+        :type name: str or None
+        :param slots: How many ``<hostname>-<n>`` names are tried.
+        :type slots: int
+
+        :return: The claimed name.
+        :rtype: str
+
+        :raises RuntimeError: If the name, or every tried name, is held by a running worker.
+        """
+        candidates = [name] if name else [f"{socket.gethostname()}-{index}" for index in range(slots)]
+        for candidate in candidates:
+            backend = RedisBackend(redis, self.prefix, candidate)
+            if await backend.claim(lease):
+                self.worker, self.backend = candidate, backend
+                return candidate
+        raise RuntimeError(f"Worker name {name} is held by a running worker" if name
+                           else f"All {slots} worker names of this host are held")
+
+    def task(self, name: str, max_attempts: int | None = None, concurrency: int | None = None):
+        """
+        Registers the decorated coroutine function as the handler of ``name``.
+
+        :param name: The job name.
+        :type name: str
+        :param max_attempts: Attempts before dead-lettering, the queue default if None.
+        :type max_attempts: int or None
+        :param concurrency: Maximum number of these jobs running at once per worker, unlimited if None.
+        :type concurrency: int or None
+
+        :return: The decorator, which returns the function unchanged.
+        :rtype: Callable
+        """
+        def register(handler):
+            self.tasks[name] = Task(handler, max_attempts or self.max_attempts,
+                                    asyncio.Semaphore(concurrency) if concurrency else None)
+            return handler
+        return register
+
+    async def enqueue(self, name: str, **kwargs) -> Job:
+        """
+        Queues a job.
+
+        :param name: The job name, registered with :meth:`task`.
+        :type name: str
+        :param kwargs: The handler arguments, must be JSON serializable.
+
+        :return: The queued job.
+        :rtype: Job
+        """
+        if name not in self.tasks:
+            raise KeyError(f"Unknown job {name}")
+        job = Job(name, kwargs)
+        data = job.dumps()
+        if self.backend is not None:
+            try:
+                await self.backend.push(data)
+                return job
+            except (RedisError, OSError) as err:
+                print(err)
+        task = asyncio.create_task(self._run_inline(job))
+        self._inline.add(task)
+        task.add_done_callback(self._inline.discard)
+        return job
+
+    async def _run_inline(self, job: Job):
+        try:
+            await self.tasks[job.name].handler(**job.kwargs)
+        except Exception as err:
+            print(err)
+
+    def retry_delay(self, attempts: int) -> float:
+        return self.backoff * 2 ** (attempts - 1)
+
+
+class Worker:
+    """
+    Takes jobs off the queue and runs up to ``concurrency`` of them at once.
+
+    A failed job is retried after an exponential backoff until it has used ``max_attempts`` of its
+    task, then it is moved to the dead letter list with the traceback of the last error. Malformed
+    jobs and jobs of unknown names are dead-lettered at once.
+
+    :param queue: The job queue with the handlers and the backend.
+    :type queue: JobQueue
+    :param concurrency: Maximum number of jobs running at once.
+    :type concurrency: int
+    :param poll_timeout: Seconds one blocking pop waits for a job.
+    :type poll_timeout: float
+    :param lease: Lifetime of the worker name claimed with :meth:`JobQueue.claim_worker`, renewed at a
+                  third of it. The worker stops if the lease is lost. None if no name was claimed.
+    :type lease: float or None
+    """
+
+    def __init__(self, queue: JobQueue, concurrency: int = 10, poll_timeout: float = 1.0,
+                 lease: float | None = None):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_timeout = poll_timeout
+        self.lease = lease
+        self.processed = 0
+        self.failed = 0
+        self.dead = 0
+        self._slots = asyncio.Semaphore(concurrency)
+        self._running: set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+    async def run(self):
+        """
+        Recovers the jobs this worker left in processing and runs jobs until :meth:`stop` is called.
+        Running jobs are awaited before returning.
+        """
+        backend = self.queue.backend
+        keeper = asyncio.create_task(self._keep_lease()) if self.lease else None
+        try:
+            await self._run(backend)
+        finally:
+            if keeper is not None:
+                keeper.cancel()
+                try:
+                    await backend.release()
+                except (RedisError, OSError) as err:
+                    print(err)
+
+    async def _keep_lease(self):
+        backend = self.queue.backend
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                if not await backend.renew(self.lease):
+                    print(f"Worker {self.queue.worker} lost its name, stopping")
+                    self.stop()
+                    return
+            except (RedisError, OSError) as err:
+                print(err)
+
+    async def _run(self, backend):
+        recovered = await backend.recover()
+        if recovered:
+            print(f"Recovered {recovered} unfinished jobs")
+        while not self._stopping.is_set():
+            await self._slots.acquire()
+            try:
+                data = await backend.pop(self.poll_timeout)
+            except (RedisError, OSError) as err:
+                self._slots.release()
+                print(err)
+                await asyncio.sleep(self.poll_timeout)
+                continue
+            if data is None:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._execute(data))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def stop(self):
+        """
+        Stops taking new jobs.
+        """
+        self._stopping.set()
+
+    async def _execute(self, data: str):
+        backend = self.queue.backend
+        try:
+            try:
+                job = Job.loads(data)
+                task = self.queue.tasks[job.name]
+            except (ValueError, TypeError, KeyError):
+                await backend.dead(data)
+                await backend.ack(data)
+                self.dead += 1
+                print(f"Dead-lettered unknown or malformed job {data[:200]}")
+                return
+            job.attempts += 1
+            try:
+                if task.semaphore is None:
+                    await task.handler(**job.kwargs)
+                else:
+                    async with task.semaphore:
+                        await task.handler(**job.kwargs)
+            except Exception:
+                self.failed += 1
+                job.error = traceback.format_exc(limit=5)
+                if job.attempts >= task.max_attempts:
+                    await backend.dead(job.dumps())
+                    self.dead += 1
+                    print(f"Job {job.name} {job.id} dead-lettered after {job.attempts} attempts")
+                else:
+                    await backend.schedule(job.dumps(), time.time() + self.queue.retry_delay(job.attempts))
+            else:
+                self.processed += 1
+            await backend.ack(data)
+        except (RedisError, OSError) as err:
+            print(err)
+        finally:
+            self._slots.release()
+
+
+job_queue = JobQueue(max_attempts=config.JOBS_MAX_ATTEMPTS, backoff=config.JOBS_RETRY_BACKOFF,
+                     prefix=config.JOBS_PREFIX)
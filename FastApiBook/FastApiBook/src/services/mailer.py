@@ -0,0 +1,238 @@
+import asyncio
+import contextlib
+import time
+from dataclasses import dataclass
+from email.message import EmailMessage
+from email.utils import formataddr
+from pathlib import Path
+
+import aiosmtplib
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
+from prometheus_client import Counter, Histogram
+
+from src.conf.config import config
+from src.services.metrics import registry
+
+EMAILS_SENT = Counter("emails_sent", "Emails accepted by the SMTP server.", registry=registry)
+EMAILS_FAILED = Counter("emails_failed", "Failed email deliveries, retried by the job queue.", ["reason"],
+                        registry=registry)
+EMAIL_SEND_LATENCY = Histogram("email_send_duration_seconds", "Time to send one email over a pooled connection.",
+                               registry=registry, buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+SMTP_CONNECTIONS = Counter("smtp_connections_opened", "SMTP connections opened by the pool.", registry=registry)
+
+TEMPLATE_DIR = Path(__file__).parent / "templates"
+
+
+@dataclass
+class Mail:
+    """
+    An email to be rendered and sent.
+    """
+    recipient: str
+    subject: str
+    template: str
+    context: dict
+
+
+class TemplateRenderer:
+    """
+    Renders the HTML templates of ``directory``. :meth:`compile` loads and compiles all of them once,
+    so no request or send pays for template parsing.
+
+    :param directory: The template directory.
+    :type directory: Path
+    """
+
+    def __init__(self, directory: Path = TEMPLATE_DIR):
+        self.environment = Environment(loader=FileSystemLoader(directory), autoescape=select_autoescape(["html"]),
+                                       auto_reload=False, enable_async=False)
+        self.templates: dict[str, Template] = {}
+
+    def compile(self):
+        """
+        Compiles every template of the directory.
+        """
+        for name in self.environment.list_templates(extensions=["html"]):
+            self.templates[name] = self.environment.get_template(name)
+
+    def render(self, name: str, context: dict) -> str:
+        """
+        Renders a template, compiling it first if :meth:`compile` has not seen it.
+
+        :param name: The template file name.
+        :type name: str
+        :param context: The template variables.
+        :type context: dict
+
+        :return: The rendered HTML.
+        :rtype: str
+        """
+        template = self.templates.get(name)
+        if template is None:
+            template = self.templates[name] = self.environment.get_template(name)
+        return template.render(context)
+
+
+class SMTPPool:
+    """
+    Keeps up to ``size`` authenticated SMTP connections open and hands them out one caller at a time.
+
+    Connections idle for longer than ``idle_timeout`` seconds are closed instead of reused, because
+    servers drop idle sessions on their side. A connection that fails while in use is discarded.
+
+    :param size: Maximum number of open connections.
+    :type size: int
+    :param idle_timeout: Seconds after which an idle connection is not reused.
+    :type idle_timeout: float
+    :param smtp_options: Keyword arguments of :class:`aiosmtplib.SMTP`.
+    """
+
+    def __init__(self, size: int = 2, idle_timeout: float = 60.0, **smtp_options):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.smtp_options = smtp_options
+        self._idle: list[tuple[float, aiosmtplib.SMTP]] = []
+        self._semaphore = asyncio.Semaphore(size)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(**self.smtp_options)
+        await smtp.connect()
+        SMTP_CONNECTIONS.inc()
+        return smtp
+
+    @staticmethod
+    async def _close(smtp: aiosmtplib.SMTP):
+        try:
+            await smtp.quit()
+        except (aiosmtplib.SMTPException, OSError):
+            smtp.close()
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        """
+        Borrows a connection, opening one if none is idle.
+
+        :return: The connected client.
+        :rtype: aiosmtplib.SMTP
+        """
+        async with self._semaphore:
+            smtp = None
+            while self._idle:
+                idle_since, candidate = self._idle.pop()
+                if candidate.is_connected and time.monotonic() - idle_since < self.idle_timeout:
+                    smtp = candidate
+                    break
+                await self._close(candidate)
+            if smtp is None:
+                smtp = await self._connect()
+            try:
+                yield smtp
+            except BaseException:
+                await self._close(smtp)
+                raise
+            if smtp.is_connected:
+                self._idle.append((time.monotonic(), smtp))
+
+    def reset(self):
+        """
+        Forgets the idle connections without closing them, for use after their event loop was closed.
+        """
+        self._idle.clear()
+        self._semaphore = asyncio.Semaphore(self.size)
+
+    async def close(self):
+        """
+        Closes all idle connections.
+        """
+        while self._idle:
+            _, smtp = self._idle.pop()
+            await self._close(smtp)
+
+
+class Mailer:
+    """
+    Renders and sends emails one at a time over an :class:`SMTPPool`. Nothing is queued or retried
+    here: the callers are background jobs, which retry and finally dead-letter a failed email, see
+    :mod:`src.services.email`.
+
+    :param pool: The SMTP connection pool.
+    :type pool: SMTPPool
+    :param renderer: The template renderer.
+    :type renderer: TemplateRenderer
+    :param sender: The ``From`` header.
+    :type sender: str
+    """
+
+    def __init__(self, pool: SMTPPool, renderer: TemplateRenderer, sender: str):
+        self.pool = pool
+        self.renderer = renderer
+        self.sender = sender
+        self._pool_loop: asyncio.AbstractEventLoop | None = None
+
+    async def close(self):
+        """
+        Closes the idle pooled connections.
+        """
+        await self.pool.close()
+
+    async def deliver(self, mail: Mail):
+        """
+        Renders and sends one email right away over the pool. The caller sees every failure and decides,
+        e.g. a job is retried and finally dead-lettered.
+
+        :param mail: The email.
+        :type mail: Mail
+
+        :raises aiosmtplib.SMTPException: If the server rejected the email.
+        :raises OSError: If the server could not be reached.
+        :raises Exception: If the email could not be rendered.
+        """
+        self._use_loop()
+        try:
+            message = self._message(mail)
+        except Exception:
+            EMAILS_FAILED.labels("render").inc()
+            raise
+        try:
+            async with self.pool.connection() as smtp:
+                started = time.perf_counter()
+                await smtp.send_message(message)
+        except (aiosmtplib.SMTPException, OSError):
+            EMAILS_FAILED.labels("send").inc()
+            raise
+        EMAIL_SEND_LATENCY.observe(time.perf_counter() - started)
+        EMAILS_SENT.inc()
+
+    def _use_loop(self):
+        # Pooled connections belong to the event loop that opened them
+        loop = asyncio.get_running_loop()
+        if self._pool_loop is not loop:
+            if self._pool_loop is not None:
+                self.pool.reset()
+            self._pool_loop = loop
+
+    def _message(self, mail: Mail) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = mail.recipient
+        message["Subject"] = mail.subject
+        message.set_content(self.renderer.render(mail.template, mail.context), subtype="html")
+        return message
+
+
+mailer = Mailer(
+    SMTPPool(
+        size=config.MAIL_POOL_SIZE,
+        idle_timeout=config.MAIL_IDLE_TIMEOUT,
+        hostname=config.MAIL_SERVER,
+        port=config.MAIL_PORT,
+        username=config.MAIL_USERNAME if config.MAIL_USE_CREDENTIALS else None,
+        password=config.MAIL_PASSWORD if config.MAIL_USE_CREDENTIALS else None,
+        use_tls=config.MAIL_SSL_TLS,
+        start_tls=config.MAIL_STARTTLS,
+        validate_certs=config.MAIL_VALIDATE_CERTS,
+        timeout=config.MAIL_TIMEOUT,
+    ),
+    TemplateRenderer(),
+    sender=formataddr((config.MAIL_FROM_NAME, config.MAIL_FROM)),
+)
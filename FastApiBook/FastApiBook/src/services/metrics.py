@@ -0,0 +1,137 @@
+import time
+
+from prometheus_client import CollectorRegistry, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from starlette.routing import Match
+
+registry = CollectorRegistry()
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.",
+    ["method", "route", "status"], registry=registry,
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being processed.", registry=registry)
+REDIS_LATENCY = Histogram(
+    "redis_command_duration_seconds", "Redis command latency.", ["command"], registry=registry,
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+
+
+def route_template(scope) -> str:
+    """
+    Returns the path template of the route that handled a request, e.g. ``/api/address_book/{contact_id}``.
+
+    Raw paths would give every contact its own time series, so unmatched requests share one label.
+
+    :param scope: The ASGI scope after the request was handled.
+    :type scope: dict
+
+    :return: The route template.
+    :rtype: str
+    """
+    route = scope.get("route")
+    if route is not None:
+        return route.path_format
+    for route in scope["app"].routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path_format", route.path)
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Records the latency of every HTTP request by route template and the number of requests in flight.
+
+    :param app: The wrapped ASGI application.
+    :type app: ASGIApp
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            REQUEST_LATENCY.labels(scope["method"], route_template(scope), str(status_code)).observe(
+                time.perf_counter() - started)
+
+
+class StateCollector:
+    """
+    Reads pool, cache, rate limiter and job queue state at scrape time, so the request path pays nothing
+    for it.
+
+    Hit ratios are ``hits / (hits + misses)`` of the cache counters. The job queue sizes are the ones of
+    the last :meth:`JobQueue.refresh_sizes`; ``processing`` is left out, it only counts the jobs of one
+    worker.
+
+    :param sessionmanager: The database session manager.
+    :type sessionmanager: DatabaseSessionManager
+    :param caches: The caches by name, anything with ``hits``, ``misses`` and ``errors`` counters.
+    :type caches: dict
+    :param rate_limiter: The rate limiter.
+    :type rate_limiter: RateLimiter
+    :param job_queue: The job queue, or None.
+    :type job_queue: JobQueue or None
+    """
+
+    def __init__(self, sessionmanager, caches: dict, rate_limiter, job_queue=None):
+        self.sessionmanager = sessionmanager
+        self.caches = caches
+        self.rate_limiter = rate_limiter
+        self.job_queue = job_queue
+
+    def collect(self):
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Connections in use.", labels=["engine"])
+        overflow = GaugeMetricFamily("db_pool_overflow", "Connections above pool_size.", labels=["engine"])
+        size = GaugeMetricFamily("db_pool_size", "Configured pool size.", labels=["engine"])
+        for index, engine in enumerate(self.sessionmanager.engines):
+            name = "primary" if index == 0 else f"replica{index - 1}"
+            pool = engine.pool
+            if not hasattr(pool, "checkedout"):
+                continue
+            checked_out.add_metric([name], pool.checkedout())
+            overflow.add_metric([name], max(pool.overflow(), 0))
+            size.add_metric([name], pool.size())
+        yield from (checked_out, overflow, size)
+
+        hits = CounterMetricFamily("cache_hits", "Cache hits.", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache misses.", labels=["cache"])
+        errors = CounterMetricFamily("cache_errors", "Cache Redis errors.", labels=["cache"])
+        for name, cache in self.caches.items():
+            hits.add_metric([name], cache.hits)
+            misses.add_metric([name], cache.misses)
+            errors.add_metric([name], cache.errors)
+        yield from (hits, misses, errors)
+
+        rejections = CounterMetricFamily("rate_limit_rejections", "Requests rejected by the rate limiter.",
+                                         labels=["budget"])
+        for budget, count in self.rate_limiter.rejections.items():
+            rejections.add_metric([budget], count)
+        yield rejections
+        yield CounterMetricFamily("rate_limit_sync_errors", "Failed rate limiter syncs with Redis.",
+                                  value=self.rate_limiter.errors)
+
+        if self.job_queue is not None:
+            depth = GaugeMetricFamily("job_queue_depth", "Jobs waiting in the queue.", labels=["state"])
+            for state in ("ready", "delayed", "dead"):
+                if state in self.job_queue.sizes:
+                    depth.add_metric([state], self.job_queue.sizes[state])
+            yield depth
@@ -0,0 +1,94 @@
+import base64
+import json
+
+SORT_KEYS = {
+    "id": ("id",),
+    "surname": ("surname", "id"),
+}
+
+# The JSON type of each key, a cursor value of another type would be bound against the wrong column type
+KEY_TYPES = {
+    "id": int,
+    "surname": str,
+}
+
+
+def encode_cursor(sort: str, contact) -> str:
+    """
+    Builds an opaque keyset cursor that points right after the given contact.
+
+    :param sort: The sort key the page was ordered by.
+    :type sort: str
+    :param contact: The last contact of the current page.
+    :type contact: Contact or ContactResponse or Row
+
+    :return: URL-safe cursor token.
+    :rtype: str
+    """
+    payload = [sort, *(getattr(contact, key) for key in SORT_KEYS[sort])]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str, sort: str) -> tuple:
+    """
+    Decodes a cursor produced by :func:`encode_cursor`.
+
+    :param token: The cursor token received from the client.
+    :type token: str
+    :param sort: The sort key of the current request.
+    :type sort: str
+
+    :return: The keyset values to continue after.
+    :rtype: tuple
+
+    :raises ValueError: If the token is malformed or was issued for another sort key.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+    except (ValueError, TypeError) as err:
+        raise ValueError("Invalid cursor") from err
+    if not isinstance(payload, list) or len(payload) != len(SORT_KEYS.get(sort, ())) + 1 or payload[0] != sort:
+        raise ValueError("Invalid cursor")
+    values = tuple(payload[1:])
+    for key, value in zip(SORT_KEYS[sort], values):
+        if not isinstance(value, KEY_TYPES[key]) or isinstance(value, bool):
+            raise ValueError("Invalid cursor")
+    return values
+
+
+def encode_sync_token(seq: int) -> str:
+    """
+    Builds an opaque delta sync token that points right after the given change position.
+
+    :param seq: The position in the change sequence of the user the client has every change up to.
+    :type seq: int
+
+    :return: URL-safe sync token.
+    :rtype: str
+    """
+    raw = json.dumps(["sync", seq], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_sync_token(token: str) -> int:
+    """
+    Decodes a token produced by :func:`encode_sync_token`.
+
+    :param token: The sync token received from the client.
+    :type token: str
+
+    :return: The change position to continue after.
+    :rtype: int
+
+    :raises ValueError: If the token is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        kind, seq = json.loads(raw)
+    except (ValueError, TypeError) as err:
+        raise ValueError("Invalid sync token") from err
+    if kind != "sync" or not isinstance(seq, int) or isinstance(seq, bool) or seq < 0:
+        raise ValueError("Invalid sync token")
+    return seq
@@ -0,0 +1,95 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi_users.password import PasswordHelper
+
+from src.conf.config import config
+
+_password_helper = PasswordHelper()
+
+
+def _hash(password: str) -> str:
+    return _password_helper.hash(password)
+
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return _password_helper.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification of :class:`PasswordHelper` off the event loop.
+
+    Each bcrypt call burns 100-300 ms of CPU. In ``thread`` mode it runs in a thread pool (bcrypt
+    releases the GIL), in ``process`` mode in a process pool, and in ``inline`` mode on the event loop
+    as fastapi-users does by default. At most ``concurrency`` calls are queued on the executor, further
+    callers wait on the event loop without blocking it.
+
+    :param kind: ``thread``, ``process`` or ``inline``.
+    :type kind: str
+    :param workers: Number of executor workers.
+    :type workers: int
+    :param concurrency: Maximum number of in-flight hashing calls.
+    :type concurrency: int
+    """
+
+    def __init__(self, kind: str = "thread", workers: int = 4, concurrency: int = 8):
+        if kind not in ("thread", "process", "inline"):
+            raise ValueError(f"Unknown password hash executor: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.concurrency = concurrency
+        self._executor: Executor | None = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    @property
+    def executor(self) -> Executor | None:
+        if self._executor is None and self.kind != "inline":
+            executor_class = ProcessPoolExecutor if self.kind == "process" else ThreadPoolExecutor
+            self._executor = executor_class(max_workers=self.workers)
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self.kind == "inline":
+            return func(*args)
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def hash(self, password: str) -> str:
+        """
+        Hashes a password.
+
+        :param password: The plain password.
+        :type password: str
+
+        :return: The bcrypt hash.
+        :rtype: str
+        """
+        return await self._run(_hash, password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verifies a password and returns a new hash if the stored one uses outdated settings.
+
+        :param plain_password: The password to check.
+        :type plain_password: str
+        :param hashed_password: The stored hash.
+        :type hashed_password: str
+
+        :return: Whether the password matches, and the upgraded hash or None.
+        :rtype: Tuple[bool, Optional[str]]
+        """
+        return await self._run(_verify_and_update, plain_password, hashed_password)
+
+    def shutdown(self):
+        """
+        Stops the executor workers, they are started again on the next call.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(config.PASSWORD_HASH_EXECUTOR, config.PASSWORD_HASH_WORKERS,
+                                 config.PASSWORD_HASH_CONCURRENCY)
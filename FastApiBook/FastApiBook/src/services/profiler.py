@@ -0,0 +1,424 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import jwt
+from fastapi_users.jwt import decode_jwt, generate_jwt
+
+from src.conf.config import config
+
+TOKEN_AUDIENCE = "fastapi-users:profiler"
+TOKEN_HEADER = b"x-profile-token"
+TOKEN_QUERY = "profile_token"
+
+# Module prefixes by category, the innermost categorized frame of a sample decides.
+CATEGORIES = (
+    ("pydantic", ("pydantic", "pydantic_core", "fastapi._compat", "fastapi.encoders")),
+    ("sqlalchemy", ("sqlalchemy", "asyncpg", "aiosqlite")),
+    ("redis", ("redis",)),
+    ("route", ("src", "main")),
+)
+# The ASGI middlewares of the app are in every stack, they must not turn framework time into route time.
+UNCATEGORIZED = ("src.services.profiler", "src.services.metrics", "src.services.instrumentation")
+
+
+def issue_token(user_id, lifetime: int) -> str:
+    """
+    Issues a token that enables profiling of the requests that carry it.
+
+    :param user_id: The superuser requesting the token.
+    :type user_id: UUID
+    :param lifetime: Lifetime of the token in seconds.
+    :type lifetime: int
+
+    :return: The signed token.
+    :rtype: str
+    """
+    return generate_jwt({"sub": str(user_id), "aud": TOKEN_AUDIENCE}, config.SECRET_KEY_JWT, lifetime)
+
+
+def verify_token(token: str) -> bool:
+    """
+    Checks the signature, audience and expiry of a profiling token.
+
+    :param token: The token from the request.
+    :type token: str
+
+    :return: Whether the token is valid.
+    :rtype: bool
+    """
+    try:
+        decode_jwt(token, config.SECRET_KEY_JWT, [TOKEN_AUDIENCE])
+    except jwt.PyJWTError:
+        return False
+    return True
+
+
+def frame_label(frame) -> str:
+    """
+    Formats a frame as ``module:function`` without the line number, so samples of one function merge.
+    """
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_qualname}"
+
+
+def categorize(labels: list[str]) -> str:
+    """
+    Attributes a sample to ``pydantic``, ``sqlalchemy``, ``redis``, ``route``, ``framework``, or ``idle``
+    when the event loop is waiting for I/O.
+
+    :param labels: The frame labels of the sample, outermost first.
+    :type labels: list[str]
+
+    :return: The category of the innermost frame that belongs to one.
+    :rtype: str
+    """
+    if labels and labels[-1].startswith("selectors:"):
+        return "idle"
+    for label in reversed(labels):
+        module = label.partition(":")[0]
+        if module in UNCATEGORIZED:
+            continue
+        for category, prefixes in CATEGORIES:
+            if any(module == prefix or module.startswith(prefix + ".") for prefix in prefixes):
+                return category
+    return "framework"
+
+
+def thread_stack(thread_id: int) -> list:
+    """
+    Returns the frames a thread is executing, outermost first.
+    """
+    frame = sys._current_frames().get(thread_id)
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def await_stack(task: asyncio.Task) -> list:
+    """
+    Returns the frames of a suspended task by following its ``await`` chain, outermost first.
+    """
+    frames = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "ag_frame", None) \
+            or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "ag_await", None) \
+            or getattr(awaitable, "gi_yieldfrom", None)
+    return frames
+
+
+class Sampler(threading.Thread):
+    """
+    Samples the event loop thread every ``interval`` seconds and sums the time per collapsed stack.
+
+    Each sample is weighted with the time since the previous one: while the loop thread holds the GIL
+    the sampler only wakes up every ``sys.getswitchinterval()`` seconds, whatever ``interval`` says.
+
+    With a ``task``, only that task is profiled: while it runs, the stack of the loop thread is taken,
+    while it waits, its ``await`` chain is, so the profile covers wall time including database and
+    Redis waits. Without a task, whatever the loop thread executes is sampled.
+
+    :param loop_thread: Identifier of the event loop thread.
+    :type loop_thread: int
+    :param loop: The event loop.
+    :type loop: asyncio.AbstractEventLoop
+    :param task: The task to profile, or None for the whole loop.
+    :type task: asyncio.Task or None
+    :param interval: Seconds between samples.
+    :type interval: float
+    """
+
+    def __init__(self, loop_thread: int, loop: asyncio.AbstractEventLoop, task: asyncio.Task | None,
+                 interval: float):
+        super().__init__(daemon=True, name="profiler")
+        self.loop_thread = loop_thread
+        self.loop = loop
+        self.task = task
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()  # microseconds per stack
+        self.categories: Counter[str] = Counter()  # seconds per category
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def sample(self, weight: float):
+        if self.task is None or asyncio.current_task(self.loop) is self.task:
+            frames = thread_stack(self.loop_thread)
+        else:
+            frames = await_stack(self.task)
+        if not frames:
+            return
+        labels = [frame_label(frame) for frame in frames]
+        with self._lock:
+            self.stacks[";".join(labels)] += max(1, round(weight * 1_000_000))
+            self.categories[categorize(labels)] += weight
+
+    def run(self):
+        last = time.perf_counter()
+        while not self._stopped.wait(self.interval):
+            now = time.perf_counter()
+            try:
+                self.sample(now - last)
+            except (RuntimeError, ValueError):  # the stack changed while it was read
+                pass
+            last = now
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def drain(self) -> tuple[Counter, Counter]:
+        """
+        Returns the samples collected so far and starts over.
+
+        :return: The microseconds per collapsed stack and the seconds per category.
+        :rtype: tuple[Counter, Counter]
+        """
+        with self._lock:
+            stacks, categories = self.stacks, self.categories
+            self.stacks, self.categories = Counter(), Counter()
+        return stacks, categories
+
+
+def collapsed(stacks: Counter) -> str:
+    """
+    Formats stacks in the collapsed format read by ``flamegraph.pl`` and speedscope, weights in microseconds.
+    """
+    return "".join(f"{stack} {weight}\n" for stack, weight in stacks.most_common())
+
+
+def breakdown(categories: Counter) -> dict:
+    """
+    Converts the seconds per category into milliseconds.
+    """
+    return {category: round(seconds * 1000, 1) for category, seconds in categories.most_common()}
+
+
+def modified(path: Path) -> float:
+    """
+    Returns when a profile was written, 0 when another process already removed it.
+    """
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def prune(newest_first: list[Path], keep: int, expiring, max_age: float):
+    """
+    Removes the profiles in ``newest_first`` beyond the first ``keep`` and those in ``expiring`` written more
+    than ``max_age`` seconds ago, both the ``.collapsed`` and the ``.json`` file.
+
+    :param newest_first: The ``.collapsed`` files the count applies to, newest first.
+    :type newest_first: list[Path]
+    :param keep: How many of ``newest_first`` are kept.
+    :type keep: int
+    :param expiring: The ``.collapsed`` files the age applies to.
+    :type expiring: Iterable[Path]
+    :param max_age: Seconds after which a profile is removed.
+    :type max_age: float
+    """
+    expired = time.time() - max_age
+    stale = {path.with_suffix("") for path in newest_first[keep:]}
+    stale.update(path.with_suffix("") for path in expiring if modified(path) < expired)
+    for name in stale:
+        for suffix in (".collapsed", ".json"):
+            name.with_suffix(suffix).unlink(missing_ok=True)
+
+
+class ProfilerMiddleware:
+    """
+    Profiles requests that carry a valid profiling token in the ``X-Profile-Token`` header or the
+    ``profile_token`` query parameter. Tokens are issued to superusers by ``POST /api/profiler/token``.
+
+    The response gets ``X-Profile-Id`` and an ``X-Profile-Summary`` with milliseconds per category.
+    The complete profile is written to ``<directory>/<id>.collapsed`` and ``<id>.json`` when the
+    response ends. Requests without a token only pay for a header lookup.
+
+    Like the background dumps, only the last ``max_profiles`` request profiles are kept, whichever process
+    wrote them, and those older than ``max_age`` are removed.
+
+    :param app: The wrapped ASGI application.
+    :type app: ASGIApp
+    :param directory: Where profiles are written.
+    :type directory: str
+    :param interval: Seconds between samples.
+    :type interval: float
+    :param max_profiles: Request profiles kept.
+    :type max_profiles: int
+    :param max_age: Seconds after which a request profile is removed.
+    :type max_age: float
+    """
+
+    def __init__(self, app, directory: str = "profiles", interval: float = 0.001, max_profiles: int = 100,
+                 max_age: float = 86400.0):
+        self.app = app
+        self.directory = Path(directory)
+        self.interval = interval
+        self.max_profiles = max_profiles
+        self.max_age = max_age
+
+    @staticmethod
+    def _token(scope) -> str | None:
+        for name, value in scope["headers"]:
+            if name == TOKEN_HEADER:
+                return value.decode("latin-1")
+        if TOKEN_QUERY.encode() in scope["query_string"]:
+            return parse_qs(scope["query_string"].decode("latin-1")).get(TOKEN_QUERY, [None])[0]
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = self._token(scope)
+        if token is None or not verify_token(token):
+            await self.app(scope, receive, send)
+            return
+        profile_id = uuid.uuid4().hex
+        sampler = Sampler(threading.get_ident(), asyncio.get_running_loop(), asyncio.current_task(), self.interval)
+        stacks, categories = Counter(), Counter()
+        started = time.perf_counter()
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                batch_stacks, batch_categories = sampler.drain()
+                stacks.update(batch_stacks)
+                categories.update(batch_categories)
+                summary = ";".join(f"{key}={value}" for key, value in breakdown(categories).items())
+                headers = list(message.get("headers", []))
+                headers += [(b"x-profile-id", profile_id.encode()), (b"x-profile-summary", summary.encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            sampler.stop()
+            batch_stacks, batch_categories = sampler.drain()
+            stacks.update(batch_stacks)
+            categories.update(batch_categories)
+            await asyncio.to_thread(self._write, profile_id, scope, stacks, categories,
+                                    time.perf_counter() - started)
+
+    def _write(self, profile_id: str, scope, stacks: Counter, categories: Counter, duration: float):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / f"{profile_id}.collapsed").write_text(collapsed(stacks))
+        (self.directory / f"{profile_id}.json").write_text(json.dumps({
+            "id": profile_id,
+            "method": scope["method"],
+            "path": scope["path"],
+            "duration_ms": round(duration * 1000, 1),
+            "interval_ms": self.interval * 1000,
+            "sampled_ms": round(sum(categories.values()) * 1000, 1),
+            "categories_ms": breakdown(categories),
+        }, indent=2))
+        self.prune()
+
+    def prune(self):
+        """
+        Removes the request profiles beyond ``max_profiles`` and those older than ``max_age``.
+        """
+        profiles = [path for path in self.directory.glob("*.collapsed") if not path.name.startswith("background-")]
+        profiles.sort(key=modified, reverse=True)
+        prune(profiles, self.max_profiles, profiles, self.max_age)
+
+
+class BackgroundProfiler:
+    """
+    Low-rate sampler of the whole event loop that writes the aggregated stacks to
+    ``<directory>/background-<timestamp>-<pid>.collapsed`` every ``dump_interval`` seconds.
+
+    Each process keeps its last ``max_dumps`` dumps, and dumps older than ``max_age`` are removed
+    whichever process wrote them, so stopped workers do not leave theirs behind forever.
+
+    :param directory: Where profiles are written.
+    :type directory: str
+    :param interval: Seconds between samples.
+    :type interval: float
+    :param dump_interval: Seconds between dumps.
+    :type dump_interval: float
+    :param max_dumps: Dumps kept per process.
+    :type max_dumps: int
+    :param max_age: Seconds after which any dump is removed.
+    :type max_age: float
+    """
+
+    def __init__(self, directory: str = "profiles", interval: float = 0.05, dump_interval: float = 60.0,
+                 max_dumps: int = 60, max_age: float = 86400.0):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.dump_interval = dump_interval
+        self.max_dumps = max_dumps
+        self.max_age = max_age
+        self._sampler: Sampler | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        """
+        Starts sampling the running event loop.
+        """
+        if self._sampler is None:
+            self._sampler = Sampler(threading.get_ident(), asyncio.get_running_loop(), None, self.interval)
+            self._sampler.start()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.dump_interval)
+            await asyncio.to_thread(self.dump)
+
+    def dump(self):
+        """
+        Writes the samples collected since the last dump.
+        """
+        stacks, categories = self._sampler.drain()
+        if not stacks:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"background-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        (self.directory / f"{name}.collapsed").write_text(collapsed(stacks))
+        (self.directory / f"{name}.json").write_text(json.dumps({
+            "interval_ms": self.interval * 1000,
+            "sampled_ms": round(sum(categories.values()) * 1000, 1),
+            "categories_ms": breakdown(categories),
+        }, indent=2))
+        self.prune()
+
+    def prune(self):
+        """
+        Removes the dumps of this process beyond ``max_dumps`` and every dump older than ``max_age``.
+        """
+        own = sorted(self.directory.glob(f"background-*-{os.getpid()}.collapsed"), reverse=True)
+        prune(own, self.max_dumps, self.directory.glob("background-*.collapsed"), self.max_age)
+
+    async def stop(self):
+        """
+        Stops sampling and writes what was left.
+        """
+        if self._sampler is None:
+            return
+        self._task.cancel()
+        self._sampler.stop()
+        await asyncio.to_thread(self.dump)
+        self._sampler = None
+        self._task = None
+
+
+background_profiler = BackgroundProfiler(config.PROFILER_DIR, config.PROFILER_BACKGROUND_INTERVAL,
+                                         config.PROFILER_BACKGROUND_DUMP_INTERVAL, config.PROFILER_BACKGROUND_MAX_DUMPS,
+                                         config.PROFILER_BACKGROUND_MAX_AGE)
@@ -0,0 +1,244 @@
+import asyncio
+import math
+import time
+from dataclasses import dataclass
+
+from fastapi import Depends, HTTPException, status
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.conf.config import config
+from src.models.models import User
+from src.services.auth import current_active_user
+
+# Adds the local increments of one sync to the shared window counters and returns the new totals.
+# KEYS are window keys, ARGV holds an (increment, ttl) pair per key.
+SYNC_SCRIPT = """
+local totals = {}
+for i, key in ipairs(KEYS) do
+    totals[i] = redis.call('INCRBY', key, ARGV[2 * i - 1])
+    redis.call('EXPIRE', key, ARGV[2 * i])
+end
+return totals
+"""
+
+
+@dataclass
+class Budget:
+    """
+    Allows ``times`` requests per ``seconds`` per user.
+    """
+    times: int
+    seconds: float
+
+    @property
+    def rate(self) -> float:
+        return self.times / self.seconds
+
+
+@dataclass
+class _Bucket:
+    tokens: float
+    updated: float
+    window: int
+    remote: int = 0  # requests of all workers in the window as of the last sync, ours included
+    pending: int = 0  # requests admitted here since the last sync
+    touched: bool = True  # used since the last sync
+
+
+class RateLimiter:
+    """
+    Per-user rate limiter that decides locally and synchronizes with Redis in the background.
+
+    Every worker keeps a token bucket per user and budget, so admitting a request costs no network
+    round trip. Admitted requests are counted and every ``sync_interval`` seconds all counts are
+    added to fixed-window counters in Redis by one Lua script. The returned totals cap what the
+    worker admits for the rest of the window, which keeps the budget global up to one sync interval
+    of drift.
+
+    If Redis fails the limiter carries on with the local buckets only and skips Redis for
+    ``retry_after`` seconds. Any other error of a synchronization is counted and logged, and the
+    background task retries with a growing delay.
+
+    :param redis: The Redis client, or None to limit per worker only.
+    :type redis: Redis or None
+    :param budgets: The budgets by name, e.g. ``read`` and ``write``.
+    :type budgets: dict[str, Budget]
+    :param sync_interval: Seconds between synchronizations with Redis.
+    :type sync_interval: float
+    :param retry_after: Seconds to bypass Redis after an error.
+    :type retry_after: float
+    """
+
+    def __init__(self, redis: Redis | None, budgets: dict[str, Budget], sync_interval: float = 1.0,
+                 retry_after: float = 5.0):
+        self.redis = redis
+        self.budgets = budgets
+        self.sync_interval = sync_interval
+        self.retry_after = retry_after
+        self.rejections = {name: 0 for name in budgets}
+        self.errors = 0
+        self._buckets: dict[tuple[str, str], _Bucket] = {}
+        self._script = redis.register_script(SYNC_SCRIPT) if redis is not None else None
+        self._down_until = 0.0
+        self._task: asyncio.Task | None = None
+
+    def bind(self, redis: Redis | None):
+        """
+        Switches to another Redis client, None limits per worker only.
+
+        :param redis: The client, usually sharing the application pool.
+        :type redis: Redis or None
+        """
+        self.redis = redis
+        self._script = redis.register_script(SYNC_SCRIPT) if redis is not None else None
+        self._down_until = 0.0
+
+    @staticmethod
+    def _window(budget: Budget, now: float) -> int:
+        return int(now // budget.seconds)
+
+    def hit(self, name: str, key: str) -> float:
+        """
+        Takes one request from the budget of ``key``.
+
+        :param name: The budget name.
+        :type name: str
+        :param key: The client key, e.g. the user ID.
+        :type key: str
+
+        :return: 0 if the request is allowed, otherwise the seconds until it would be.
+        :rtype: float
+        """
+        budget = self.budgets[name]
+        now, wall = time.monotonic(), time.time()
+        window = self._window(budget, wall)
+        bucket = self._buckets.get((name, key))
+        if bucket is None:
+            bucket = self._buckets[(name, key)] = _Bucket(tokens=budget.times, updated=now, window=window)
+        bucket.tokens = min(budget.times, bucket.tokens + (now - bucket.updated) * budget.rate)
+        bucket.updated = now
+        bucket.touched = True
+        if bucket.window != window:
+            bucket.window, bucket.remote = window, 0
+        if bucket.tokens < 1:
+            self.rejections[name] += 1
+            return (1 - bucket.tokens) / budget.rate
+        if bucket.remote + bucket.pending >= budget.times:
+            self.rejections[name] += 1
+            return (window + 1) * budget.seconds - wall
+        bucket.tokens -= 1
+        bucket.pending += 1
+        return 0.0
+
+    async def sync(self):
+        """
+        Pushes the local counts of recently used buckets to Redis and pulls the global totals.
+        """
+        now, wall = time.monotonic(), time.time()
+        for bucket_key, bucket in list(self._buckets.items()):
+            budget = self.budgets[bucket_key[0]]
+            idle = now - bucket.updated
+            if not bucket.touched and not bucket.pending and idle > budget.seconds:
+                del self._buckets[bucket_key]
+        batch = [(bucket_key, bucket) for bucket_key, bucket in self._buckets.items()
+                 if bucket.touched or bucket.pending]
+        if not batch:
+            return
+        if self._script is None or now < self._down_until:
+            for _, bucket in batch:
+                bucket.pending = 0
+                bucket.touched = False
+            return
+        keys, args, sent = [], [], []
+        for (name, key), bucket in batch:
+            budget = self.budgets[name]
+            if bucket.window != self._window(budget, wall):
+                bucket.pending = 0  # the window is over, its count no longer matters
+                bucket.touched = False
+                continue
+            keys.append(f"ratelimit:{name}:{key}:{bucket.window}")
+            args += [bucket.pending, math.ceil(budget.seconds) * 2]
+            sent.append((bucket, bucket.window, bucket.pending))
+            bucket.touched = False
+        if not keys:
+            return
+        try:
+            totals = await self._script(keys=keys, args=args)
+        except (RedisError, OSError) as err:
+            self.errors += 1
+            self._down_until = time.monotonic() + self.retry_after
+            print(err)
+            for bucket, _, count in sent:
+                bucket.pending -= count
+            return
+        for (bucket, window, count), total in zip(sent, totals):
+            bucket.pending -= count
+            if bucket.window == window:
+                bucket.remote = int(total)
+
+    async def _run(self):
+        failures = 0
+        while True:
+            # Back off after unexpected errors, doubling up to ``retry_after``.
+            await asyncio.sleep(min(self.sync_interval * 2 ** failures, max(self.sync_interval, self.retry_after)))
+            try:
+                await self.sync()
+            except Exception as err:  # a bug must not end the synchronization and leave the limiter local-only
+                self.errors += 1
+                failures = min(failures + 1, 16)
+                print(err)
+            else:
+                failures = 0
+
+    def start(self):
+        """
+        Starts the background synchronization task.
+        """
+        if self._task is None and self.redis is not None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the background task and pushes the remaining counts.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.sync()
+
+    def limit(self, name: str):
+        """
+        Builds a route dependency that applies the ``name`` budget to the current user.
+
+        Rejected requests get a 429 response with a ``Retry-After`` header.
+
+        :param name: The budget name.
+        :type name: str
+
+        :return: The dependency.
+        :rtype: Callable
+        """
+        if name not in self.budgets:
+            raise ValueError(f"Unknown rate limit budget: {name}")
+
+        async def dependency(user: User = Depends(current_active_user)):
+            wait = self.hit(name, str(user.id))
+            if wait:
+                raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too Many Requests",
+                                    headers={"Retry-After": str(math.ceil(wait))})
+
+        return dependency
+
+
+# The Redis client is bound in the application lifespan, see ``main.lifespan``.
+rate_limiter = RateLimiter(
+    None,
+    budgets={
+        "read": Budget(config.RATE_LIMIT_READ_TIMES, config.RATE_LIMIT_READ_SECONDS),
+        "write": Budget(config.RATE_LIMIT_WRITE_TIMES, config.RATE_LIMIT_WRITE_SECONDS),
+    },
+    sync_interval=config.RATE_LIMIT_SYNC_INTERVAL,
+)
+rate_limit_read = rate_limiter.limit("read")
+rate_limit_write = rate_limiter.limit("write")
@@ -0,0 +1,82 @@
+from typing import Any
+
+from fastapi import HTTPException, Response, status
+from pydantic import TypeAdapter
+
+from src.schemas.contact import ContactResponse
+
+# Columns of a contact response in the order of the schema, selected instead of whole ORM objects
+CONTACT_COLUMNS = tuple(ContactResponse.model_fields)
+
+rows_adapter = TypeAdapter(list[dict[str, Any]])
+row_adapter = TypeAdapter(dict[str, Any])
+
+
+def parse_fields(fields: str | None) -> tuple[str, ...]:
+    """
+    Parses a comma separated ``fields`` query parameter into response columns.
+
+    :param fields: E.g. ``id,name,number``, all columns if None.
+    :type fields: str or None
+
+    :return: The requested columns in the order of :class:`ContactResponse`.
+    :rtype: tuple[str, ...]
+
+    :raises HTTPException: If a field is not part of the response (HTTP 400 BAD REQUEST).
+    """
+    if fields is None:
+        return CONTACT_COLUMNS
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested.difference(CONTACT_COLUMNS)
+    if unknown or not requested:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"UNKNOWN FIELDS: {', '.join(sorted(unknown))}" if unknown else "NO FIELDS")
+    return tuple(column for column in CONTACT_COLUMNS if column in requested)
+
+
+def with_columns(fields: tuple[str, ...], extra: tuple[str, ...]) -> tuple[str, ...]:
+    """
+    Appends the ``extra`` columns missing from ``fields``, e.g. the keys a cursor is built from.
+    They are selected but left out by :func:`dump_rows`, which zips only ``fields``.
+    """
+    return fields + tuple(column for column in extra if column not in fields)
+
+
+def dump_rows(rows, columns: tuple[str, ...] = CONTACT_COLUMNS) -> bytes:
+    """
+    Serializes the rows of a column-only select to a JSON array of objects in one pass.
+
+    The rows come from the database and already have the types of :class:`ContactResponse`, so they
+    are not validated again; the schema still documents the response in OpenAPI.
+
+    :param rows: The rows, tuples in the order of ``columns``. Values after the last column are ignored.
+    :type rows: list[Row]
+    :param columns: The columns to write.
+    :type columns: tuple[str, ...]
+
+    :return: The JSON document.
+    :rtype: bytes
+    """
+    return rows_adapter.dump_json([dict(zip(columns, row)) for row in rows])
+
+
+def dump_row(row, columns: tuple[str, ...] = CONTACT_COLUMNS) -> bytes:
+    """
+    Serializes one row like :func:`dump_rows`.
+    """
+    return row_adapter.dump_json(dict(zip(columns, row)))
+
+
+def json_response(body: bytes, headers: dict[str, str] | None = None) -> Response:
+    """
+    Wraps an already serialized JSON body, FastAPI sends it without running ``response_model``.
+
+    :param body: The JSON document.
+    :type body: bytes
+    :param headers: Extra response headers.
+    :type headers: dict[str, str] or None
+
+    :return: The response.
+    :rtype: Response
+    """
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,186 @@
+import json
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from pydantic_core import to_json
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy.orm import make_transient_to_detached
+
+from src.conf.config import config
+from src.models.models import User
+
+CACHED_FIELDS = ("id", "email", "username", "avatar", "refresh_token", "is_active", "is_superuser", "is_verified",
+                 "created_at", "updated_at")
+
+
+def dump_user(user: User) -> bytes:
+    """
+    Serializes the fields needed to authorize a request as compact JSON. The password hash is left out.
+
+    :param user: The user to serialize.
+    :type user: User
+
+    :return: The JSON document.
+    :rtype: bytes
+    """
+    return to_json({field: getattr(user, field) for field in CACHED_FIELDS})
+
+
+def load_user(data: bytes | str) -> User:
+    """
+    Rebuilds a detached :class:`User` from :func:`dump_user` output.
+
+    The instance carries its identity, so ``session.add(user)`` attaches it without a SELECT.
+
+    :param data: The JSON document.
+    :type data: bytes or str
+
+    :return: The detached user.
+    :rtype: User
+    """
+    values = json.loads(data)
+    values["id"] = uuid.UUID(values["id"])
+    for field in ("created_at", "updated_at"):
+        if values[field] is not None:
+            values[field] = datetime.fromisoformat(values[field])
+    user = User(**values)
+    make_transient_to_detached(user)
+    return user
+
+
+class UserCache:
+    """
+    Two-level cache of authenticated users: an in-process LRU in front of Redis.
+
+    The local level has a short TTL so other workers see invalidations quickly. Redis errors are
+    treated as misses and Redis is skipped for ``retry_after`` seconds.
+
+    :param redis: The Redis client, or None to use the local level only.
+    :type redis: Redis or None
+    :param ttl: Lifetime of Redis entries in seconds, 0 disables the cache.
+    :type ttl: int
+    :param local_ttl: Lifetime of in-process entries in seconds.
+    :type local_ttl: float
+    :param local_size: Maximum number of in-process entries.
+    :type local_size: int
+    :param retry_after: Seconds to bypass Redis after an error.
+    :type retry_after: float
+    """
+
+    def __init__(self, redis: Redis | None, ttl: int, local_ttl: float = 5.0, local_size: int = 1024,
+                 retry_after: float = 5.0):
+        self.redis = redis
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.local_size = local_size
+        self.retry_after = retry_after
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._local: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._down_until = 0.0
+
+    def bind(self, redis: Redis | None):
+        """
+        Switches to another Redis client, None disables the Redis level.
+
+        :param redis: The client, usually sharing the application pool.
+        :type redis: Redis or None
+        """
+        self.redis = redis
+        self._down_until = 0.0
+
+    @staticmethod
+    def _key(user_id) -> str:
+        return f"user:{user_id}"
+
+    def _redis_available(self) -> bool:
+        return self.redis is not None and time.monotonic() >= self._down_until
+
+    def _failed(self, err: Exception):
+        self.errors += 1
+        self._down_until = time.monotonic() + self.retry_after
+        print(err)
+
+    def _remember(self, key: str, data: bytes):
+        self._local[key] = (time.monotonic() + self.local_ttl, data)
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+
+    async def get(self, user_id) -> User | None:
+        """
+        Looks a user up in the local LRU, then in Redis.
+
+        :param user_id: The user ID.
+        :type user_id: UUID
+
+        :return: A fresh detached user, or None on a miss.
+        :rtype: User or None
+        """
+        if self.ttl <= 0:
+            return None
+        key = self._key(user_id)
+        entry = self._local.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._local.move_to_end(key)
+            self.hits += 1
+            return load_user(entry[1])
+        self._local.pop(key, None)
+        data = None
+        if self._redis_available():
+            try:
+                data = await self.redis.get(key)
+            except (RedisError, OSError) as err:
+                self._failed(err)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, data)
+        return load_user(data)
+
+    async def set(self, user: User):
+        """
+        Stores a user in both levels.
+
+        :param user: The user loaded from the database.
+        :type user: User
+        """
+        if self.ttl <= 0:
+            return
+        key = self._key(user.id)
+        data = dump_user(user)
+        self._remember(key, data)
+        if self._redis_available():
+            try:
+                await self.redis.set(key, data, ex=self.ttl)
+            except (RedisError, OSError) as err:
+                self._failed(err)
+
+    async def invalidate(self, user_id):
+        """
+        Drops a user from both levels. Other workers drop their local copy within ``local_ttl``.
+
+        :param user_id: The user ID.
+        :type user_id: UUID
+        """
+        key = self._key(user_id)
+        self._local.pop(key, None)
+        if self.redis is not None:
+            try:
+                await self.redis.delete(key)
+            except (RedisError, OSError) as err:
+                self._failed(err)
+
+
+# The Redis client is bound in the application lifespan, see ``main.lifespan``.
+user_cache = UserCache(
+    None,
+    ttl=config.USER_CACHE_TTL,
+    local_ttl=config.USER_CACHE_LOCAL_TTL,
+    local_size=config.USER_CACHE_LOCAL_SIZE,
+)
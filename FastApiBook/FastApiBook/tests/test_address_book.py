@@ -27,9 +27,7 @@ async def test_create_contact(client, monkeypatch):
             current_user.is_verified = True
             await session.commit()
 
-    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
-    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
-    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    monkeypatch.setattr("src.services.rate_limiter.rate_limiter._script", AsyncMock())
     response = client.post("api/address_book/", json=body)
     assert response.status_code == 201
     assert response.json()["name"] == body["name"]
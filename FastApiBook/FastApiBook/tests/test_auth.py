@@ -1,4 +1,4 @@
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, AsyncMock, patch
 
 import pytest
 from fastapi_users.router import ErrorCode
@@ -13,7 +13,7 @@ user_data = {"username": "agent007", "email": "agent007@gmail.com", "password":
 
 
 def test_signup(client, monkeypatch, get_token):
-    with patch.object(UserManager, 'cache') as redis_mock:
+    with patch.object(UserManager, 'cache', new_callable=AsyncMock) as redis_mock:
         redis_mock.get.return_value = None
         mock_send_email = Mock()
         monkeypatch.setattr("src.services.email.send_email_verification", mock_send_email)
@@ -54,7 +54,7 @@ async def test_login(client, monkeypatch):
             current_user.is_verified = True
             await session.commit()
 
-    with patch.object(UserManager, 'cache') as redis_mock:
+    with patch.object(UserManager, 'cache', new_callable=AsyncMock) as redis_mock:
         redis_mock.get.return_value = None
         mock_send_email = Mock()
         monkeypatch.setattr("src.services.email.send_email_verification", mock_send_email)
@@ -64,6 +64,7 @@ async def test_login(client, monkeypatch):
         data = response.json()
         assert "access_token" in data
         assert "token_type" in data
+        redis_mock.set.assert_awaited_once()
 
 
 def test_wrong_password_login(client):
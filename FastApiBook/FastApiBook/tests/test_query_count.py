@@ -0,0 +1,168 @@
+import datetime
+import unittest
+import uuid
+
+from sqlalchemy import event, update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.models.models import Base, Contact, ContactTombstone, User
+from src.repository.address_book import (
+    create_contact,
+    get_changes,
+    prune_tombstones,
+    get_contacts,
+    get_contact,
+    update_contact,
+    delete_contact
+)
+from src.schemas.contact import ContactSchema, ContactUpdateSchema
+from src.services.serializers import CONTACT_COLUMNS
+
+
+class TestQueryCount(unittest.IsolatedAsyncioTestCase):
+    """
+    Pins the number and shape of the SQL statements issued by the contact repository.
+    """
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool,
+                                          connect_args={"check_same_thread": False})
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session_maker = async_sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)
+        self.body = ContactSchema(name="Test", surname="User", email="aaaaa@aaa.com", number="1234567890",
+                                  birthday="1990-01-01", description="test")
+        async with self.session_maker() as session:
+            self.user = User(id=uuid.uuid4(), username="test_user", email="test@test.io", hashed_password="x",
+                             is_active=True, is_verified=True, is_superuser=False)
+            session.add(self.user)
+            await session.commit()
+            self.contact = await create_contact(self.body, session, self.user)
+        self.statements = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self._record)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def assertNoJoin(self):
+        for statement in self.statements:
+            self.assertNotIn("JOIN", statement.upper())
+            self.assertNotIn('"user"', statement)
+
+    async def test_get_contacts(self):
+        async with self.session_maker() as session:
+            contacts = await get_contacts(None, None, None, False, 10, 0, session, self.user)
+        self.assertEqual(len(contacts), 1)
+        self.assertEqual(len(self.statements), 1)
+        self.assertNoJoin()
+
+    async def test_get_contact(self):
+        async with self.session_maker() as session:
+            contact = await get_contact(self.contact.id, session, self.user)
+        self.assertEqual(contact.id, self.contact.id)
+        self.assertEqual(len(self.statements), 1)
+        self.assertNoJoin()
+
+    async def test_get_contact_load_user(self):
+        async with self.session_maker() as session:
+            contact = await get_contact(self.contact.id, session, self.user, load_user=True)
+        self.assertEqual(contact.user.id, self.user.id)
+        self.assertEqual(len(self.statements), 1)
+        self.assertIn("JOIN", self.statements[0].upper())
+
+    async def test_user_is_not_loaded_implicitly(self):
+        async with self.session_maker() as session:
+            contact = await get_contact(self.contact.id, session, self.user)
+            with self.assertRaises(Exception):
+                contact.user
+
+    async def test_update_contact(self):
+        async with self.session_maker() as session:
+            contact = await update_contact(self.contact.id, ContactUpdateSchema(name="Renamed"), session, self.user)
+        self.assertEqual(contact.name, "Renamed")
+        self.assertEqual(contact.surname, self.body.surname)
+        # The next change position, then UPDATE ... RETURNING
+        self.assertEqual(len(self.statements), 2)
+        self.assertIn("INSERT INTO contact_sync_state", self.statements[0])
+        self.assertIn("RETURNING", self.statements[1].upper())
+        self.assertNoJoin()
+
+    async def test_delete_contact(self):
+        async with self.session_maker() as session:
+            contact = await delete_contact(self.contact.id, session, self.user)
+            self.assertIsNone(await get_contact(self.contact.id, session, self.user))
+        self.assertIsInstance(contact, Contact)
+        self.assertEqual(contact.name, self.body.name)
+        # The next change position, DELETE ... RETURNING and the tombstone in the same transaction, the lookup
+        self.assertEqual(len(self.statements), 4)
+        self.assertIn("INSERT INTO contact_sync_state", self.statements[0])
+        self.assertIn("RETURNING", self.statements[1].upper())
+        self.assertIn("INSERT INTO contact_tombstones", self.statements[2])
+        self.assertNoJoin()
+
+    async def test_conditional_writes(self):
+        stale = self.contact.updated_at - datetime.timedelta(seconds=1)
+        async with self.session_maker() as session:
+            self.assertIsNone(await update_contact(self.contact.id, ContactUpdateSchema(name="Renamed"), session,
+                                                   self.user, versions=[stale]))
+            self.assertIsNone(await delete_contact(self.contact.id, session, self.user, versions=[stale]))
+            self.assertIsNone(await update_contact(self.contact.id, ContactUpdateSchema(), session, self.user,
+                                                   versions=[]))
+            contact = await update_contact(self.contact.id, ContactUpdateSchema(name="Renamed"), session,
+                                           self.user, versions=[stale, self.contact.updated_at])
+            self.assertEqual(contact.name, "Renamed")
+            self.assertIsNotNone(await delete_contact(self.contact.id, session, self.user,
+                                                      versions=[contact.updated_at]))
+        # The condition is part of the write, a failed write still takes its change position first
+        self.assertEqual([statement.split()[0] for statement in self.statements],
+                         ["INSERT", "UPDATE", "INSERT", "DELETE", "SELECT", "INSERT", "UPDATE", "INSERT", "DELETE",
+                          "INSERT"])
+
+    async def test_get_changes(self):
+        async with self.session_maker() as session:
+            changes, position = await get_changes(None, 10, session, self.user, CONTACT_COLUMNS)
+        self.assertEqual([change[1] for change in changes], [self.contact.id])
+        self.assertEqual(position, 1)
+        # The sequence bound and the contacts, a full sync skips the tombstones
+        self.assertEqual(len(self.statements), 2)
+        self.assertNoJoin()
+
+    async def test_get_changes_in_order(self):
+        async with self.session_maker() as session:
+            second = await create_contact(self.body, session, self.user)
+            third = await create_contact(self.body, session, self.user)
+            await update_contact(self.contact.id, ContactUpdateSchema(name="Renamed"), session, self.user)
+            await delete_contact(second.id, session, self.user)
+
+            changes, position = await get_changes(None, 2, session, self.user, CONTACT_COLUMNS)
+            self.assertEqual([change[:2] for change in changes], [(3, third.id), (4, self.contact.id)])
+            self.assertEqual(changes[1][3].name, "Renamed")
+            self.assertEqual(position, 4)
+            changes, position = await get_changes(position, 2, session, self.user, CONTACT_COLUMNS)
+            self.assertEqual([(change[1], change[3] is None) for change in changes], [(second.id, True)])
+            self.assertEqual(position, 5)
+            self.assertEqual(await get_changes(position, 2, session, self.user, CONTACT_COLUMNS), ([], 5))
+            changes, _ = await get_changes(2, 10, session, self.user, CONTACT_COLUMNS)
+            self.assertEqual([change[0] for change in changes], [3, 4, 5])
+            # A position that was never handed out
+            self.assertIsNone(await get_changes(6, 10, session, self.user, CONTACT_COLUMNS))
+
+    async def test_prune_tombstones(self):
+        async with self.session_maker() as session:
+            second = await create_contact(self.body, session, self.user)
+            await delete_contact(second.id, session, self.user)
+            self.assertEqual(await prune_tombstones(3600, session), 0)
+            await session.execute(update(ContactTombstone)
+                                  .values(deleted_at=datetime.datetime.now() - datetime.timedelta(days=1)))
+            await session.commit()
+            self.assertEqual(await prune_tombstones(3600, session), 1)
+
+            # The deletion at position 3 is gone, older positions have to sync again from scratch
+            self.assertIsNone(await get_changes(2, 10, session, self.user, CONTACT_COLUMNS))
+            self.assertEqual(await get_changes(3, 10, session, self.user, CONTACT_COLUMNS), ([], 3))
+            changes, position = await get_changes(None, 10, session, self.user, CONTACT_COLUMNS)
+            self.assertEqual(([change[1] for change in changes], position), ([self.contact.id], 3))
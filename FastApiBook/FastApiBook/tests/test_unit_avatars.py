@@ -0,0 +1,85 @@
+import io
+import tempfile
+import unittest
+import uuid
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+
+from src.models.models import User
+from src.services.avatars import AvatarService, AvatarStorage, LocalStorage, render_variants
+
+
+def image_bytes(size=(800, 600), fmt="PNG", mode="RGB", color="red") -> bytes:
+    output = io.BytesIO()
+    Image.new(mode, size, color).save(output, fmt)
+    return output.getvalue()
+
+
+def upload(data: bytes) -> UploadFile:
+    return UploadFile(io.BytesIO(data), size=len(data), filename="avatar.png")
+
+
+class TestAvatarService(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.service = AvatarService(LocalStorage(self.directory.name, "/static/avatars"), sizes=[250, 64],
+                                     max_bytes=1024 * 1024, max_pixels=4_000_000)
+        self.user = User(id=uuid.uuid4(), email="test@test.io", username="test_user")
+
+    async def test_stores_variants(self):
+        url = await self.service.update(self.user, upload(image_bytes()))
+        self.assertTrue(url.startswith(f"/static/avatars/{self.user.id}/250.webp?v="))
+        for size in (250, 64):
+            with Image.open(Path(self.directory.name) / str(self.user.id) / f"{size}.webp") as image:
+                self.assertEqual(image.size, (size, size))
+                self.assertEqual(image.format, "WEBP")
+
+    async def test_url_changes_with_content(self):
+        first = await self.service.update(self.user, upload(image_bytes()))
+        second = await self.service.update(self.user, upload(image_bytes(mode="L")))
+        self.assertNotEqual(first, second)
+
+    async def test_too_many_bytes(self):
+        data = image_bytes()
+        self.service.max_bytes = len(data) - 1
+        with self.assertRaises(HTTPException) as error:
+            await self.service.update(self.user, upload(data))
+        self.assertEqual(error.exception.status_code, 413)
+        with self.assertRaises(HTTPException) as error:  # size unknown, the read is capped
+            await self.service.read(UploadFile(io.BytesIO(data)))
+        self.assertEqual(error.exception.status_code, 413)
+
+    def test_too_many_pixels(self):
+        with self.assertRaises(HTTPException) as error:
+            render_variants(image_bytes((3000, 2000)), [250], 4_000_000, 85)
+        self.assertEqual(error.exception.status_code, 413)
+
+    def test_not_an_image(self):
+        with self.assertRaises(HTTPException) as error:
+            render_variants(b"<svg></svg>", [250], 4_000_000, 85)
+        self.assertEqual(error.exception.status_code, 415)
+
+    def test_keeps_transparency(self):
+        variants = render_variants(image_bytes(mode="RGBA", color=(255, 0, 0, 128)), [64], 4_000_000, 85)
+        with Image.open(io.BytesIO(variants[64])) as image:
+            self.assertEqual(image.mode, "RGBA")
+
+    def test_jpeg_draft(self):
+        variants = render_variants(image_bytes((4000, 3000), "JPEG"), [250], 20_000_000, 85)
+        with Image.open(io.BytesIO(variants[250])) as image:
+            self.assertEqual(image.size, (250, 250))
+
+    def test_storage_must_implement_save(self):
+        class Incomplete(AvatarStorage):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+from unittest.mock import AsyncMock
+
+from redis.exceptions import ConnectionError
+
+from src.services.cache import ContactCache
+
+
+class TestContactCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = AsyncMock()
+        self.cache = ContactCache(self.redis, ttl=60)
+        self.loader = AsyncMock(return_value=b'[{"id":1}]')
+
+    async def test_miss_then_hit(self):
+        self.redis.get.side_effect = [b"3", None]
+        result = await self.cache.get_or_load_bytes("user", "list_json", (None, 10), self.loader)
+        self.assertEqual(result, b'[{"id":1}]')
+        key, value = self.redis.set.call_args.args
+        self.assertTrue(key.startswith("contacts:user:3:list_json:"))
+        self.assertEqual(self.redis.set.call_args.kwargs, {"ex": 60})
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+
+        self.redis.get.side_effect = [b"3", value]
+        result = await self.cache.get_or_load_bytes("user", "list_json", (None, 10), self.loader)
+        self.assertEqual(result, b'[{"id":1}]')
+        self.loader.assert_awaited_once()
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    async def test_not_cacheable(self):
+        self.redis.get.side_effect = [b"3", None]
+        cacheable = AsyncMock(return_value=False)
+        result = await self.cache.get_or_load_bytes("user", "list_json", (), self.loader, cacheable=cacheable)
+        self.assertEqual(result, b'[{"id":1}]')
+        cacheable.assert_awaited_once()
+        self.redis.set.assert_not_awaited()
+
+    async def test_none_is_not_cached(self):
+        self.redis.get.return_value = None
+        result = await self.cache.get_or_load_bytes("user", "get", (1,), AsyncMock(return_value=None))
+        self.assertIsNone(result)
+        self.redis.set.assert_not_awaited()
+
+    async def test_invalidate(self):
+        await self.cache.invalidate("user")
+        self.redis.incr.assert_awaited_once_with("contacts:gen:user")
+        self.redis.incrby.assert_not_awaited()
+
+    async def test_invalidate_lost_counter(self):
+        self.redis.incr.return_value = 1
+        await self.cache.invalidate("user")
+        key, start = self.redis.incrby.call_args.args
+        self.assertEqual(key, "contacts:gen:user")
+        self.assertGreater(start, 10 ** 18)
+
+    async def test_failed_invalidate_retried(self):
+        self.cache.retry_after = 0
+        self.redis.incr.side_effect = ConnectionError("down")
+        await self.cache.invalidate("user")
+        self.assertIsNone(await self.cache.generation("user"))
+        self.assertEqual(await self.cache.get_or_load_bytes("user", "list_json", (), self.loader), b'[{"id":1}]')
+        self.redis.get.assert_not_awaited()
+        self.redis.set.assert_not_awaited()
+
+        self.redis.incr.side_effect = None
+        self.redis.incr.return_value = 8
+        self.redis.get.side_effect = [b"8", None]
+        await self.cache.get_or_load_bytes("user", "list_json", (), self.loader)
+        self.assertEqual(self.redis.incr.await_count, 4)
+        self.assertTrue(self.redis.set.call_args.args[0].startswith("contacts:user:8:list_json:"))
+        self.redis.get.side_effect = [b"8", b"[]"]
+        self.assertEqual(await self.cache.get_or_load_bytes("user", "list_json", (), self.loader), b"[]")
+        self.assertEqual(self.redis.incr.await_count, 4)
+
+    async def test_generation(self):
+        self.redis.get.side_effect = [None, b"42"]
+        self.assertEqual(await self.cache.generation("user"), 42)
+        self.assertEqual(self.redis.set.call_args.kwargs, {"nx": True})
+
+        self.redis.get.side_effect = [b"7", None]
+        self.assertEqual(await self.cache.generation("user"), 7)
+        loader = AsyncMock(return_value=b"[]")
+        await self.cache.get_or_load_bytes("user", "list_json", (), loader, generation=7)
+        self.assertTrue(self.redis.set.call_args.args[0].startswith("contacts:user:7:list_json:"))
+
+        self.redis.get.side_effect = ConnectionError("down")
+        self.assertIsNone(await self.cache.generation("user"))
+        self.assertIsNone(await self.cache.generation("user"))
+
+    async def test_fail_open(self):
+        self.redis.get.side_effect = ConnectionError("down")
+        result = await self.cache.get_or_load_bytes("user", "list_json", (), self.loader)
+        self.assertEqual(result, b'[{"id":1}]')
+        self.assertEqual(self.cache.errors, 1)
+        self.assertFalse(self.cache.enabled)
+        await self.cache.get_or_load_bytes("user", "list_json", (), self.loader)
+        self.assertEqual(self.redis.get.await_count, 1)
+
+    async def test_disabled(self):
+        cache = ContactCache(self.redis, ttl=0)
+        await cache.get_or_load_bytes("user", "list_json", (), self.loader)
+        await cache.invalidate("user")
+        self.redis.get.assert_not_awaited()
+        self.redis.incr.assert_not_awaited()
@@ -0,0 +1,43 @@
+import datetime
+import unittest
+
+from src.services.etags import contact_etag, list_etag, none_match, parse_versions
+
+
+class TestETags(unittest.TestCase):
+
+    def setUp(self):
+        self.updated_at = datetime.datetime(2026, 10, 17, 12, 30, 5, 123456)
+
+    def test_contact_etag_round_trip(self):
+        etag = contact_etag(self.updated_at)
+        self.assertEqual(parse_versions(etag), [self.updated_at])
+        sparse = contact_etag(self.updated_at, ("id", "name"))
+        self.assertNotEqual(sparse, etag)
+        self.assertEqual(parse_versions(sparse), [self.updated_at])
+        self.assertNotEqual(contact_etag(self.updated_at + datetime.timedelta(microseconds=1)), etag)
+
+    def test_list_etag(self):
+        self.assertEqual(list_etag(3, ("a", 10)), list_etag(3, ("a", 10)))
+        self.assertNotEqual(list_etag(3, ("a", 10)), list_etag(4, ("a", 10)))
+        self.assertNotEqual(list_etag(3, ("a", 10)), list_etag(3, ("a", 20)))
+        self.assertTrue(list_etag(3, ()).startswith('W/"'))
+
+    def test_none_match(self):
+        etag = contact_etag(self.updated_at)
+        self.assertTrue(none_match(etag, etag))
+        self.assertTrue(none_match(f'"other", W/{etag}', etag))
+        self.assertTrue(none_match("*", etag))
+        self.assertFalse(none_match('"other"', etag))
+        self.assertFalse(none_match(None, etag))
+        self.assertFalse(none_match("*", None))
+
+    def test_parse_versions(self):
+        self.assertIsNone(parse_versions('"1", *'))
+        weak = "W/" + contact_etag(self.updated_at)
+        self.assertEqual(parse_versions(f'{weak}, "zz", nope, ""'), [])
+        self.assertEqual(parse_versions(f'{weak}, {contact_etag(self.updated_at)}'), [self.updated_at])
+
+
+if __name__ == '__main__':
+    unittest.main()
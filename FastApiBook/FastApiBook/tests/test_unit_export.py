@@ -0,0 +1,40 @@
+import gzip
+import json
+import unittest
+
+from src.models.models import Contact
+from src.services.export import export_contacts
+
+
+async def as_stream(items):
+    for item in items:
+        yield item
+
+
+class TestExport(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.contacts = [
+            Contact(id=i, name=f"Test{i}", surname="User, Jr.", email=f"aaaaa{i}@aaa.com", number="1234567890",
+                    birthday="1990-01-01", description="test")
+            for i in range(1, 6)
+        ]
+
+    async def collect(self, *args, **kwargs):
+        return b"".join([chunk async for chunk in export_contacts(as_stream(self.contacts), *args, **kwargs)])
+
+    async def test_csv(self):
+        lines = (await self.collect("csv", chunk_rows=2)).decode().splitlines()
+        self.assertEqual(lines[0], "id,name,surname,email,number,birthday,description")
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[1], '1,Test1,"User, Jr.",aaaaa1@aaa.com,1234567890,1990-01-01,test')
+
+    async def test_ndjson_gzip(self):
+        body = gzip.decompress(await self.collect("ndjson", compress=True, chunk_rows=2))
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row["id"] for row in rows], [1, 2, 3, 4, 5])
+        self.assertEqual(rows[0]["surname"], "User, Jr.")
+
+    async def test_chunking(self):
+        chunks = [chunk async for chunk in export_contacts(as_stream(self.contacts), "ndjson", chunk_rows=2)]
+        self.assertEqual(len(chunks), 3)
@@ -0,0 +1,50 @@
+import unittest
+
+from src.services.importer import iter_rows, validate_batch
+
+
+async def chunked(data: bytes, size: int = 7):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+class TestImporter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_iter_rows_csv(self):
+        body = (b"name,surname,email,number,birthday,description,extra\r\n"
+                b"Test,User,aaaaa@aaa.com,1234567890,1990-01-01,\"test, quoted\",x\r\n"
+                b"\r\n"
+                b"Test2,User2,bbbbb@aaa.com,1234567890,1990-01-02,test")
+        rows = [row async for row in iter_rows(chunked(body), "csv")]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0][0], 1)
+        self.assertEqual(rows[0][1]["description"], "test, quoted")
+        self.assertNotIn("extra", rows[0][1])
+        self.assertEqual(rows[1][1]["name"], "Test2")
+
+    async def test_iter_rows_ndjson(self):
+        body = b'{"name": "Test"}\n[1, 2]\n{broken\n'
+        rows = [row async for row in iter_rows(chunked(body), "ndjson")]
+        self.assertEqual(rows[0], (1, {"name": "Test"}))
+        self.assertIsInstance(rows[1][1], str)
+        self.assertIsInstance(rows[2][1], str)
+
+    async def test_iter_rows_not_utf8(self):
+        body = b'{"name": "Test"}\n{"name": "\xff"}\n{"name": "Next"}\n'
+        rows = [row async for row in iter_rows(chunked(body), "ndjson")]
+        self.assertEqual([number for number, _ in rows], [1, 2, 3])
+        self.assertTrue(rows[1][1].startswith("malformed ndjson record"))
+        self.assertEqual(rows[2][1], {"name": "Next"})
+        rows = [row async for row in iter_rows(chunked(b"name,\xffsurname\nTest,\xe9\n"), "csv")]
+        self.assertTrue(rows[0][1].startswith("malformed csv record"))
+
+    def test_validate_batch(self):
+        good = {"name": "Test", "surname": "User", "email": "aaaaa@aaa.com", "number": "1234567890",
+                "birthday": "1990-01-01", "description": "test"}
+        no_birthday = {key: value for key, value in good.items() if key != "birthday"}
+        batch = [(1, good), (2, {**good, "email": "nope"}), (3, "malformed csv record"), (4, no_birthday),
+                 (5, {**good, "name": "Other"})]
+        contacts, errors = validate_batch(batch)
+        self.assertEqual([contact.name for contact in contacts], ["Test", "Other"])
+        self.assertEqual([error["row"] for error in errors], [2, 3, 4])
+        self.assertTrue(errors[0]["errors"][0].startswith("email:"))
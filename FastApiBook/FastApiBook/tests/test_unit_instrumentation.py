@@ -0,0 +1,84 @@
+import json
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from src.services.instrumentation import SQLInstrumentationMiddleware, instrument_engine, normalize_sql
+
+
+class TestNormalizeSQL(unittest.TestCase):
+
+    def test_literals_and_parameters(self):
+        self.assertEqual(
+            normalize_sql("SELECT *\n  FROM contacts WHERE user_id = $1::UUID AND name ILIKE 'a''b%' AND id > 42"),
+            "SELECT * FROM contacts WHERE user_id = ?::UUID AND name ILIKE ? AND id > ?",
+        )
+        self.assertEqual(normalize_sql("SELECT t1.col2 FROM t1 WHERE id = :id_1"),
+                         "SELECT t1.col2 FROM t1 WHERE id = ?")
+
+    def test_lists(self):
+        self.assertEqual(normalize_sql("SELECT 1 FROM t WHERE id IN (?, ?, ?)"), "SELECT ? FROM t WHERE id IN (?, ...)")
+        self.assertEqual(normalize_sql("INSERT INTO t (a, b) VALUES (?, ?), (?, ?), (?, ?)"),
+                         "INSERT INTO t (a, b) VALUES (?, ...), ...")
+
+
+class TestSQLInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        instrument_engine(self.engine, slow_query_ms=10_000)
+        app = FastAPI()
+        app.add_middleware(SQLInstrumentationMiddleware)
+
+        @app.get("/queries/{count}")
+        async def queries(count: int):
+            async with self.engine.connect() as conn:
+                for number in range(count):
+                    await conn.execute(text(f"SELECT {number}"))
+            return {}
+
+        @app.get("/failing")
+        async def failing():
+            async with self.engine.connect() as conn:
+                try:
+                    await conn.execute(text("SELECT * FROM missing"))
+                except Exception:
+                    pass
+                self.started = list(conn.sync_connection.info["query_started"])
+            return {}
+
+        self.client = TestClient(app)
+
+    def test_server_timing(self):
+        with self.assertLogs("src.sql", level="INFO") as logs:
+            response = self.client.get("/queries/3")
+        self.assertRegex(response.headers["server-timing"], r'^db;dur=[\d.]+;desc="3 queries", db-slowest;dur=[\d.]+$')
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((record["event"], record["path"], record["status"], record["queries"]),
+                         ("request", "/queries/3", 200, 3))
+        self.assertEqual(record["slowest_statement"], "SELECT ?")
+
+    def test_slow_query_log(self):
+        instrument_engine(self.engine, slow_query_ms=0)
+        with self.assertLogs("src.sql", level="WARNING") as logs:
+            self.client.get("/queries/1")
+        self.assertEqual(json.loads(logs.records[0].getMessage())["statement"], "SELECT ?")
+        instrument_engine(self.engine, slow_query_ms=10_000)
+
+    def test_failed_statement(self):
+        instrument_engine(self.engine, slow_query_ms=0)
+        with self.assertLogs("src.sql", level="INFO") as logs:
+            self.client.get("/failing")
+        instrument_engine(self.engine, slow_query_ms=10_000)
+        self.assertEqual(self.started, [])
+        slow, request = (json.loads(record.getMessage()) for record in logs.records)
+        self.assertEqual((slow["statement"], slow["error"]), ("SELECT * FROM missing", "OperationalError"))
+        self.assertEqual((request["queries"], request["slowest_statement"]), (1, "SELECT * FROM missing"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import asyncio
+import socket
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from redis.exceptions import ConnectionError
+
+from src.services.jobs import Job, JobQueue, MemoryBackend, Worker
+
+
+class TestJobQueue(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.backend = MemoryBackend()
+        self.queue = JobQueue(self.backend, max_attempts=3, backoff=0.01)
+        self.calls = []
+
+        @self.queue.task("record")
+        async def record(value):
+            self.calls.append(value)
+
+        @self.queue.task("flaky", max_attempts=2)
+        async def flaky():
+            raise ValueError("boom")
+
+    async def run_worker(self, worker: Worker, until):
+        task = asyncio.create_task(worker.run())
+        for _ in range(200):
+            if until():
+                break
+            await asyncio.sleep(0.01)
+        worker.stop()
+        await task
+
+    def test_job_round_trip(self):
+        job = Job("record", {"value": 1})
+        self.assertEqual(Job.loads(job.dumps()), job)
+
+    async def test_worker_runs_jobs(self):
+        for value in range(5):
+            await self.queue.enqueue("record", value=value)
+        worker = Worker(self.queue, concurrency=2, poll_timeout=0.05)
+        await self.run_worker(worker, lambda: len(self.calls) == 5)
+        self.assertEqual(sorted(self.calls), list(range(5)))
+        self.assertEqual(worker.processed, 5)
+        self.assertEqual(await self.backend.sizes(), {"ready": 0, "delayed": 0, "processing": 0, "dead": 0})
+
+    async def test_retries_then_dead_letters(self):
+        await self.queue.enqueue("flaky")
+        worker = Worker(self.queue, poll_timeout=0.05)
+        await self.run_worker(worker, lambda: self.backend.dead_letters)
+        self.assertEqual(worker.failed, 2)
+        dead = Job.loads(self.backend.dead_letters[0])
+        self.assertEqual(dead.attempts, 2)
+        self.assertIn("ValueError: boom", dead.error)
+
+    async def test_unknown_job_dead_lettered(self):
+        await self.backend.push(Job("missing", {}).dumps())
+        await self.backend.push("not json")
+        worker = Worker(self.queue, poll_timeout=0.05)
+        await self.run_worker(worker, lambda: len(self.backend.dead_letters) == 2)
+        self.assertEqual(worker.dead, 2)
+        self.assertEqual(self.backend.processing, [])
+
+    async def test_concurrency_limit(self):
+        running, peak = 0, 0
+
+        @self.queue.task("slow", concurrency=2)
+        async def slow():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+
+        for _ in range(6):
+            await self.queue.enqueue("slow")
+        worker = Worker(self.queue, concurrency=5, poll_timeout=0.05)
+        await self.run_worker(worker, lambda: worker.processed == 6)
+        self.assertEqual(worker.processed, 6)
+        self.assertEqual(peak, 2)
+
+    async def test_recover_unfinished(self):
+        await self.queue.enqueue("record", value=1)
+        await self.backend.pop(0)
+        worker = Worker(self.queue, poll_timeout=0.05)
+        await self.run_worker(worker, lambda: self.calls)
+        self.assertEqual(self.calls, [1])
+
+    async def test_runs_inline_without_backend(self):
+        self.queue.backend = None
+        await self.queue.enqueue("record", value=7)
+        await asyncio.gather(*self.queue._inline)
+        self.assertEqual(self.calls, [7])
+
+    async def test_runs_inline_when_backend_fails(self):
+        self.queue.backend = AsyncMock()
+        self.queue.backend.push.side_effect = ConnectionError("down")
+        await self.queue.enqueue("record", value=8)
+        await asyncio.gather(*self.queue._inline)
+        self.assertEqual(self.calls, [8])
+
+    async def test_refresh_sizes(self):
+        await self.queue.enqueue("record", value=1)
+        await self.queue.refresh_sizes()
+        self.assertEqual(self.queue.sizes, {"ready": 1, "delayed": 0, "processing": 0, "dead": 0})
+        self.queue.backend = AsyncMock()
+        self.queue.backend.sizes.side_effect = ConnectionError("down")
+        await self.queue.refresh_sizes()
+        self.assertEqual(self.queue.sizes, {})
+
+    async def test_unknown_name_rejected(self):
+        with self.assertRaises(KeyError):
+            await self.queue.enqueue("missing")
+
+    async def test_claim_worker_skips_held_names(self):
+        redis = AsyncMock()
+        redis.register_script = MagicMock()
+        redis.set.side_effect = [None, True]
+        name = await self.queue.claim_worker(redis, 30)
+        self.assertEqual(name, f"{socket.gethostname()}-1")
+        self.assertEqual(self.queue.backend.processing, f"jobs:processing:{name}")
+        self.assertTrue(redis.set.call_args.kwargs["nx"])
+        self.assertEqual(redis.set.call_args.kwargs["px"], 30000)
+
+    async def test_claim_worker_refuses_held_name(self):
+        redis = AsyncMock()
+        redis.register_script = MagicMock()
+        redis.set.return_value = None
+        with self.assertRaises(RuntimeError):
+            await self.queue.claim_worker(redis, 30, "mailer")
+        self.assertIs(self.queue.backend, self.backend)
+
+    async def test_worker_stops_when_lease_lost(self):
+        self.backend.renew = AsyncMock(return_value=False)
+        self.backend.release = AsyncMock()
+        worker = Worker(self.queue, poll_timeout=0.01, lease=0.03)
+        await asyncio.wait_for(worker.run(), 1)
+        self.backend.release.assert_awaited_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import socket
+import unittest
+
+import aiosmtplib
+from aiosmtpd.controller import Controller
+
+from src.services.mailer import Mail, Mailer, SMTPPool, TemplateRenderer
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Collector:
+    """
+    aiosmtpd handler that keeps the received envelopes and counts sessions.
+    """
+
+    def __init__(self, fail_first: int = 0):
+        self.messages = []
+        self.sessions = set()
+        self.fail_first = fail_first
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.fail_first:
+            self.fail_first -= 1
+            return "451 Try again later"
+        self.messages.append(envelope)
+        self.sessions.add(id(session))
+        return "250 OK"
+
+
+def mail(number: int) -> Mail:
+    return Mail(recipient=f"user{number}@example.com", subject="Confirm your email", template="verify_email.html",
+                context={"host": "http://test/", "username": f"user{number}", "token": "token"})
+
+
+class TestMailer(unittest.IsolatedAsyncioTestCase):
+
+    def start_server(self, handler: Collector):
+        port = free_port()
+        controller = Controller(handler, hostname="127.0.0.1", port=port)
+        controller.start()
+        self.addCleanup(controller.stop)
+        return port
+
+    def make_mailer(self, port: int) -> Mailer:
+        pool = SMTPPool(size=1, hostname="127.0.0.1", port=port, use_tls=False, start_tls=False, timeout=5)
+        return Mailer(pool, TemplateRenderer(), sender="Test <test@example.com>")
+
+    async def test_deliver_reuses_connection(self):
+        handler = Collector()
+        mailer = self.make_mailer(self.start_server(handler))
+        for number in range(3):
+            await mailer.deliver(mail(number))
+        await mailer.close()
+        self.assertEqual(len(handler.messages), 3)
+        self.assertEqual(len(handler.sessions), 1)
+        self.assertEqual(handler.messages[0].rcpt_tos, ["user0@example.com"])
+        body = handler.messages[0].content.decode()
+        self.assertIn("Subject: Confirm your email", body)
+        self.assertIn("user0", body)
+        self.assertEqual(mailer.pool._idle, [])
+
+    async def test_deliver_failures_raise(self):
+        handler = Collector(fail_first=1)
+        mailer = self.make_mailer(self.start_server(handler))
+        with self.assertRaises(aiosmtplib.SMTPResponseException):
+            await mailer.deliver(mail(1))
+        await mailer.deliver(mail(1))
+        self.assertEqual([message.rcpt_tos for message in handler.messages], [["user1@example.com"]])
+        broken = mail(2)
+        broken.template = "missing.html"
+        bad_header = mail(3)
+        bad_header.subject = "Confirm\nBcc: everyone@example.com"
+        for message in (broken, bad_header):
+            with self.assertRaises(Exception):
+                await mailer.deliver(message)
+        self.assertEqual(len(handler.messages), 1)
+        await mailer.close()
+
+    def test_templates_compiled_once(self):
+        renderer = TemplateRenderer()
+        renderer.compile()
+        self.assertIn("verify_email.html", renderer.templates)
+        self.assertIn("forgot_password.html", renderer.templates)
+        self.assertIn("user1", renderer.render("forgot_password.html", {"host": "h", "username": "user1",
+                                                                         "token": "t"}))
+
+
+if __name__ == '__main__':
+    unittest.main()
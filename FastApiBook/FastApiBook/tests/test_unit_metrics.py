@@ -0,0 +1,64 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from redis.exceptions import ConnectionError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.database.redis import InstrumentedRedis
+from src.services.metrics import MetricsMiddleware, StateCollector, registry
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_latency_by_route_template(self):
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware)
+
+        @app.get("/items/{item_id}")
+        async def item(item_id: int):
+            return {}
+
+        client = TestClient(app)
+        labels = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+        before = registry.get_sample_value("http_request_duration_seconds_count", labels) or 0
+        client.get("/items/1")
+        client.get("/items/2")
+        client.get("/missing")
+        self.assertEqual(registry.get_sample_value("http_request_duration_seconds_count", labels), before + 2)
+        self.assertGreaterEqual(registry.get_sample_value(
+            "http_request_duration_seconds_count", {"method": "GET", "route": "unmatched", "status": "404"}), 1)
+        self.assertEqual(registry.get_sample_value("http_requests_in_flight"), 0)
+
+    def test_state_collector(self):
+        sessionmanager = SimpleNamespace(engines=[create_async_engine("postgresql+asyncpg://u:p@localhost/db",
+                                                                      pool_size=3)])
+        cache = SimpleNamespace(hits=5, misses=2, errors=1)
+        limiter = SimpleNamespace(rejections={"read": 4, "write": 0}, errors=0)
+        job_queue = SimpleNamespace(sizes={"ready": 7, "delayed": 2, "processing": 1, "dead": 3})
+        collector = StateCollector(sessionmanager, {"contacts": cache}, limiter, job_queue)
+        families = {family.name: family for family in collector.collect()}
+        self.assertEqual(families["db_pool_size"].samples[0].value, 3)
+        self.assertEqual(families["db_pool_checked_out"].samples[0].labels, {"engine": "primary"})
+        self.assertEqual(families["cache_hits"].samples[0].value, 5)
+        self.assertEqual({sample.labels["budget"]: sample.value for sample in families["rate_limit_rejections"].samples
+                          if sample.name.endswith("_total")}, {"read": 4, "write": 0})
+        self.assertEqual({sample.labels["state"]: sample.value for sample in families["job_queue_depth"].samples},
+                         {"ready": 7, "delayed": 2, "dead": 3})
+
+
+class TestInstrumentedRedis(unittest.IsolatedAsyncioTestCase):
+
+    async def test_command_latency(self):
+        redis = InstrumentedRedis(host="localhost", port=0)
+        before = registry.get_sample_value("redis_command_duration_seconds_count", {"command": "GET"}) or 0
+        with self.assertRaises((ConnectionError, OSError)):
+            await redis.get("key")
+        self.assertEqual(registry.get_sample_value("redis_command_duration_seconds_count", {"command": "GET"}),
+                         before + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
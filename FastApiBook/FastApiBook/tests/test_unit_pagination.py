@@ -0,0 +1,46 @@
+import unittest
+
+from src.schemas.contact import ContactResponse
+from src.services.pagination import encode_cursor, decode_cursor, encode_sync_token, decode_sync_token
+
+
+class TestPagination(unittest.TestCase):
+
+    def setUp(self):
+        self.contact = ContactResponse(id=42, name="Test", surname="User", email="aaaaa@aaa.com",
+                                       number="1234567890", birthday="1990-01-01", description="test")
+
+    def test_round_trip_by_id(self):
+        token = encode_cursor("id", self.contact)
+        self.assertEqual(decode_cursor(token, "id"), (42,))
+
+    def test_round_trip_by_surname(self):
+        token = encode_cursor("surname", self.contact)
+        self.assertEqual(decode_cursor(token, "surname"), ("User", 42))
+
+    def test_sort_mismatch(self):
+        token = encode_cursor("id", self.contact)
+        with self.assertRaises(ValueError):
+            decode_cursor(token, "surname")
+
+    def test_value_types(self):
+        # ["surname", 5, 1], ["surname", "User", "1"] and ["id", true]
+        for token, sort in (("WyJzdXJuYW1lIiw1LDFd", "surname"), ("WyJzdXJuYW1lIiwiVXNlciIsIjEiXQ", "surname"),
+                            ("WyJpZCIsdHJ1ZV0", "id")):
+            with self.assertRaises(ValueError):
+                decode_cursor(token, sort)
+
+    def test_garbage(self):
+        for token in ("", "not-a-cursor", "W10", "WyJpZCIsIngiXQ"):
+            with self.assertRaises(ValueError):
+                decode_cursor(token, "id")
+
+    def test_sync_token_round_trip(self):
+        for seq in (0, 42, 2 ** 40):
+            self.assertEqual(decode_sync_token(encode_sync_token(seq)), seq)
+
+    def test_sync_token_garbage(self):
+        for token in ("", "not-a-token", encode_cursor("id", self.contact), "WyJzeW5jIiwieCIsMV0",
+                      encode_sync_token(-1), encode_sync_token(True), encode_sync_token("1")):
+            with self.assertRaises(ValueError):
+                decode_sync_token(token)
@@ -0,0 +1,36 @@
+import asyncio
+import unittest
+
+from src.services.passwords import PasswordHasher
+
+
+class TestPasswordHasher(unittest.IsolatedAsyncioTestCase):
+
+    async def test_thread_round_trip(self):
+        hasher = PasswordHasher("thread", workers=2, concurrency=2)
+        hashed = await hasher.hash("12345678")
+        self.assertEqual(await hasher.verify_and_update("12345678", hashed), (True, None))
+        verified, _ = await hasher.verify_and_update("wrong", hashed)
+        self.assertFalse(verified)
+        hasher.shutdown()
+
+    async def test_inline_round_trip(self):
+        hasher = PasswordHasher("inline")
+        hashed = await hasher.hash("12345678")
+        self.assertIsNone(hasher.executor)
+        self.assertEqual(await hasher.verify_and_update("12345678", hashed), (True, None))
+
+    async def test_concurrency_limit(self):
+        hasher = PasswordHasher("thread", workers=4, concurrency=1)
+        hashes = await asyncio.gather(hasher.hash("a"), hasher.hash("b"))
+        self.assertEqual(len(set(hashes)), 2)
+        self.assertEqual(hasher._semaphore._value, 1)
+        hasher.shutdown()
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            PasswordHasher("fiber")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+import uuid
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.services.profiler import BackgroundProfiler, ProfilerMiddleware, await_stack, categorize, issue_token, \
+    verify_token
+
+
+class TestProfilerHelpers(unittest.IsolatedAsyncioTestCase):
+
+    def test_token(self):
+        token = issue_token(uuid.uuid4(), 60)
+        self.assertTrue(verify_token(token))
+        self.assertFalse(verify_token(token + "x"))
+        self.assertFalse(verify_token(issue_token(uuid.uuid4(), -1)))
+
+    def test_categorize(self):
+        self.assertEqual(categorize(["starlette.routing:Router.app", "src.routes.address_book:get_contacts",
+                                     "sqlalchemy.ext.asyncio.session:AsyncSession.execute"]), "sqlalchemy")
+        self.assertEqual(categorize(["src.routes.address_book:get_contacts", "fastapi.routing:serialize_response",
+                                     "pydantic.type_adapter:TypeAdapter.validate_python"]), "pydantic")
+        self.assertEqual(categorize(["src.routes.address_book:get_contacts", "starlette.responses:Response.render"]),
+                         "route")
+        self.assertEqual(categorize(["src.services.profiler:ProfilerMiddleware.__call__",
+                                     "starlette.routing:Router.__call__"]), "framework")
+        self.assertEqual(categorize(["asyncio.base_events:BaseEventLoop.run_forever",
+                                     "selectors:EpollSelector.select"]), "idle")
+
+    async def test_await_stack(self):
+        async def inner():
+            await asyncio.sleep(1)
+
+        async def outer():
+            await inner()
+
+        task = asyncio.create_task(outer())
+        await asyncio.sleep(0)
+        self.assertEqual([frame.f_code.co_name for frame in await_stack(task)], ["outer", "inner", "sleep"])
+        task.cancel()
+
+
+class TestProfilerMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        app = FastAPI()
+        app.add_middleware(ProfilerMiddleware, directory=self.directory.name, interval=0.001)
+
+        @app.get("/slow")
+        async def slow():
+            deadline = time.perf_counter() + 0.03
+            while time.perf_counter() < deadline:
+                pass
+            await asyncio.sleep(0.02)
+            return {}
+
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_profiled_request(self):
+        response = self.client.get("/slow", headers={"X-Profile-Token": issue_token(uuid.uuid4(), 60)})
+        profile_id = response.headers["x-profile-id"]
+        self.assertIn("framework=", response.headers["x-profile-summary"])
+        summary = json.loads((Path(self.directory.name) / f"{profile_id}.json").read_text())
+        self.assertGreater(summary["sampled_ms"], 30)
+        stacks = (Path(self.directory.name) / f"{profile_id}.collapsed").read_text()
+        self.assertIn("<locals>.slow;asyncio.tasks:sleep ", stacks)  # the await chain while suspended
+
+    def test_query_token(self):
+        response = self.client.get(f"/slow?profile_token={issue_token(uuid.uuid4(), 60)}")
+        self.assertIn("x-profile-id", response.headers)
+
+    def test_not_profiled(self):
+        self.assertNotIn("x-profile-id", self.client.get("/slow").headers)
+        self.assertNotIn("x-profile-id", self.client.get("/slow", headers={"X-Profile-Token": "forged"}).headers)
+        self.assertEqual(list(Path(self.directory.name).iterdir()), [])
+
+    def test_prune(self):
+        directory = Path(self.directory.name)
+        middleware = ProfilerMiddleware(None, directory=self.directory.name, max_profiles=2, max_age=3600)
+        names = [uuid.uuid4().hex for _ in range(4)] + ["background-20260101T000000-1"]
+        for age, name in enumerate(names):
+            for suffix in (".collapsed", ".json"):
+                path = directory / f"{name}{suffix}"
+                path.write_text("")
+                os.utime(path, (time.time() - age * 60, time.time() - age * 60))
+        middleware.prune()
+        kept = names[:2] + names[4:]  # the background dump is not a request profile
+        self.assertEqual(sorted(path.name for path in directory.iterdir()),
+                         sorted(f"{name}{suffix}" for name in kept for suffix in (".collapsed", ".json")))
+        old = time.time() - 7200
+        os.utime(directory / f"{names[1]}.collapsed", (old, old))
+        middleware.prune()
+        self.assertFalse((directory / f"{names[1]}.json").exists())
+        self.assertTrue((directory / f"{names[0]}.json").exists())
+
+
+class TestBackgroundProfiler(unittest.IsolatedAsyncioTestCase):
+
+    async def test_dump(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = BackgroundProfiler(directory, interval=0.001, dump_interval=60)
+            profiler.start()
+            deadline = time.perf_counter() + 0.02
+            while time.perf_counter() < deadline:
+                await asyncio.sleep(0)
+            await profiler.stop()
+            self.assertEqual(len(list(Path(directory).glob(f"background-*-{os.getpid()}.collapsed"))), 1)
+
+    def test_prune(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = BackgroundProfiler(directory, max_dumps=2, max_age=3600)
+            names = [f"background-2026010{day}T000000-{os.getpid()}" for day in range(1, 5)]
+            names += ["background-20260101T000000-1", "background-20260101T000000-2"]
+            for name in names:
+                for suffix in (".collapsed", ".json"):
+                    (Path(directory) / f"{name}{suffix}").write_text("")
+            old = time.time() - 7200
+            os.utime(Path(directory) / "background-20260101T000000-2.collapsed", (old, old))
+            profiler.prune()
+            self.assertEqual(sorted(path.name for path in Path(directory).iterdir()),
+                             sorted(f"{name}{suffix}" for name in names[2:5] for suffix in (".collapsed", ".json")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import asyncio
+import unittest
+import uuid
+from unittest.mock import AsyncMock, Mock, patch
+
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError
+
+from src.services.rate_limiter import Budget, RateLimiter
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.script = AsyncMock(return_value=[1])
+        self.redis = Mock()
+        self.redis.register_script.return_value = self.script
+        self.limiter = RateLimiter(self.redis, {"read": Budget(3, 60), "write": Budget(1, 60)})
+
+    def test_local_bucket(self):
+        self.assertEqual([self.limiter.hit("read", "u1") for _ in range(3)], [0, 0, 0])
+        self.assertGreater(self.limiter.hit("read", "u1"), 0)
+        self.assertEqual(self.limiter.hit("read", "u2"), 0)
+        self.assertEqual(self.limiter.hit("write", "u1"), 0)
+        self.assertEqual(self.limiter.rejections, {"read": 1, "write": 0})
+        self.script.assert_not_called()
+
+    async def test_sync_batches_counts(self):
+        self.limiter.hit("read", "u1")
+        self.limiter.hit("read", "u1")
+        self.limiter.hit("write", "u2")
+        self.script.return_value = [2, 1]
+        await self.limiter.sync()
+        self.script.assert_awaited_once()
+        keys = self.script.call_args.kwargs["keys"]
+        self.assertEqual(len(keys), 2)
+        self.assertTrue(keys[0].startswith("ratelimit:read:u1:"))
+        self.assertEqual(self.script.call_args.kwargs["args"], [2, 120, 1, 120])
+        self.script.reset_mock()
+        await self.limiter.sync()
+        self.script.assert_not_called()
+
+    async def test_global_total_caps_local_bucket(self):
+        self.limiter.hit("read", "u1")
+        self.script.return_value = [3]  # other workers used the rest of the window
+        await self.limiter.sync()
+        self.assertGreater(self.limiter.hit("read", "u1"), 0)
+
+    async def test_fail_open(self):
+        self.limiter.hit("read", "u1")
+        self.script.side_effect = ConnectionError("down")
+        with patch("builtins.print"):
+            await self.limiter.sync()
+        self.assertEqual(self.limiter.errors, 1)
+        self.assertEqual(self.limiter.hit("read", "u1"), 0)
+        self.script.reset_mock()
+        await self.limiter.sync()
+        self.script.assert_not_called()
+
+    async def test_run_survives_errors(self):
+        self.limiter = RateLimiter(self.redis, {"read": Budget(3, 60)}, sync_interval=1, retry_after=5)
+        self.limiter.sync = AsyncMock(side_effect=[ValueError("bug"), KeyError("bug"), RuntimeError("bug"), None,
+                                                   asyncio.CancelledError()])
+        with patch("asyncio.sleep", new_callable=AsyncMock) as sleep, patch("builtins.print"):
+            with self.assertRaises(asyncio.CancelledError):
+                await self.limiter._run()
+        self.assertEqual(self.limiter.sync.await_count, 5)
+        self.assertEqual(self.limiter.errors, 3)
+        self.assertEqual([call.args[0] for call in sleep.await_args_list], [1, 2, 4, 5, 1])
+
+    async def test_dependency(self):
+        dependency = self.limiter.limit("write")
+        user = Mock(id=uuid.uuid4())
+        await dependency(user)
+        with self.assertRaises(HTTPException) as err:
+            await dependency(user)
+        self.assertEqual(err.exception.status_code, 429)
+        self.assertIn("Retry-After", err.exception.headers)
+
+    def test_unknown_budget(self):
+        with self.assertRaises(ValueError):
+            self.limiter.limit("delete")
+
+
+if __name__ == '__main__':
+    unittest.main()
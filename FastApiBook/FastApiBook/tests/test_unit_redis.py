@@ -0,0 +1,40 @@
+import unittest
+from unittest.mock import Mock, patch
+
+from redis.asyncio import BlockingConnectionPool
+
+from src.database.redis import RedisManager
+from src.services.cache import ContactCache
+from src.services.rate_limiter import Budget, RateLimiter
+from src.services.user_cache import UserCache
+
+
+class TestRedisManager(unittest.IsolatedAsyncioTestCase):
+
+    async def test_open_close(self):
+        manager = RedisManager("localhost", 0, max_connections=5, health_check_interval=10)
+        with patch("builtins.print") as print_mock:
+            client = await manager.open()
+        print_mock.assert_called_once()  # unreachable Redis is reported, not raised
+        self.assertIs(await manager.open(), client)
+        pool = client.connection_pool
+        self.assertIsInstance(pool, BlockingConnectionPool)
+        self.assertEqual(pool.max_connections, 5)
+        self.assertEqual(pool.connection_kwargs["health_check_interval"], 10)
+        await manager.close()
+        self.assertIsNone(manager.client)
+
+    def test_consumers_share_client(self):
+        redis = Mock()
+        consumers = (ContactCache(None, ttl=60), UserCache(None, ttl=60), RateLimiter(None, {"read": Budget(1, 1)}))
+        for consumer in consumers:
+            consumer.bind(redis)
+            self.assertIs(consumer.redis, redis)
+        self.assertTrue(consumers[0].enabled)
+        redis.register_script.assert_called_once()
+        consumers[0].bind(None)
+        self.assertFalse(consumers[0].enabled)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import datetime
 import unittest
 from unittest.mock import MagicMock, AsyncMock
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -5,12 +6,16 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from src.models.models import Contact, User
 from src.repository.address_book import (
     create_contact,
+    bulk_create_contacts,
     get_contacts,
     get_contact,
+    search_contacts,
+    get_upcoming_birthdays,
+    _upcoming_birthdays,
     update_contact,
     delete_contact
 )
-from src.schemas.contact import ContactSchema
+from src.schemas.contact import ContactSchema, ContactUpdateSchema
 
 
 class TestAddressBook(unittest.IsolatedAsyncioTestCase):
@@ -49,6 +54,27 @@ class TestAddressBook(unittest.IsolatedAsyncioTestCase):
         self.session.add.assert_called_once_with(result)
         self.session.commit.assert_called_once()
 
+    async def test_bulk_create_contacts(self):
+        body = ContactSchema(
+            name="Test",
+            surname="User",
+            email="aaaaa@aaa.com",
+            number="1234567890",
+            birthday="1990-12-25",
+            description="test"
+        )
+        self.session.get_bind.return_value.dialect.name = "sqlite"
+        result = await bulk_create_contacts([body, body], self.session, self.user)
+        self.assertEqual(result, 2)
+        stmt = self.session.execute.call_args.args[0]
+        self.assertIn("INSERT INTO contacts", str(stmt))
+        self.assertEqual(stmt.compile().params["birthday_key_m1"], 1225)
+        self.session.commit.assert_called_once()
+
+        self.session.reset_mock()
+        self.assertEqual(await bulk_create_contacts([], self.session, self.user), 0)
+        self.session.execute.assert_not_called()
+
     async def test_get_contacts(self):
         birthdays = False
         contacts = [
@@ -85,6 +111,79 @@ class TestAddressBook(unittest.IsolatedAsyncioTestCase):
         result = await get_contacts(None, None, None, birthdays, 10, 0, self.session, self.user)
         self.assertEqual(result, contacts)
 
+    async def test_get_contacts_columns(self):
+        rows = [(1, "Test1", "User1", "aaaaa1@aaa.com", "12345678", datetime.date(1990, 1, 1), "test1")]
+        mocked_rows = MagicMock()
+        mocked_rows.all.return_value = rows
+        self.session.execute.return_value = mocked_rows
+        columns = ("id", "name", "surname", "email", "number", "birthday", "description")
+        result = await get_contacts(None, None, None, False, 10, 0, self.session, self.user, columns=columns,
+                                    load_user=True)
+        self.assertEqual(result, rows)
+        stmt = self.session.execute.call_args.args[0]
+        self.assertEqual([column.name for column in stmt.selected_columns], list(columns))
+        self.assertNotIn("JOIN", str(stmt))
+
+    async def test_get_contacts_after_cursor(self):
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = []
+        self.session.execute.return_value = mocked_contacts
+        await get_contacts(None, None, None, False, 10, 30, self.session, self.user, sort="surname",
+                           after=("User", 7))
+        stmt = self.session.execute.call_args.args[0]
+        sql = str(stmt.compile(compile_kwargs={"literal_binds": False}))
+        self.assertIn("(contacts.surname, contacts.id) >", sql)
+        self.assertIn("ORDER BY contacts.surname, contacts.id", sql)
+        self.assertNotIn("OFFSET", sql)
+
+    async def test_search_contacts(self):
+        contacts = [
+            Contact(id=1, name="Test1", surname="User1", email="aaaaa1@aaa.com", number="12345678",
+                    birthday="1990-01-01", description="test1", user=self.user),
+        ]
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = contacts
+        self.session.execute.return_value = mocked_contacts
+
+        # Other backends fall back to a plain LIKE
+        self.session.get_bind.return_value.dialect.name = "sqlite"
+        result = await search_contacts("50%_off", 10, self.session, self.user)
+        self.assertEqual(result, contacts)
+        stmt = self.session.execute.call_args.args[0]
+        self.assertEqual(stmt.compile().params["name_1"], "%50\\%\\_off%")
+        self.assertNotIn("similarity", str(stmt))
+
+        # PostgreSQL ranks by trigram similarity
+        self.session.get_bind.return_value.dialect.name = "postgresql"
+        await search_contacts("Tset", 10, self.session, self.user)
+        stmt = self.session.execute.call_args.args[0]
+        self.assertIn("similarity", str(stmt))
+
+    async def test_get_upcoming_birthdays(self):
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = []
+        self.session.execute.return_value = mocked_contacts
+        result = await get_upcoming_birthdays(30, 10, self.session, self.user)
+        self.assertEqual(result, [])
+        sql = str(self.session.execute.call_args.args[0])
+        self.assertIn("contacts.birthday_key", sql)
+        self.assertNotIn("to_char", sql)
+
+    def test_upcoming_birthdays_window(self):
+        # Same year: one range
+        clause, _ = _upcoming_birthdays(7, datetime.date(2024, 3, 1))
+        self.assertEqual(clause.compile().params, {"birthday_key_1": 301, "birthday_key_2": 308})
+
+        # Crossing New Year: two ranges
+        clause, _ = _upcoming_birthdays(10, datetime.date(2024, 12, 25))
+        params = clause.compile().params
+        self.assertIn(" OR ", str(clause))
+        self.assertEqual(sorted(params.values()), [104, 1225])
+
+        # A full year: no filter at all
+        clause, _ = _upcoming_birthdays(366, datetime.date(2024, 12, 25))
+        self.assertEqual(str(clause), "true")
+
     async def test_get_contact(self):
         body = ContactSchema(
             name="Test1",
@@ -111,12 +210,17 @@ class TestAddressBook(unittest.IsolatedAsyncioTestCase):
         )
         mocked_contact = MagicMock()
         mocked_contact.scalar_one_or_none.return_value = Contact(
-            id=1, name="Test", surname="User", email="aaaaa@aaa.com",
-            number="1234567890", birthday="1990-01-01", description="test", user=self.user
+            id=1, **body.model_dump(), user=self.user
         )
         self.session.execute.return_value = mocked_contact
         result = await update_contact(1, body, self.session, self.user)
-        self.session.execute.return_value = mocked_contact
+        stmt = self.session.execute.call_args.args[0]
+        self.assertIn("UPDATE contacts SET", str(stmt))
+        self.assertIn("RETURNING", str(stmt))
+        self.assertEqual(stmt.compile().params["birthday_key"], 101)
+        self.session.execute.assert_called_once()
+        self.session.commit.assert_called_once()
+        self.session.refresh.assert_not_called()
         self.assertEqual(result.name, body.name)
         self.assertEqual(result.surname, body.surname)
         self.assertEqual(result.email, body.email)
@@ -125,6 +229,17 @@ class TestAddressBook(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.description, body.description)
         self.assertEqual(result.user, self.user)
 
+    async def test_patch_contact(self):
+        mocked_contact = MagicMock()
+        mocked_contact.scalar_one_or_none.return_value = None
+        self.session.execute.return_value = mocked_contact
+        result = await update_contact(1, ContactUpdateSchema(number="0987654321"), self.session, self.user)
+        self.assertIsNone(result)
+        params = self.session.execute.call_args.args[0].compile().params
+        self.assertEqual(params["number"], "0987654321")
+        self.assertNotIn("name", params)
+        self.assertNotIn("birthday_key", params)
+
     async def test_delete_contact(self):
         mocked_contact = MagicMock()
         mocked_contact.scalar_one_or_none.return_value = Contact(
@@ -133,7 +248,9 @@ class TestAddressBook(unittest.IsolatedAsyncioTestCase):
         )
         self.session.execute.return_value = mocked_contact
         result = await delete_contact(1, self.session, self.user)
-        self.session.delete.assert_called_once()
+        delete, tombstone = self.session.execute.call_args_list
+        self.assertIn("DELETE FROM contacts", str(delete.args[0]))
+        self.assertIn("INSERT INTO contact_tombstones", str(tombstone.args[0]))
         self.session.commit.assert_called_once()
         self.assertIsInstance(result, Contact)
         self.assertEqual(result.user, self.user)
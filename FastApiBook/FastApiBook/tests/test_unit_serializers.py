@@ -0,0 +1,54 @@
+import datetime
+import json
+import unittest
+
+from fastapi import HTTPException
+from pydantic import TypeAdapter
+
+from src.schemas.contact import ContactResponse
+from src.services.serializers import CONTACT_COLUMNS, dump_row, dump_rows, json_response, parse_fields, with_columns
+
+
+class TestSerializers(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [(number, "Test", "User", f"user{number}@aaa.com", "1234567890", datetime.date(1990, 1, 2), "test")
+                     for number in range(1, 4)]
+
+    def test_columns_follow_schema(self):
+        self.assertEqual(CONTACT_COLUMNS, tuple(ContactResponse.model_fields))
+
+    def test_same_document_as_response_model(self):
+        models = [ContactResponse(**dict(zip(CONTACT_COLUMNS, row))) for row in self.rows]
+        expected = TypeAdapter(list[ContactResponse]).dump_json(models)
+        self.assertEqual(json.loads(dump_rows(self.rows)), json.loads(expected))
+        self.assertEqual(json.loads(dump_rows(self.rows))[0]["birthday"], "1990-01-02")
+
+    def test_empty(self):
+        self.assertEqual(dump_rows([]), b"[]")
+
+    def test_parse_fields(self):
+        self.assertEqual(parse_fields(None), CONTACT_COLUMNS)
+        self.assertEqual(parse_fields(" number,name ,id,name"), ("id", "name", "number"))
+        for fields in ("id,password", " , "):
+            with self.assertRaises(HTTPException) as error:
+                parse_fields(fields)
+            self.assertEqual(error.exception.status_code, 400)
+
+    def test_sparse_rows(self):
+        columns = with_columns(("name", "number"), ("surname", "id"))
+        self.assertEqual(columns, ("name", "number", "surname", "id"))
+        rows = [("Test", "1234567890", "User", 1)]
+        self.assertEqual(json.loads(dump_rows(rows, ("name", "number"))), [{"name": "Test", "number": "1234567890"}])
+        self.assertEqual(json.loads(dump_row((1, datetime.date(1990, 1, 2)), ("id", "birthday"))),
+                         {"id": 1, "birthday": "1990-01-02"})
+
+    def test_json_response(self):
+        response = json_response(b"[]", {"X-Next-Cursor": "abc"})
+        self.assertEqual(response.body, b"[]")
+        self.assertEqual(response.media_type, "application/json")
+        self.assertEqual(response.headers["x-next-cursor"], "abc")
+
+
+if __name__ == '__main__':
+    unittest.main()
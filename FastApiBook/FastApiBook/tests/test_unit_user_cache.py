@@ -0,0 +1,103 @@
+import json
+import unittest
+import uuid
+from datetime import datetime
+from unittest.mock import AsyncMock, Mock
+
+from fastapi_users import exceptions
+from fastapi_users.jwt import generate_jwt
+from redis.exceptions import ConnectionError
+from sqlalchemy import inspect
+
+from src.models.models import User
+from src.services.auth import CachedJWTStrategy
+from src.services.user_cache import UserCache, dump_user, load_user
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.user = User(id=uuid.uuid4(), email="test@test.io", username="test_user", avatar="test_avatar",
+                         refresh_token=None, hashed_password="secret-hash", is_active=True, is_superuser=False,
+                         is_verified=True, created_at=datetime(2024, 1, 1, 12), updated_at=datetime(2024, 1, 2, 12))
+        self.redis = AsyncMock()
+        self.redis.get.return_value = None
+        self.cache = UserCache(self.redis, ttl=60)
+
+    def test_round_trip(self):
+        data = dump_user(self.user)
+        self.assertNotIn("hashed_password", json.loads(data))
+        user = load_user(data)
+        self.assertEqual(user.id, self.user.id)
+        self.assertEqual(user.updated_at, self.user.updated_at)
+        self.assertTrue(inspect(user).detached)
+
+    async def test_local_then_redis(self):
+        self.assertIsNone(await self.cache.get(self.user.id))
+        await self.cache.set(self.user)
+        self.redis.set.assert_awaited_once()
+        self.redis.get.reset_mock()
+
+        user = await self.cache.get(self.user.id)
+        self.assertEqual(user.email, self.user.email)
+        self.redis.get.assert_not_awaited()
+
+        self.cache._local.clear()
+        self.redis.get.return_value = self.redis.set.call_args.args[1]
+        user = await self.cache.get(self.user.id)
+        self.assertEqual(user.username, self.user.username)
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+
+    async def test_invalidate(self):
+        await self.cache.set(self.user)
+        await self.cache.invalidate(self.user.id)
+        self.redis.delete.assert_awaited_once_with(f"user:{self.user.id}")
+        self.assertIsNone(await self.cache.get(self.user.id))
+
+    async def test_local_size(self):
+        cache = UserCache(None, ttl=60, local_size=1)
+        other = User(**{**{f: getattr(self.user, f) for f in ("email", "username", "avatar", "refresh_token",
+                                                              "is_active", "is_superuser", "is_verified",
+                                                              "created_at", "updated_at")}, "id": uuid.uuid4()})
+        await cache.set(self.user)
+        await cache.set(other)
+        self.assertIsNone(await cache.get(self.user.id))
+        self.assertIsNotNone(await cache.get(other.id))
+
+    async def test_fail_open(self):
+        self.redis.get.side_effect = ConnectionError("down")
+        self.assertIsNone(await self.cache.get(self.user.id))
+        self.assertEqual(self.cache.errors, 1)
+
+
+class TestCachedJWTStrategy(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.user = User(id=uuid.uuid4(), email="test@test.io", username="test_user", avatar=None,
+                         refresh_token=None, is_active=True, is_superuser=False, is_verified=True,
+                         created_at=None, updated_at=None)
+        self.cache = UserCache(None, ttl=60)
+        self.strategy = CachedJWTStrategy(self.cache, secret="secret", lifetime_seconds=60)
+        self.user_manager = AsyncMock()
+        self.user_manager.parse_id = uuid.UUID
+        self.user_manager.get.return_value = self.user
+
+    async def test_read_token(self):
+        token = await self.strategy.write_token(self.user)
+        user = await self.strategy.read_token(token, self.user_manager)
+        self.assertIs(user, self.user)
+        user = await self.strategy.read_token(token, self.user_manager)
+        self.assertEqual(user.id, self.user.id)
+        self.user_manager.get.assert_awaited_once()
+
+    async def test_invalid_tokens(self):
+        self.assertIsNone(await self.strategy.read_token(None, self.user_manager))
+        self.assertIsNone(await self.strategy.read_token("garbage", self.user_manager))
+        token = generate_jwt({"sub": "not-a-uuid", "aud": ["fastapi-users:auth"]}, "secret", 60)
+        self.user_manager.parse_id = Mock(side_effect=exceptions.InvalidID())
+        self.assertIsNone(await self.strategy.read_token(token, self.user_manager))
+
+    async def test_unknown_user(self):
+        token = await self.strategy.write_token(self.user)
+        self.user_manager.get.side_effect = exceptions.UserNotExists()
+        self.assertIsNone(await self.strategy.read_token(token, self.user_manager))
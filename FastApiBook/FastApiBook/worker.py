@@ -0,0 +1,74 @@
+"""
+Runs the background jobs queued by the API, e.g. verification and password reset emails.
+
+    python worker.py
+
+Every worker holds a unique name in Redis, ``JOBS_WORKER_NAME`` or the first free ``<hostname>-<n>``,
+and refuses to start if an explicit name is taken. A starting worker requeues the jobs left unfinished
+by workers that stopped holding their name. SIGINT and SIGTERM stop taking jobs and wait for the
+running ones.
+
+Workers also prune the contact tombstones older than ``CONTACTS_TOMBSTONE_TTL``, every
+``CONTACTS_TOMBSTONE_PRUNE_INTERVAL`` seconds.
+"""
+import asyncio
+import signal
+
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.database.redis import RedisManager
+from src.repository import address_book as repo_book
+from src.services import email  # noqa: F401, registers the email jobs
+from src.services.jobs import Worker, job_queue
+from src.services.mailer import mailer
+
+
+async def prune_tombstones():
+    while True:
+        pruned = 0
+        async with sessionmanager.session() as db:
+            pruned = await repo_book.prune_tombstones(config.CONTACTS_TOMBSTONE_TTL, db)
+        if pruned:
+            print(f"Pruned {pruned} contact tombstones")
+        await asyncio.sleep(config.CONTACTS_TOMBSTONE_PRUNE_INTERVAL)
+
+
+async def main():
+    # Blocking pops wait up to JOBS_POLL_TIMEOUT for a reply, longer than the API socket timeout
+    redis_manager = RedisManager(
+        host=config.REDIS_DOMAIN,
+        port=config.REDIS_PORT,
+        password=config.REDIS_PASSWORD,
+        max_connections=config.JOBS_CONCURRENCY + 2,
+        pool_timeout=config.REDIS_POOL_TIMEOUT,
+        socket_timeout=config.JOBS_POLL_TIMEOUT + config.REDIS_SOCKET_TIMEOUT,
+        connect_timeout=config.REDIS_CONNECT_TIMEOUT,
+        health_check_interval=config.REDIS_HEALTH_CHECK_INTERVAL,
+    )
+    try:
+        await job_queue.claim_worker(await redis_manager.open(), config.JOBS_WORKER_LEASE,
+                                     config.JOBS_WORKER_NAME or None)
+    except RuntimeError:
+        await redis_manager.close()
+        raise
+    mailer.renderer.compile()
+    worker = Worker(job_queue, concurrency=config.JOBS_CONCURRENCY, poll_timeout=config.JOBS_POLL_TIMEOUT,
+                    lease=config.JOBS_WORKER_LEASE)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    print(f"Worker {job_queue.worker} running {len(job_queue.tasks)} job types")
+    pruner = asyncio.create_task(prune_tombstones())
+    try:
+        await worker.run()
+    finally:
+        pruner.cancel()
+        await mailer.close()
+        job_queue.bind(None)
+        await redis_manager.close()
+        await sessionmanager.dispose()
+    print(f"Worker stopped: {worker.processed} processed, {worker.failed} failed, {worker.dead} dead-lettered")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())